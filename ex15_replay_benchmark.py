@@ -0,0 +1,85 @@
+"""
+録画した対戦を再生して、Botの画面認識の精度と処理時間を計測するスクリプト
+キャプチャデバイスとSwitchを接続せずに実行できる
+
+    # 各フレームの場面判定の精度と処理時間を計測 (最高速度で再生)
+    python ex15_replay_benchmark.py recognition <動画ファイル or 連番画像のディレクトリ> [正解ラベル.json]
+
+    # 録画を実時間で再生しながらmain_loop()を実行し、場面ごとの処理時間を計測
+    python ex15_replay_benchmark.py loop <動画ファイル or 連番画像のディレクトリ> [対NPC戦なら1]
+
+正解ラベルは {フレーム番号 or 画像のファイル名: 場面} 形式のJSONファイル。
+場面は 'battle', 'change', 'selection', 'standby' のいずれかで、該当しなければnull。
+"""
+
+from pokepy.pokebot import *
+from pokepy.controller import FakeController
+from pokepy.capture import ImageSequenceSource
+import sys
+
+
+def recognition_benchmark(bot: Pokebot, labels: dict):
+    source = bot.frame_source
+    times, results = {}, {}
+
+    while (img := source.read()) is not None:
+        bot.img = img
+        t0 = time.time()
+        phase = bot.read_phase(capture=False)
+        dt = time.time() - t0
+
+        times.setdefault(phase or 'message', []).append(dt)
+
+        # 正解ラベルとの比較
+        keys = [str(source.index)]
+        if isinstance(source, ImageSequenceSource):
+            keys.append(os.path.basename(source.filenames[source.index]))
+        for key in keys:
+            if key in labels:
+                label = labels[key] or 'message'
+                results.setdefault(label, []).append(label == (phase or 'message'))
+                break
+
+    print('場面\tフレーム数\t平均 [ms]\t95% [ms]')
+    for phase, ts in times.items():
+        print(f'{phase}\t{len(ts)}\t{1e3*np.mean(ts):.2f}\t{1e3*np.percentile(ts, 95):.2f}')
+
+    if results:
+        print('\n場面\t正解数/ラベル数\t正解率')
+        for label, rs in results.items():
+            print(f'{label}\t{sum(rs)}/{len(rs)}\t{sum(rs)/len(rs):.3f}')
+        n = sum(len(rs) for rs in results.values())
+        print(f'全体\t{sum(sum(rs) for rs in results.values())}/{n}')
+
+
+def loop_benchmark(bot: Pokebot, vs_NPC: bool):
+    bot.main_loop(vs_NPC=vs_NPC)
+
+    print('場面\t回数\t平均 [s]\t中央値 [s]\t95% [s]\t最大 [s]')
+    for phase, stat in bot.phase_time_summary().items():
+        print(f"{phase}\t{stat['n']}\t{stat['mean']:.3f}\t{stat['p50']:.3f}\t{stat['p95']:.3f}\t{stat['max']:.3f}")
+
+    controller = bot.controller
+    print(f'\nボタン入力 {controller.n_presses}回, マクロ送信 {controller.n_macros}回')
+
+
+mode, source = sys.argv[1], sys.argv[2]
+
+# ライブラリの初期化
+Pokemon.init(season=None)
+
+# 録画を再生し、入力は記録のみ行う
+Pokebot.controller = FakeController(speed=(1 if mode == 'loop' else 0))
+Pokebot.set_frame_source(source, realtime=(mode == 'loop'))
+
+bot = Pokebot()
+
+if mode == 'recognition':
+    labels = {}
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], encoding='utf-8') as fin:
+            labels = json.load(fin)
+    recognition_benchmark(bot, labels)
+
+elif mode == 'loop':
+    loop_benchmark(bot, vs_NPC=(len(sys.argv) > 3 and sys.argv[3] == '1'))
@@ -0,0 +1,46 @@
+"""
+対戦シミュレーションのリプレイを一括で生成・検証するスクリプト
+シミュレータを変更した後に、変更前に生成したリプレイを検証すると、挙動が変わった対戦を検出できる
+
+    # ランダムな3on3の対戦を1000試合シミュレーションし、リプレイを保存
+    python ex16_bulk_replay.py generate log/replay 1000
+
+    # ディレクトリ内のリプレイを並列に再現し、記録されたチェックサムと比較
+    python ex16_bulk_replay.py verify log/replay
+"""
+
+from pokepy.replay import *
+import sys
+
+
+mode, directory = sys.argv[1], sys.argv[2]
+season = None
+
+if mode == 'generate':
+    Pokemon.init(season=season)
+    os.makedirs(directory, exist_ok=True)
+    n = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    for i in range(n):
+        battle = Battle(seed=i)
+        for player in range(2):
+            for name in random.sample(list(Pokemon.home.keys()), 3):
+                battle.selected[player].append(Pokemon(name))
+        checksums = play(battle)
+        save_replay(f'{directory}/{i:06d}.pkr', battle, checksums)
+
+    print(f'{n}試合のリプレイを {directory} に保存しました')
+
+elif mode == 'verify':
+    t0 = time.time()
+    results = verify_replays(directory, season=season)
+
+    n_turns = sum(r['turns'] for r in results)
+    failed = [r for r in results if r['diverged'] is not None or r['error']]
+    for r in failed:
+        if r['error']:
+            print(f"{r['file']}\tエラー {r['error']}")
+        else:
+            print(f"{r['file']}\tターン{r['diverged']}で不一致")
+
+    print(f'{len(results)}試合 {n_turns}ターンを {time.time()-t0:.1f}秒で検証 不一致 {len(failed)}試合')
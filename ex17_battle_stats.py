@@ -0,0 +1,31 @@
+"""
+Botの対戦ログを集計し、勝率を表示するスクリプト
+集計結果は log/analytics に保存され、次回以降は新しいログのみを読み込む
+
+    python ex17_battle_stats.py [ログのディレクトリ]
+"""
+
+from pokepy.analytics import BattleDataset
+import sys
+import time
+
+
+directory = sys.argv[1] if len(sys.argv) > 1 else 'log/battle'
+
+t0 = time.time()
+dataset = BattleDataset.load('log/analytics')
+n = dataset.ingest(directory)
+dataset.save('log/analytics')
+print(f'{n}試合を読み込みました ({time.time()-t0:.1f}秒) 合計 {len(dataset)}試合\n')
+
+print('相手のポケモン\t試合数\t勝率')
+for name, n, rate in dataset.win_rate_by_species(player=1, min_games=5)[:30]:
+    print(f'{name}\t{n}\t{rate:.3f}')
+
+print('\n先発\t試合数\t勝率')
+for name, n, rate in dataset.win_rate_by_lead(player=0):
+    print(f'{name}\t{n}\t{rate:.3f}')
+
+print('\nターン数\t試合数\t勝率')
+for label, n, rate in dataset.win_rate_by_turns():
+    print(f'{label}\t{n}\t{rate:.3f}')
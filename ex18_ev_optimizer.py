@@ -0,0 +1,37 @@
+from pokepy.evopt import *
+import time
+
+# ライブラリの初期化
+Pokemon.init()
+
+# 仮想敵
+p1 = Pokemon('カイリュー', use_template=False)
+p1.nature = 'いじっぱり'
+p1.effort = [0, 252, 0, 0, 0, 252]
+
+p2 = Pokemon('ハバタクカミ', use_template=False)
+p2.nature = 'ひかえめ'
+p2.effort = [0, 0, 0, 252, 0, 252]
+
+p3 = Pokemon('サーフゴー', use_template=False)
+p3.nature = 'ひかえめ'
+p3.effort = [252, 0, 0, 0, 0, 0]
+
+# 調整の目標
+benchmarks = [
+    Survive(p1, 'ドラゴンクロー', prob=0.5),    # カイリューのドラゴンクローを50%以上で耐える
+    Survive(p2, 'ムーンフォース', prob=1.0),    # ハバタクカミのムーンフォースを確定で耐える
+    Outspeed(p1),                               # 最速カイリューより速い
+    KO(p3, 'じしん', prob=0.5),                 # H252サーフゴーをじしんで50%以上で倒す
+    #Outspeed(p1, rank=1, target_rank=1),       # 素早さランク+1同士で速い
+    #Survive(p1, 'しんそく', hits=2),           # 2回耐える
+]
+print(benchmarks)
+
+# 努力値の探索
+t0 = time.time()
+results = optimize_effort('ガブリアス', benchmarks, natures=['いじっぱり', 'ようき'], items=['', 'とつげきチョッキ'])
+print(f'{len(results)}件 ({time.time()-t0:.1f}秒)')
+
+for r in results[:20]:
+    print(r['nature'], r['item'], r['effort'], r['total'])
@@ -0,0 +1,24 @@
+from pokepy.threat import *
+import time
+
+
+if __name__ == '__main__':
+    # ライブラリの初期化
+    Pokemon.init()
+
+    # パーティ
+    party = [Pokemon(name) for name in ['カイリュー', 'ハバタクカミ', 'サーフゴー', 'ガチグマ', 'ディンルー', 'ミミッキュ']]
+
+    # 使用率上位30匹との対面の評価表 (2回目以降は log/cache から読み込む)
+    t0 = time.time()
+    matrix = ThreatMatrix.get(party, top_n=30, n_sets=8)
+    print(f'{time.time()-t0:.1f}秒')
+
+    for i, name in enumerate(matrix.party):
+        print(f'\n{name} の脅威\t確1にされる確率\t相手が速い割合')
+        for opponent, p, faster in matrix.threats(i, n=5):
+            print(f'{opponent}\t{p:.2f}\t{faster:.2f}')
+
+    print('\n相手\t処理できる\t処理される')
+    for row in matrix.summary():
+        print(f"{row['name']}\t{row['answers']}\t{row['checked_by']}")
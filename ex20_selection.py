@@ -0,0 +1,22 @@
+from pokepy.selection import *
+
+
+if __name__ == '__main__':
+    # ライブラリの初期化
+    Pokemon.init()
+
+    # 自分のパーティ
+    party = [Pokemon(name) for name in ['カイリュー', 'ハバタクカミ', 'サーフゴー', 'ガチグマ', 'ディンルー', 'ミミッキュ']]
+
+    # 相手のパーティ (選出画面で読み取った状態。型は使用率に従って抽選される)
+    enemy_party = [Pokemon(name, use_template=False) for name in ['セグレイブ', 'ドドゲザン', 'ウルガモス', 'ガブリアス', 'アシレーヌ', 'コノヨザル']]
+
+    # ワーカープロセスを起動してから評価する
+    engine = SelectionEngine(max_turn=20)
+    engine.start()
+    results = engine.recommend(party, enemy_party, time_budget=60)
+    engine.shutdown()
+
+    print('選出 (先頭が先発)\t勝率\t95%信頼区間\t試行回数')
+    for r in results[:10]:
+        print(f"{r['names']}\t{r['win_rate']:.2f}\t{r['ci'][0]:.2f}~{r['ci'][1]:.2f}\t{r['n']}")
@@ -0,0 +1,28 @@
+from pokepy.sharedtables import *
+import time
+
+
+def worker_status(_):
+    # ワーカープロセスでは共有テーブルと、それから作成したStatTableを参照できる
+    tables = SharedTables.get()
+    return os.getpid(), tables.season, StatTable.get().status('カイリュー', 'いじっぱり', [4, 252, 0, 0, 0, 252])
+
+
+if __name__ == '__main__':
+    # ライブラリの初期化
+    Pokemon.init()
+
+    # 静的データの表を書き出して開く (2回目以降は保存されたファイルを開くだけ)
+    tables = SharedTables.get()
+    print(tables.manifest)
+    for key, array in tables.arrays.items():
+        print(f'{key}\t{array.dtype}\t{array.shape}')
+
+    print(tables.array('species.base')[tables.id('species', 'カイリュー')])
+    print(tables.stat_table_file)
+
+    # 静的データを引き継ぐワーカープロセスのプール (データファイルを読み込まずに起動する)
+    t0 = time.time()
+    with worker_pool(max_workers=4) as pool:
+        print(list(pool.map(worker_status, range(4))))
+    print(f'{time.time() - t0:.2f}s')
@@ -0,0 +1,232 @@
+from pokepy.recorder import iter_battle_log
+from array import array
+import glob
+import json
+import numpy as np
+import os
+
+
+class Vocabulary:
+    """文字列とIDの対応表"""
+
+    def __init__(self, strings: list[str]=None):
+        self.strings = []
+        self.ids = {}
+        for s in strings or []:
+            self.id(s)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def id(self, s: str) -> int:
+        """{s}のIDを返す。未登録なら登録する"""
+        if s is None:
+            s = ''
+        if (i := self.ids.get(s)) is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+
+class BattleDataset:
+    """Botの対戦ログ (log/battle/*.log) を列指向のデータとして集計するクラス
+
+    ログは1行ずつ読み込み、試合ごとに集計した値だけを列に追加する。
+    読み込み済みのファイルはサイズと更新時刻で管理し、ingest()では新しいログのみを読み込む。
+    文字列の項目 (ポケモン、アイテム、技など) はIDに置き換えて格納する。
+
+    games       試合ごと      file, result (1: 勝ち, 0: 負け, -1: 不明), n_turns, vs_NPC, valid
+    pokemon     ポケモンごと   game, player, species, item, Ttype, selected (選出順 or -1), lead
+    moves       技ごと        game, player, species, move
+    turns       ターンごと     game, turn, command0, command1, active0, active1, hp0, hp1 (場のポケモンのHP割合)
+    """
+
+    TABLES = {
+        'games': {'file': 'i', 'result': 'b', 'n_turns': 'i', 'vs_NPC': 'b', 'valid': 'b'},
+        'pokemon': {'game': 'i', 'player': 'b', 'species': 'i', 'item': 'i', 'Ttype': 'i', 'selected': 'b', 'lead': 'b'},
+        'moves': {'game': 'i', 'player': 'b', 'species': 'i', 'move': 'i'},
+        'turns': {'game': 'i', 'turn': 'i', 'command0': 'b', 'command1': 'b',
+                  'active0': 'i', 'active1': 'i', 'hp0': 'f', 'hp1': 'f'},
+    }
+
+    def __init__(self):
+        self.vocab = Vocabulary([''])
+        self.files = {}     # {ファイル名: [game, サイズ, 更新時刻]}
+        self.columns = {table: {col: array(t) for col, t in cols.items()}
+                        for table, cols in self.TABLES.items()}
+
+    def __len__(self):
+        return len(self.columns['games']['file'])
+
+    def column(self, table: str, col: str) -> np.ndarray:
+        """{table}の列{col}をnumpy配列として返す"""
+        return np.frombuffer(self.columns[table][col], dtype=self.columns[table][col].typecode) \
+            if len(self.columns[table][col]) else np.zeros(0, dtype=self.columns[table][col].typecode)
+
+    def append(self, table: str, **values) -> None:
+        for col, v in values.items():
+            self.columns[table][col].append(v)
+
+    def lengths(self) -> dict:
+        """テーブルごとの行数"""
+        return {table: len(next(iter(cols.values()))) for table, cols in self.columns.items()}
+
+    def truncate(self, lengths: dict) -> None:
+        """各テーブルを{lengths}の行数に切り詰める"""
+        for table, cols in self.columns.items():
+            for arr in cols.values():
+                del arr[lengths[table]:]
+
+    def ingest(self, directory: str='log/battle', pattern: str='*.log') -> int:
+        """{directory}内の新しいログ、または前回から更新されたログを読み込む。読み込んだ試合数を返す"""
+        n = 0
+        for filename in sorted(glob.glob(os.path.join(directory, pattern))):
+            stat = os.stat(filename)
+            if (entry := self.files.get(filename)) is not None:
+                if entry[1:] == [stat.st_size, stat.st_mtime]:
+                    continue
+                # 更新されたログは前回の集計を無効にして読み直す
+                self.columns['games']['valid'][entry[0]] = 0
+            lengths = self.lengths()
+            try:
+                game = self.ingest_file(filename)
+            except (json.JSONDecodeError, OSError, KeyError, ValueError, IndexError, TypeError) as e:
+                # 読み込みの途中で追加した行を取り消し、次のファイルの試合と混ざらないようにする
+                self.truncate(lengths)
+                print(f'{filename} を読み込めません {e}')
+                continue
+            self.files[filename] = [game, stat.st_size, stat.st_mtime]
+            n += 1
+        return n
+
+    def ingest_file(self, filename: str) -> int:
+        """ログを1行ずつ読み込んで集計し、試合のIDを返す"""
+        game = len(self)
+        party = [{}, {}]
+        header, result = {}, None
+        first_state = None
+        n_turns = 0
+
+        for kind, data in iter_battle_log(filename):
+            match kind:
+                case 'header':
+                    header = data
+                case 'party':
+                    party[data[0]] = data[1]
+                case 'result':
+                    result = data
+                case 'state':
+                    if first_state is None:
+                        first_state = data
+                    self.append_turn(game, n_turns, data)
+                    n_turns += 1
+
+        # 選出と先発
+        selected, leads = [[], []], [None, None]
+        if first_state is not None:
+            for player in range(2):
+                selected[player] = [p.get('_Pokemon__name', '') for p in first_state['selected'][player]]
+                index = first_state.get('index', [0, 0])[player]
+                if 0 <= index < len(selected[player]):
+                    leads[player] = selected[player][index]
+
+        for player in range(2):
+            # パーティの記録がなければ (対NPC戦の相手など) 選出したポケモンを集計する
+            members = [(p.get('name', ''), p.get('item', ''), p.get('Ttype', ''), p.get('moves', []))
+                       for p in party[player].values()]
+            if not members and first_state is not None:
+                members = [(p.get('_Pokemon__name', ''), p.get('item', ''), p.get('Ttype', ''), p.get('_Pokemon__moves', []))
+                           for p in first_state['selected'][player]]
+
+            for name, item, Ttype, moves in members:
+                species = self.vocab.id(name)
+                self.append('pokemon', game=game, player=player, species=species,
+                            item=self.vocab.id(item), Ttype=self.vocab.id(Ttype),
+                            selected=(selected[player].index(name) if name in selected[player] else -1),
+                            lead=int(name == leads[player]))
+                for move in moves:
+                    if move:
+                        self.append('moves', game=game, player=player, species=species, move=self.vocab.id(move))
+
+        self.append('games', file=self.vocab.id(filename), result={'win': 1, 'lose': 0}.get(result, -1),
+                    n_turns=n_turns, vs_NPC=int(bool(header.get('vs_NPC', not party[1]))), valid=1)
+        return game
+
+    def append_turn(self, game: int, turn: int, state: dict) -> None:
+        """ターンの盤面を集計する"""
+        active, hp = [0, 0], [0., 0.]
+        for player in range(2):
+            index, selected = state['index'][player], state['selected'][player]
+            # 負の番号は末尾から数えてしまうため、範囲外と同様に不正なログとして扱う
+            if type(index) != int or not 0 <= index < len(selected) or type(selected[index]) != dict:
+                raise ValueError(f'ターン{turn}の場のポケモンが不正です: index={index}')
+            p = selected[index]
+            active[player] = self.vocab.id(p.get('_Pokemon__name', ''))
+            hp[player] = p.get('_Pokemon__hp_ratio', 0.)
+        command = [-1 if c is None else c for c in state.get('command', [None, None])]
+        self.append('turns', game=game, turn=turn, command0=command[0], command1=command[1],
+                    active0=active[0], active1=active[1], hp0=hp[0], hp1=hp[1])
+
+    def save(self, directory: str='log/analytics') -> None:
+        """集計結果を保存する"""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {f'{table}.{col}': self.column(table, col)
+                  for table, cols in self.columns.items() for col in cols}
+        np.savez(os.path.join(directory, 'columns.npz'), **arrays)
+        with open(os.path.join(directory, 'index.json'), 'w', encoding='utf-8') as fout:
+            json.dump({'vocab': self.vocab.strings, 'files': self.files}, fout, ensure_ascii=False)
+
+    def load(directory: str='log/analytics'):
+        """保存した集計結果を読み込む。保存されていなければ空のデータを返す"""
+        dataset = BattleDataset()
+        if not os.path.isfile(os.path.join(directory, 'index.json')):
+            return dataset
+        with open(os.path.join(directory, 'index.json'), encoding='utf-8') as fin:
+            index = json.load(fin)
+        dataset.vocab = Vocabulary(index['vocab'])
+        dataset.files = index['files']
+        with np.load(os.path.join(directory, 'columns.npz')) as npz:
+            for table, cols in dataset.columns.items():
+                for col, arr in cols.items():
+                    arr.frombytes(npz[f'{table}.{col}'].astype(arr.typecode).tobytes())
+        return dataset
+
+    def finished_games(self) -> np.ndarray:
+        """勝敗が記録されている有効な試合の真偽値配列"""
+        return (self.column('games', 'valid') == 1) & (self.column('games', 'result') >= 0)
+
+    def win_rates(self, games: np.ndarray, keys: np.ndarray, min_games: int=1) -> list[tuple]:
+        """試合{games}ごとの分類{keys}について、(分類, 試合数, 勝率) を試合数の多い順に返す"""
+        mask = self.finished_games()[games]
+        games, keys = games[mask], keys[mask]
+        # 1試合に同じ分類が複数あれば1回と数える
+        pairs = np.unique(np.stack([games, keys], axis=1), axis=0) if len(games) else np.zeros((0, 2), dtype=int)
+        wins = self.column('games', 'result')[pairs[:, 0]]
+        n = np.bincount(pairs[:, 1], minlength=len(self.vocab))
+        w = np.bincount(pairs[:, 1], weights=wins, minlength=len(self.vocab))
+        result = [(self.vocab.strings[k], int(n[k]), float(w[k]/n[k])) for k in np.nonzero(n >= min_games)[0]]
+        return sorted(result, key=lambda x: -x[1])
+
+    def win_rate_by_species(self, player: int=1, min_games: int=1) -> list[tuple]:
+        """{player}のパーティにいたポケモンごとの勝率 (player=1なら相手のポケモン)"""
+        mask = self.column('pokemon', 'player') == player
+        return self.win_rates(self.column('pokemon', 'game')[mask], self.column('pokemon', 'species')[mask], min_games)
+
+    def win_rate_by_lead(self, player: int=0, min_games: int=1) -> list[tuple]:
+        """{player}の先発ポケモンごとの勝率"""
+        mask = (self.column('pokemon', 'player') == player) & (self.column('pokemon', 'lead') == 1)
+        return self.win_rates(self.column('pokemon', 'game')[mask], self.column('pokemon', 'species')[mask], min_games)
+
+    def win_rate_by_turns(self, bins: list[int]=[5, 10, 15, 20, 30]) -> list[tuple]:
+        """試合のターン数ごとの勝率。(ターン数の範囲, 試合数, 勝率) のリストを返す"""
+        mask = self.finished_games()
+        n_turns = self.column('games', 'n_turns')[mask]
+        results = self.column('games', 'result')[mask]
+        edges = [0] + list(bins) + [np.inf]
+        index = np.digitize(n_turns, edges[1:-1])
+        result = []
+        for i in range(len(edges)-1):
+            m = index == i
+            if m.any():
+                result.append((f'{edges[i]}-{edges[i+1]}', int(m.sum()), float(results[m].mean())))
+        return result
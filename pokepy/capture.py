@@ -0,0 +1,166 @@
+import cv2
+import glob
+import numpy as np
+import os
+import time
+
+
+class FrameSource:
+    """キャプチャ画像の取得元の基底クラス
+
+    派生クラスはread()を実装する。取得できるフレームがなくなればfinishedをTrueにする。
+    """
+
+    def __init__(self):
+        self.finished = False
+
+    def read(self) -> np.ndarray:
+        """次のフレームを返す。フレームがなければNoneを返す"""
+        raise NotImplementedError
+
+    def latest(self) -> np.ndarray:
+        """最新のフレームを返す"""
+        return self.read()
+
+    def release(self) -> None:
+        pass
+
+
+class DeviceSource(FrameSource):
+    """キャプチャデバイスからフレームを取得する"""
+
+    def __init__(self, video_id: int, width: int=1920, height: int=1080):
+        super().__init__()
+        self.cap = cv2.VideoCapture(video_id)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    def read(self) -> np.ndarray:
+        _, frame = self.cap.read()
+        return frame
+
+    def latest(self) -> np.ndarray:
+        self.cap.read() # バッファ対策
+        return self.read()
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class ReplaySource(FrameSource):
+    """録画したフレームを再生する取得元の基底クラス
+
+    realtime: bool
+        Trueなら、最初にフレームを取得した時刻からの経過時間に応じたフレームを返す (実時間再生)。
+        Falseなら、取得するたびに次のフレームを返す (最高速度での再生)。
+    """
+
+    def __init__(self, fps: float, n_frames: int, realtime: bool=True):
+        super().__init__()
+        self.fps = fps
+        self.n_frames = n_frames
+        self.realtime = realtime
+        self.index = -1             # 最後に返したフレームの番号
+        self.t0 = None
+
+    def elapsed_index(self) -> int:
+        """経過時間に応じたフレームの番号"""
+        if self.t0 is None:
+            self.t0 = time.time()
+        return int((time.time()-self.t0)*self.fps)
+
+    def read(self) -> np.ndarray:
+        """次のフレームを返す。実時間再生では、次のフレームの時刻まで待つ"""
+        if self.realtime:
+            index = self.elapsed_index()
+            if index <= self.index:
+                time.sleep(max(0, (self.index+1)/self.fps - (time.time()-self.t0)))
+                index = self.index + 1
+        else:
+            index = self.index + 1
+        return self.seek(index)
+
+    def latest(self) -> np.ndarray:
+        """最新のフレームを返す。実時間再生では待たずに現時刻のフレームを返す"""
+        if self.realtime:
+            return self.seek(max(self.index, self.elapsed_index()))
+        return self.seek(self.index + 1)
+
+    def seek(self, index: int) -> np.ndarray:
+        if index >= self.n_frames:
+            self.finished = True
+            return None
+        frame = self.load(index)
+        self.index = index
+        return frame
+
+    def load(self, index: int) -> np.ndarray:
+        """{index}番目のフレームを読み込む"""
+        raise NotImplementedError
+
+
+class VideoFileSource(ReplaySource):
+    """動画ファイルを再生する"""
+
+    def __init__(self, filename: str, realtime: bool=True):
+        self.cap = cv2.VideoCapture(filename)
+        if not self.cap.isOpened():
+            raise FileNotFoundError(filename)
+        super().__init__(
+            fps=self.cap.get(cv2.CAP_PROP_FPS) or 30,
+            n_frames=int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            realtime=realtime,
+        )
+        self.frame = None
+        self.position = 0           # 次にデコードされるフレームの番号
+
+    def load(self, index: int) -> np.ndarray:
+        if index == self.index:
+            return self.frame
+        # 読み飛ばすフレームはデコードしない
+        while self.position < index:
+            self.cap.grab()
+            self.position += 1
+        ret, frame = self.cap.read()
+        self.position += 1
+        if not ret:
+            self.n_frames = index
+            self.finished = True
+            return None
+        self.frame = frame
+        return frame
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class ImageSequenceSource(ReplaySource):
+    """ディレクトリ内の連番画像を、ファイル名の順に再生する"""
+
+    def __init__(self, directory: str, fps: float=30, realtime: bool=True, ext: str='png'):
+        self.filenames = sorted(glob.glob(os.path.join(directory, f'*.{ext}')))
+        if not self.filenames:
+            raise FileNotFoundError(f'{directory}/*.{ext}')
+        super().__init__(fps=fps, n_frames=len(self.filenames), realtime=realtime)
+        self.frame = None
+
+    def load(self, index: int) -> np.ndarray:
+        if index != self.index:
+            self.frame = cv2.imread(self.filenames[index])
+        return self.frame
+
+
+def open_source(source, realtime: bool=True) -> FrameSource:
+    """{source}に応じた取得元を返す
+        int -> キャプチャデバイス
+        ディレクトリ -> 連番画像
+        ファイル -> 動画
+    """
+    if isinstance(source, FrameSource):
+        return source
+    if isinstance(source, int):
+        return DeviceSource(source)
+    if os.path.isdir(source):
+        return ImageSequenceSource(source, realtime=realtime)
+    return VideoFileSource(source, realtime=realtime)
@@ -0,0 +1,202 @@
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+import threading
+import time
+
+
+def make_macro(button: str, n: int=1, interval: float=0.1, post_sleep: float=0.1) -> str:
+    """{button}を{n}回押すnxbt形式のマクロを返す"""
+    macro = ''
+    for i in range(n):
+        macro += f'{button} 0.1s\n'
+        if i < n-1 and interval:
+            macro += f'{interval}s\n'
+    if post_sleep:
+        macro += f'{post_sleep}s\n'
+    return macro
+
+def parse_macro(macro: str) -> list[tuple[str, float]]:
+    """マクロを [(ボタン, 押下時間 or 待ち時間)] に分解する。待ち時間のボタンは''"""
+    result = []
+    for line in macro.splitlines():
+        data = line.split()
+        if not data:
+            continue
+        duration = float(data[-1].rstrip('s'))
+        result.append((' '.join(data[:-1]), duration))
+    return result
+
+
+class Controller:
+    """コントローラーの基底クラス
+
+    ボタン入力をキューに積み、送信スレッドが1つのマクロにまとめて実行する。
+    マクロの実行中に積まれた入力は、次のマクロにまとめられる。
+    入力ごとにFutureを返し、入力を含むマクロの実行が完了した時点で結果が設定される。
+    派生クラスはexecute()を実装する。
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queue = []     # [(マクロ, Future)]
+        self.running = []   # 実行中のマクロに含まれる [(マクロ, Future)]
+        self.thread = None
+        self.n_macros, self.n_presses = 0, 0
+
+    def execute(self, macro: str) -> None:
+        """マクロを実行し、完了するまで待つ"""
+        raise NotImplementedError
+
+    def press(self, button: str, n: int=1, interval: float=0.1, post_sleep: float=0.1) -> Future:
+        """ボタン入力をキューに積み、入力の完了を表すFutureを返す"""
+        future = Future()
+        with self.condition:
+            self.queue.append((make_macro(button, n, interval, post_sleep), future))
+            self.n_presses += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def wait(self) -> None:
+        """キュー内のすべての入力が完了するまで待つ"""
+        with self.condition:
+            futures = [future for _, future in self.running + self.queue]
+        for future in futures:
+            future.result()
+
+    def run(self) -> None:
+        """送信スレッド"""
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue)
+                batch, self.queue = self.queue, []
+                self.running = batch
+
+            try:
+                self.execute(''.join(macro for macro, _ in batch))
+                self.n_macros += 1
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(True)
+
+
+class NxbtController(Controller):
+    """nxbtによりSwitchに接続するコントローラー"""
+
+    def __init__(self):
+        import nxbt
+        super().__init__()
+        print('nxbtを接続中...')
+        self.nx = nxbt.Nxbt()
+        self.nxid = self.nx.create_controller(
+            nxbt.PRO_CONTROLLER,
+            reconnect_address=self.nx.get_switch_addresses(),
+        )
+        self.nx.wait_for_connection(self.nxid)
+
+    def execute(self, macro: str) -> None:
+        macro_id = self.nx.macro(self.nxid, macro, block=False)
+        while macro_id not in self.nx.state[self.nxid]['finished_macros']:
+            time.sleep(0.01)
+
+
+class FakeController(Controller):
+    """実機に接続しないテスト用のコントローラー
+
+    on_press: callable
+        ボタンが押されるたびにボタン名を引数として呼ばれる関数。
+        録画した対戦の再生などで、入力に応じて画面を切り替えるために用いる。
+
+    speed: float
+        マクロの待ち時間の倍率。0なら待たずに完了する。
+
+    script: list[str]
+        想定される入力の順序。録画した対戦の入力と比較する場合に指定する。
+        想定と異なる入力は (入力の番号, 想定, 実際) としてmismatchesに記録する。
+    """
+
+    def __init__(self, on_press=None, speed: float=1.0, script: list[str]=None):
+        super().__init__()
+        self.on_press = on_press
+        self.speed = speed
+        self.script = script
+        self.history = []       # [(時刻, ボタン)]
+        self.mismatches = []    # [(入力の番号, 想定, 実際)]
+
+    def execute(self, macro: str) -> None:
+        for button, duration in parse_macro(macro):
+            if button:
+                if self.script is not None:
+                    i = len(self.history)
+                    expected = self.script[i] if i < len(self.script) else None
+                    if button != expected:
+                        self.mismatches.append((i, expected, button))
+                self.history.append((time.time(), button))
+                if self.on_press is not None:
+                    self.on_press(button)
+            if self.speed:
+                time.sleep(duration*self.speed)
+
+
+class LatencyEstimator:
+    """ボタン入力から画面に反映されるまでの遅延を、対戦中の計測値から継続的に推定するクラス
+
+    直近{window}回の入力のうち、反映を確認できた計測値のパーセンタイルに{margin}を加えた値を、入力後の待ち時間とする。
+    時間内に反映を確認できなかった入力は、遅延が全ての計測値より長い打ち切りデータとして回数だけを数え、
+    待った時間そのものはパーセンタイルに含めない。打ち切りの割合だけ計測値の中で参照するパーセンタイルを引き上げ、
+    求めるパーセンタイルが打ち切りの範囲に入る場合は計測値の最大値を用いる。推定値は{upper}を超えない。
+    計測値が{min_samples}回に満たない間は初期値を返す。
+    """
+
+    def __init__(self, initial: float, upper: float=1.0, window: int=50, percentile: float=95,
+                 margin: float=0.02, min_samples: int=5):
+        self.initial = initial
+        self.upper = upper
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)     # 計測値。打ち切りはNone
+        self.n_timeouts = 0     # 時間内に反映を確認できなかった回数 (累計)
+
+    def add(self, latency: float) -> None:
+        """計測値を追加する"""
+        self.samples.append(latency)
+
+    def add_timeout(self) -> None:
+        """時間内に反映を確認できなかったことを記録する"""
+        self.n_timeouts += 1
+        self.samples.append(None)
+
+    def observed(self) -> list[float]:
+        """直近の計測値のうち、打ち切りでないもの"""
+        return [x for x in self.samples if x is not None]
+
+    def quantile(self, q: float) -> float:
+        """打ち切りでない計測値の{q}パーセンタイルを返す"""
+        if not (observed := self.observed()):
+            return self.initial
+        return float(np.percentile(observed, q))
+
+    def estimate(self) -> float:
+        """入力後の待ち時間の推定値を返す"""
+        observed = self.observed()
+        if len(observed) < self.min_samples:
+            return self.initial
+        # 打ち切りは全ての計測値より長いため、全体のqパーセンタイルは計測値の中では q*全体/計測値 パーセンタイルにあたる
+        q = min(self.percentile*len(self.samples)/len(observed), 100)
+        return min(self.quantile(q) + self.margin, self.upper)
+
+    def summary(self) -> dict:
+        return {
+            'n': len(self.observed()),
+            'timeouts': len(self.samples) - len(self.observed()),
+            'p50': self.quantile(50),
+            'p95': self.quantile(95),
+            'estimate': self.estimate(),
+        }
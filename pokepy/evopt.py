@@ -0,0 +1,244 @@
+from pokepy.pokemon import *
+from pokepy.stattable import StatTable, EFFORTS
+import numpy as np
+
+
+MAX_TOTAL_EFFORT = 508  # 努力値の合計の上限 (4の倍数)
+
+
+def damage_distribution(battle: Battle, player: int, moves: list[str], critical: bool=False) -> np.ndarray:
+    """{player}が{moves}を順に使ったときの合計ダメージの確率分布 (添字がダメージ) を返す
+        乱数はヒットごとに独立とする
+    """
+    dist = np.ones(1)
+    for move in moves:
+        damages = battle.oneshot_damages(player, move, critical=critical)
+        if not damages:
+            continue
+        hist = np.bincount(damages) / len(damages)
+        dist = np.convolve(dist, hist)
+    return dist
+
+
+def expand_moves(battle: Battle, player: int, moves: list[str], hits: int, n_hit: int) -> list[str]:
+    """{moves}を{hits}回ずつ使ったときの、連続技のヒットを展開した技のリストを返す"""
+    result = []
+    for move in moves*hits:
+        result += [move]*battle.num_hits(player, move, n=n_hit)
+    return result
+
+
+class Benchmark:
+    """努力値調整の目標の基底クラス
+
+    stats(me)は目標が依存する能力の番号を返し、evaluate(me)はそれらの能力の努力値 (0, 4, ..., 252) ごとに
+    目標を満たすかを真偽値の配列で返す。依存する能力が2つなら (H, B or D) の64x64の配列を返す。
+    """
+
+    def __init__(self, condition: dict=None):
+        self.condition = condition or {}
+
+    def battle(self, me: Pokemon, other: Pokemon) -> Battle:
+        battle = Battle()
+        battle.pokemon = [me, other]
+        battle.condition |= deepcopy(self.condition)
+        return battle
+
+    def stats(self, me: Pokemon) -> tuple[int]:
+        raise NotImplementedError
+
+    def evaluate(self, me: Pokemon) -> np.ndarray:
+        raise NotImplementedError
+
+
+class Survive(Benchmark):
+    """{attacker}の{moves}をそれぞれ{hits}回受けても、確率{prob}以上で耐える
+        連続技のヒット数は{n_hit}。Noneなら最大ヒット数とする
+    """
+
+    def __init__(self, attacker: Pokemon, moves: str|list[str], prob: float=1.0, hits: int=1,
+                 critical: bool=False, n_hit: int=None, condition: dict=None):
+        super().__init__(condition)
+        self.attacker = attacker
+        self.moves = [moves] if type(moves) == str else list(moves)
+        self.prob = prob
+        self.hits = hits
+        self.critical = critical
+        self.n_hit = n_hit if n_hit is not None else 10
+
+    def __repr__(self):
+        return f'Survive({self.attacker.name}, {self.moves}, prob={self.prob}, hits={self.hits})'
+
+    def stats(self, me: Pokemon) -> tuple[int]:
+        indexes = set()
+        for move in self.moves:
+            physical = Pokemon.all_moves[move]['class'] == 'phy' or move in Pokemon.move_category['physical']
+            indexes.add(2 if physical else 4)
+        if len(indexes) != 1:
+            raise ValueError('物理技と特殊技を混ぜた耐久ラインは指定できません')
+        return (0, indexes.pop())
+
+    def evaluate(self, me: Pokemon) -> np.ndarray:
+        _, index = self.stats(me)
+        me, attacker = deepcopy(me), deepcopy(self.attacker)
+        battle = self.battle(me, attacker)
+        moves = expand_moves(battle, 1, self.moves, self.hits, self.n_hit)
+        hps = StatTable.get().stat_by_effort(me.name, me.nature, 0, me.level)
+
+        feasible = np.zeros((len(EFFORTS), len(EFFORTS)), dtype=bool)
+        for j, effort in enumerate(EFFORTS):
+            me.set_effort(index, int(effort))
+            cdf = np.cumsum(damage_distribution(battle, 1, moves, self.critical))
+            # 耐える確率 = 合計ダメージがHP未満の確率
+            survive = cdf[np.minimum(hps - 1, len(cdf) - 1)]
+            feasible[:, j] = survive >= self.prob - 1e-9
+        return feasible
+
+
+class KO(Benchmark):
+    """{defender}を{moves}でそれぞれ{hits}回攻撃して、確率{prob}以上で倒す
+        連続技のヒット数は{n_hit}。Noneなら最小ヒット数とする
+    """
+
+    def __init__(self, defender: Pokemon, moves: str|list[str], prob: float=1.0, hits: int=1,
+                 critical: bool=False, n_hit: int=None, condition: dict=None):
+        super().__init__(condition)
+        self.defender = defender
+        self.moves = [moves] if type(moves) == str else list(moves)
+        self.prob = prob
+        self.hits = hits
+        self.critical = critical
+        self.n_hit = n_hit if n_hit is not None else 1
+
+    def __repr__(self):
+        return f'KO({self.defender.name}, {self.moves}, prob={self.prob}, hits={self.hits})'
+
+    def stats(self, me: Pokemon) -> tuple[int]:
+        indexes = {1 if Pokemon.all_moves[move]['class'] == 'phy' else 3 for move in self.moves}
+        if len(indexes) != 1:
+            raise ValueError('物理技と特殊技を混ぜた火力ラインは指定できません')
+        return (indexes.pop(),)
+
+    def evaluate(self, me: Pokemon) -> np.ndarray:
+        index, = self.stats(me)
+        me, defender = deepcopy(me), deepcopy(self.defender)
+        battle = self.battle(me, defender)
+        moves = expand_moves(battle, 0, self.moves, self.hits, self.n_hit)
+
+        feasible = np.zeros(len(EFFORTS), dtype=bool)
+        for i, effort in enumerate(EFFORTS):
+            me.set_effort(index, int(effort))
+            dist = damage_distribution(battle, 0, moves, self.critical)
+            feasible[i] = dist[defender.hp:].sum() >= self.prob - 1e-9
+        return feasible
+
+
+class Outspeed(Benchmark):
+    """能力ランク{rank}の状態で、能力ランク{target_rank}の{target}より素早さが高い
+        {target}には素早さの実数値も指定できる。{tie}=Trueなら同速を含む
+    """
+
+    def __init__(self, target: Pokemon|int, rank: int=0, target_rank: int=0, tie: bool=False, condition: dict=None):
+        super().__init__(condition)
+        self.target = target
+        self.rank = rank
+        self.target_rank = target_rank
+        self.tie = tie
+
+    def __repr__(self):
+        name = self.target.name if isinstance(self.target, Pokemon) else self.target
+        return f'Outspeed({name}, rank={self.rank}, target_rank={self.target_rank})'
+
+    def stats(self, me: Pokemon) -> tuple[int]:
+        return (5,)
+
+    def evaluate(self, me: Pokemon) -> np.ndarray:
+        me = deepcopy(me)
+        me.rank[5] = self.rank
+        if isinstance(self.target, Pokemon):
+            target = deepcopy(self.target)
+            target.rank[5] = self.target_rank
+            battle = self.battle(me, target)
+            target_speed = battle.eff_speed(1)
+        else:
+            battle = self.battle(me, Pokemon(me.name, use_template=False))
+            target_speed = self.target
+
+        feasible = np.zeros(len(EFFORTS), dtype=bool)
+        for i, effort in enumerate(EFFORTS):
+            me.set_effort(5, int(effort))
+            speed = battle.eff_speed(0)
+            feasible[i] = speed > target_speed or (self.tie and speed == target_speed)
+        return feasible
+
+
+def pareto_minimal(feasible: np.ndarray) -> np.ndarray:
+    """目標を満たす努力値の配列{feasible} (H, B, D) から、どの能力も減らせない点の真偽値配列を返す
+        努力値を増やしても目標を満たさなくなることはないとする
+    """
+    minimal = feasible.copy()
+    for axis in range(feasible.ndim):
+        lower = np.zeros_like(feasible)
+        index = [slice(None)]*feasible.ndim
+        index[axis] = slice(1, None)
+        shifted = [slice(None)]*feasible.ndim
+        shifted[axis] = slice(None, -1)
+        lower[tuple(index)] = feasible[tuple(shifted)]
+        minimal &= ~lower
+    return minimal
+
+
+def optimize_effort(name: str, benchmarks: list[Benchmark], natures: list[str]=None, items: list[str]=[''],
+                    ability: str=None, level: int=50, moves: list[str]=[]) -> list[dict]:
+    """{benchmarks}をすべて満たす努力値の配分のうち、パレート最小なものを返す
+
+    性格{natures}とアイテム{items}の組み合わせごとに、全ての努力値の配分 (各能力 0~252、合計{MAX_TOTAL_EFFORT}以下) を探索する。
+    目標ごとに依存する能力の努力値について表を作り、HBDは3次元の表の積、ACSは条件を満たす最小値から配分を求める。
+    目標に関係しない能力の努力値は0とする。
+
+    Returns
+    ----------
+    list[dict]
+        {'nature', 'item', 'effort', 'total'} を努力値の合計の少ない順に並べたリスト。
+    """
+    natures = natures or list(Pokemon.nature_corrections.keys())
+    results = []
+
+    for nature in natures:
+        for item in items:
+            me = Pokemon(name, use_template=False)
+            me.level = level
+            me.nature = nature
+            me.item = item
+            if ability:
+                me.org_ability = ability
+            if moves:
+                me.moves = moves
+
+            bulk = np.ones((len(EFFORTS),)*3, dtype=bool)    # H, B, D
+            minimum = {1: 0, 3: 0, 5: 0}                     # A, C, S の最小の努力値の番号
+            for benchmark in benchmarks:
+                feasible = benchmark.evaluate(me)
+                match benchmark.stats(me):
+                    case (0, 2):
+                        bulk &= feasible[:, :, None]
+                    case (0, 4):
+                        bulk &= feasible[:, None, :]
+                    case (index,):
+                        if not feasible.any():
+                            minimum[index] = None
+                        elif minimum[index] is not None:
+                            minimum[index] = max(minimum[index], int(np.argmax(feasible)))
+
+            if None in minimum.values():
+                continue
+
+            for h, b, d in np.argwhere(pareto_minimal(bulk)):
+                effort = [0]*6
+                effort[0], effort[2], effort[4] = int(EFFORTS[h]), int(EFFORTS[b]), int(EFFORTS[d])
+                for index, i in minimum.items():
+                    effort[index] = int(EFFORTS[i])
+                if (total := sum(effort)) <= MAX_TOTAL_EFFORT:
+                    results.append({'nature': nature, 'item': item, 'effort': effort, 'total': total})
+
+    return sorted(results, key=lambda r: r['total'])
@@ -0,0 +1,335 @@
+from pokepy.pokemon import Pokemon, to_hankaku
+from datetime import datetime, timedelta, timezone
+from types import MappingProxyType
+import hashlib
+import pickle
+import warnings
+import weakref
+
+
+def freeze(value):
+    """辞書を読み取り専用のビューに、リストをタプルに、入れ子の要素まで再帰的に変換する"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def thaw(value):
+    """freeze()した値を辞書またはリストに再帰的に戻す"""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    if isinstance(value, frozenset):
+        return set(value)
+    return value
+
+
+class GameData:
+    """ゲームの静的データ (図鑑、技、アイテム、タイプ相性、ランクマッチの使用率) をまとめた読み取り専用のオブジェクト
+
+    GameData.load()でデータファイルから作成し、Pokemon.use()で有効にすると、
+    Pokemon.zukan などのクラス変数がこのオブジェクトの表を参照するようになる。
+    属性は再代入できず、各表の辞書は入れ子の要素まで読み取り専用のビュー、リストはタプルとして保持するため、
+    スレッドやワーカープロセスの間でそのまま共有できる。
+    複数のGameData (例えば異なるシーズン) を同じプロセス内に同時に保持できる。
+    Battleは生成時に渡されたGameData (省略時は有効なGameData) を参照するため、
+    異なるGameDataを参照するBattleを同じプロセス内で同時に扱える。
+    一方、Pokemonのインスタンスとクラス関数は有効なGameDataを参照するため、Pokemon.use()で切り替える。
+
+    型の抽選テーブル (samplers, conditional_samplers) はGameDataごとに遅延して作成する。
+    pickleでは表そのものではなく、シーズンと内容のハッシュだけを渡す。
+    受け取ったプロセスに同じ内容のGameDataがなければ、データファイルから読み直す。
+
+        data = GameData.load(season=23)
+        Pokemon.use(data)
+        battle = Battle(data=GameData.load(season=22))
+    """
+
+    _registry = weakref.WeakValueDictionary()  # {内容のハッシュ: GameData}
+
+    FIELDS = (
+        'season', 'home',
+        'type_file_code', 'template_file_code',
+        'zukan', 'zukan_name', 'form_diff', 'japanese_display_name', 'foreign_display_names',
+        'abilities', 'ability_category',
+        'items', 'item_buff_type', 'item_debuff_type', 'item_correction', 'consumable_items',
+        'all_moves', 'move_category', 'move_value', 'move_priority', 'combo_hit', 'move_effect',
+        'nature_corrections', 'type_id', 'type_corrections',
+    )
+
+    def __init__(self, **tables):
+        for key in GameData.FIELDS:
+            object.__setattr__(self, key, freeze(tables[key]))
+        # 表から派生するキャッシュ。表の内容には含めない
+        object.__setattr__(self, 'samplers', {})
+        object.__setattr__(self, 'conditional_samplers', {})
+        object.__setattr__(self, '_key', None)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('GameDataは変更できません')
+
+    def __delattr__(self, key):
+        raise AttributeError('GameDataは変更できません')
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # Battleをpickleするたびに表を複製しないよう、シーズンと内容のハッシュだけを渡す
+        return (GameData.restore, (self.season, self.key()))
+
+    def __repr__(self):
+        return f'GameData(season={self.season}, species={len(self.zukan)}, moves={len(self.all_moves)})'
+
+    def tables(self) -> dict:
+        """全ての表を辞書とリストに戻して返す"""
+        return {key: thaw(getattr(self, key)) for key in GameData.FIELDS}
+
+    def key(self) -> str:
+        """表の内容のハッシュを返す。初回に計算してキャッシュし、このプロセスのGameData._registryに登録する"""
+        if self._key is None:
+            object.__setattr__(self, '_key', hashlib.md5(pickle.dumps(self.tables())).hexdigest())
+            GameData._registry.setdefault(self._key, self)
+        return self._key
+
+    def from_tables(tables: dict):
+        return GameData(**tables)
+
+    def restore(season: int, key: str):
+        """pickleされたGameDataを復元する
+            同じ内容のGameDataがこのプロセスにあればそれを返し、なければ{season}のデータファイルから読み直す
+        """
+        if (data := GameData._registry.get(key)) is not None:
+            return data
+        if Pokemon.data is not None and Pokemon.data.season == season and Pokemon.data.key() == key:
+            return Pokemon.data
+        data = GameData.load(season)
+        if data.key() != key:
+            warnings.warn(f'season{season}のデータファイルの内容がpickle元のGameDataと異なります')
+        return data
+
+    def load(season: int=None):
+        """データファイルと battle_data/season{season}.json を読み込んで作成する
+            {season}がNoneなら現在のシーズンを読み込む
+        """
+        # シーズンが指定されていなければ、最新のシーズンを取得する
+        if season is None:
+            dt_now = datetime.now(timezone(timedelta(hours=+9), 'JST'))
+            y, m, d = dt_now.year, dt_now.month, dt_now.day
+            season = max(12*(y-2022) + m - 11 - (d==1), 1)
+
+        type_file_code, template_file_code = {}, {}
+        zukan, zukan_name, form_diff, japanese_display_name, foreign_display_names = {}, {}, {}, {}, {}
+        abilities, ability_category = [], {}
+        items, item_buff_type, item_debuff_type, item_correction, consumable_items = {}, {}, {}, {}, []
+        all_moves, move_category, move_value, move_priority, combo_hit, move_effect = {}, {}, {}, {}, {}, {}
+        nature_corrections, type_id, type_corrections = {}, {}, []
+
+        # タイプ画像コードの読み込み
+        with open('data/terastal/codelist.txt', encoding='utf-8') as fin:
+            for line in fin:
+                data = line.split()
+                type_file_code[data[1]] = data[0]
+            #print(type_file_code)
+
+        # テンプレート画像コードの読み込み
+        with open('data/template/codelist.txt', encoding='utf-8') as fin:
+            for line in fin:
+                data = line.split()
+                template_file_code[data[0]] = data[1]
+            #print(template_file_code)
+
+        # 図鑑の読み込み
+        with open('data/zukan.txt', encoding='utf-8') as fin:
+            next(fin)
+            for line in fin:
+                data = line.split()
+                name = to_hankaku(data[1])
+                zukan[name] = {}
+                zukan[name]['type'] = [s for s in data[2:4] if s != '-' ]
+                zukan[name]['ability'] = [s for s in data[4:8] if s != '-' ]
+                zukan[name]['base'] = list(map(int, data[8:14]))
+
+                for s in zukan[name]['ability']:
+                    abilities.append(s)
+
+                # 表示名の設定
+                display_name = name
+                if 'ロトム' in name:
+                    display_name = 'ロトム'
+                else:
+                    if '(' in name:
+                        display_name = name[:display_name.find('(')]
+                    display_name = display_name.replace('パルデア','')
+                    display_name = display_name.replace('ヒスイ','')
+                    display_name = display_name.replace('ガラル','')
+                    display_name = display_name.replace('アローラ','')
+                    display_name = display_name.replace('ホワイト','')
+                    display_name = display_name.replace('ブラック','')
+                zukan[name]['display_name'] = display_name
+                
+                if display_name not in zukan_name:
+                    zukan_name[display_name] = [name]
+                elif name not in zukan_name[display_name]:
+                    zukan_name[display_name].append(name)
+                    # フォルム違いの差分を記録
+                    for key in ['type', 'ability']:
+                        if zukan[zukan_name[display_name][0]][key] != zukan[name][key]:
+                            form_diff[display_name] = key
+                            break
+
+            abilities = list(set(abilities))
+            abilities.sort()
+            
+            #print(zukan)
+            #print(abilities)
+            #print(zukan_name)
+            #print(form_diff)
+
+        # 外国語名の読み込み
+        with open('data/foreign_name.txt', encoding='utf-8') as fin:
+            next(fin)
+            for line in fin:
+                data = list(map(to_hankaku, line.split()))
+                for i in range(len(data)):
+                    japanese_display_name[to_hankaku(data[i])] = to_hankaku(data[0])
+                foreign_display_names[to_hankaku(data[0])] = [to_hankaku(s) for s in data]
+            #print(japanese_display_name)
+            #print(foreign_display_names)
+
+        # 体重の読み込み
+        with open('data/weight.txt', encoding='utf-8') as fin:
+            next(fin)
+            for line in fin:
+                data = line.split()
+                zukan[to_hankaku(data[0])]['weight'] = float(data[1])
+
+        # 特性の読み込み
+        with open('data/ability_category.txt', encoding='utf-8') as fin:
+            for line in fin:
+                data = list(map(to_hankaku, line.split()))
+                ability_category[data[0]] = data[1:]
+                if 'ばけのかわ' in ability_category[data[0]]:
+                    ability_category[data[0]].append('ばけのかわ+')
+                #print(data[0]), print(ability_category[data[0]])
+
+        # アイテムの読み込み
+        with open('data/item.txt', encoding='utf-8') as fin:
+            next(fin)
+            for line in fin:
+                data = line.split()
+                item = to_hankaku(data[0])
+                items[item] = {'power': int(data[1])} # なげつける威力
+                if data[2] != '-':
+                    item_buff_type[item] = data[2]
+                if data[3] != '-':
+                    item_debuff_type[item] = data[3]
+                item_correction[item] = float(data[4])
+                if int(data[5]):
+                    consumable_items.append(item)
+
+            item_correction[''] = 1
+            #print(items)
+            #print(item_correction)
+
+        # 技の分類の読み込み
+        with open('data/move_category.txt', encoding='utf-8') as fin:
+            for line in fin:
+                data = list(map(to_hankaku, line.split()))
+                move_category[data[0]] = data[1:]
+                #print(data[0]), print(move_category[data[0]])
+
+        with open('data/move_value.txt', encoding='utf-8') as fin:
+            for line in fin:
+                data = line.split()
+                move_value[data[0]] = {}
+                for i in range(int(len(data[1:])/2)):
+                    move_value[data[0]][to_hankaku(data[2*i+1])] = float(data[2*i+2])
+                #print(data[0], move_value[data[0]])
+
+        # 技の読み込み
+        with open('data/move.txt', encoding='utf-8') as fin:
+            eng = {'物理':'phy', '特殊':'spe'}
+            next(fin)
+            for line in fin:
+                data = line.split()
+                move = to_hankaku(data[0])
+                if '変化' in data[2]:
+                    data[2] = 'sta' + format(int(data[2][2:]), '04b')
+                else:
+                    data[2] = eng[data[2]]
+                all_moves[move] = {
+                    'type': data[1], # タイプ
+                    'class': data[2], # 分類
+                    'power': int(data[3]), # 威力
+                    'hit': int(data[4]), # 命中率
+                    'pp': int(int(data[5])*1.6) # PP
+                }
+
+            # 威力変動技を初期化する
+            for move in move_category['power_var']:
+                all_moves[move]['power'] = 1
+ 
+       # 技の優先度の読み込み
+        with open('data/move_priority.txt', encoding='utf-8') as fin:
+            for line in fin:
+                data = line.split()
+                for move in data[1:]:
+                    move_priority[to_hankaku(move)] = int(data[0])
+            #print(move_priority)
+
+       # 技の追加効果の読み込み
+        with open('data/move_effect.txt', encoding='utf-8') as fin:
+            next(fin)
+            for line in fin:
+                data = line.split()
+                move = to_hankaku(data[0])
+                move_effect[move] = {}
+                move_effect[move]['object'] = int(data[1])
+                move_effect[move]['prob'] = float(data[2])
+                move_effect[move]['rank'] = [0] + list(map(int, data[3:10]))
+                move_effect[move]['ailment'] = list(map(int, data[10:15]))
+                move_effect[move]['confusion'] = int(data[15])
+                move_effect[move]['flinch'] = float(data[16])
+            #print(move_effect)
+
+        # 連続技の読み込み
+        with open('data/combo_move.txt', encoding='utf-8') as fin:
+            for line in fin:
+                data = line.split()
+                combo_hit[to_hankaku(data[0])] = [int(data[1]), int(data[2])]
+            #print(combo_hit)
+
+        # 性格補正の読み込み
+        with open('data/nature.txt', encoding='utf-8') as fin:
+            for line in fin:
+                data = line.split()
+                nature_corrections[data[0]] = list(map(float, data[1:7]))
+            #print(nature_corrections)
+
+        # タイプ相性補正の読み込み
+        with open('data/type.txt', encoding='utf-8') as fin:
+            line = fin.readline()
+            data = line.split()
+            for i in range(len(data)):
+                type_id[data[i]] = i
+            for line in fin:
+                data = line.split()
+                type_corrections.append(list(map(float, data)))
+            #print(type_id)
+            #print(type_corrections)
+       
+        # ランクマッチの統計データの読み込み
+        filename = 'battle_data/season'+str(season)+'.json'
+        print(f'{filename}')
+        home = Pokemon.load_home(filename, zukan)
+
+        return GameData(**{key: value for key, value in locals().items() if key in GameData.FIELDS})
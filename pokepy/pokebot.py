@@ -1,25 +1,74 @@
 from pokepy.pokemon import *
+from pokepy.ponder import Ponderer
+from pokepy.selection import SelectionEngine
+from pokepy.controller import Controller, NxbtController, LatencyEstimator
+from pokepy.capture import FrameSource, DeviceSource, open_source
+from pokepy.recorder import BattleRecorder
+from pokepy.posterior import BuildPosterior
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import cv2
+import numpy as np
 import glob
+import hashlib
+import functools
 import os
-import pyocr, pyocr.builders
-from PIL import Image
 import time
 import Levenshtein
 import json
 import glob
 import jaconv
 import shutil
+import threading
 
 is_linux = (os.name != 'nt')
-if is_linux:
-    import nxbt
 
 
 TESSERACT_PATH = os.getcwd()+'/Tesseract-OCR'
 TESSDATA_PATH = TESSERACT_PATH + '/tessdata'
-os.environ["PATH"] += os.pathsep + TESSERACT_PATH
-os.environ["TESSDATA_PREFIX"] = TESSDATA_PATH
+
+
+class lazy_resource:
+    """初回の参照時に読み込み、以降は読み込んだ値を返すクラス変数を定義するデコレータ
+
+    テンプレート画像やデバイスをimport時に読み込まず、使用する時点まで遅延させるために用いる。
+    読み込んだ値はクラスで共有され、インスタンスの複製には含まれない。
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.loaded, self.value = False, None
+        self.__doc__ = loader.__doc__
+
+    def __get__(self, obj, owner=None):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.value = self.loader()
+                    self.loaded = True
+        return self.value
+
+@functools.cache
+def load_config(filename: str='config.txt') -> dict:
+    """設定ファイルを {項目: 値} として読み込む"""
+    print(filename)
+    config = {}
+    with open(filename) as fin:
+        for line in fin:
+            data = line.split()
+            if len(data) >= 2:
+                config[data[0]] = data[1]
+                print(f'\t{data[0]}: {data[1]}')
+    return config
+
+@functools.cache
+def ocr_tool():
+    """OCRエンジンを返す。初回の呼び出し時にTesseractの環境変数を設定する"""
+    import pyocr
+    os.environ["PATH"] += os.pathsep + TESSERACT_PATH
+    os.environ["TESSDATA_PREFIX"] = TESSDATA_PATH
+    return pyocr.get_available_tools()[0]
 
 
 def rect_trim(img, threshold=255):
@@ -35,6 +84,7 @@ def rect_trim(img, threshold=255):
     return img[h_min:h_max+1, w_min:w_max+1]
 
 def cv2pil(image):
+    from PIL import Image
     new_image = image.copy()
     if new_image.ndim == 2:  # モノクロ
         pass
@@ -52,7 +102,57 @@ def BGR2BIN(img, threshold=128, bitwise_not=False):
         img1 = cv2.bitwise_not(img1)
     return img1
 
+class FuzzyIndex:
+    """文字列候補の近傍探索用インデックス
+
+    候補をカタカナに正規化して文字数ごとに分類しておき、入力と文字数の近い候補から順に
+    レーベンシュタイン距離を計算する。文字数の差は距離の下限となるため、
+    最小距離を超える文字数差の候補は計算を省略する。
+    """
+
+    def __init__(self, candidates: list[str], cache_size: int=4096):
+        self.candidates = list(candidates)
+        self.exact = {}     # {候補: index}
+        self.buckets = {}   # {文字数: [(index, カタカナに正規化した候補)]}
+        for i,s in enumerate(self.candidates):
+            self.exact.setdefault(s, i)
+            key = jaconv.hira2kata(s)
+            self.buckets.setdefault(len(key), []).append((i, key))
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def nearest(self, s: str) -> tuple[str, int]:
+        """{s}に最も近い候補とその距離を返す。距離が等しい候補が複数あれば先に登録された候補を返す"""
+        if s in self.exact:
+            return s, 0
+        if s in self.cache:
+            return self.cache[s]
+
+        s1 = jaconv.hira2kata(s)
+        best_i, best_d = None, None
+        for n in sorted(self.buckets, key=lambda n: abs(n-len(s1))):
+            if best_d is not None and abs(n-len(s1)) > best_d:
+                break
+            for i, key in self.buckets[n]:
+                # 最小距離を超えることが確定した時点で計算を打ち切る
+                d = Levenshtein.distance(s1, key, score_cutoff=best_d)
+                if best_d is None or d < best_d or (d == best_d and i < best_i):
+                    best_i, best_d = i, d
+
+        result = (self.candidates[best_i], best_d)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[s] = result
+        return result
+
+
 def most_similar_element(str_list, s):
+    """{str_list}の中で{s}に最も近い文字列を返す。{str_list}にはFuzzyIndexも指定できる"""
+    if isinstance(str_list, FuzzyIndex):
+        return str_list.nearest(s)[0]
     if s in str_list:
         return s
     s1 = jaconv.hira2kata(s)
@@ -64,10 +164,100 @@ def template_match_score(img, template):
     _, max_val, _, _ = cv2.minMaxLoc(result)
     return max_val
 
+class TemplateStack:
+    """複数のテンプレート画像をまとめて照合するクラス
+
+    同じサイズのテンプレート画像を1つの配列に積み重ねておき、入力画像と同じサイズのテンプレートは
+    正規化相互相関 (cv2.TM_CCORR_NORMEDと同値) を行列積により一括で計算する。
+    サイズの異なるテンプレートはcv2.matchTemplateで照合する。
+    """
+
+    def __init__(self, templates: dict | list):
+        if not isinstance(templates, dict):
+            templates = dict(enumerate(templates))
+        self.templates = templates
+        self.keys = list(templates.keys())
+
+        # サイズごとに積み重ねたテンプレート {(h, w): (テンプレート番号の配列, 正規化した(N, h*w)行列)}
+        self.stacks = {}
+        groups = {}
+        for i,key in enumerate(self.keys):
+            groups.setdefault(templates[key].shape, []).append(i)
+        for shape, indexes in groups.items():
+            m = np.stack([templates[self.keys[i]].ravel() for i in indexes]).astype(np.float32)
+            self.stacks[shape] = (np.array(indexes), m / self._norms(m)[:, None])
+
+        # 完全一致の判定用 {(サイズ, 画像のバイト列): key}
+        self.exact = {}
+        for key in reversed(self.keys):
+            img = templates[key]
+            if img.any():
+                self.exact[(img.shape, img.tobytes())] = key
+
+    def _norms(self, m):
+        norms = np.linalg.norm(m, axis=1)
+        norms[norms == 0] = np.inf # スコアを0とする
+        return norms
+
+    def scores(self, imgs: list) -> np.ndarray:
+        """同じサイズの画像のリスト{imgs}に対する全テンプレートのスコアを、(画像数, テンプレート数)の配列で返す"""
+        result = np.zeros((len(imgs), len(self.keys)), np.float32)
+        if not len(imgs):
+            return result
+
+        shape = imgs[0].shape
+        if shape in self.stacks:
+            indexes, m = self.stacks[shape]
+            x = np.stack([img.ravel() for img in imgs]).astype(np.float32)
+            result[:, indexes] = (x / self._norms(x)[:, None]) @ m.T
+
+        for s, (indexes, _) in self.stacks.items():
+            if s == shape or s[0] > shape[0] or s[1] > shape[1]:
+                continue
+            for j in indexes:
+                for n,img in enumerate(imgs):
+                    result[n, j] = template_match_score(img, self.templates[self.keys[j]])
+
+        return result
+
+    def match_all(self, imgs: list, threshold: float=0.99) -> list:
+        """画像ごとに、スコアが{threshold}を超える最初のテンプレートのkeyを返す。該当しなければNone"""
+        result = [self.exact.get((img.shape, img.tobytes())) for img in imgs]
+        
+        # 完全一致しなかった画像のみスコアを計算する
+        rest = [n for n,key in enumerate(result) if key is None]
+        if rest:
+            scores = self.scores([imgs[n] for n in rest])
+            for n,score in zip(rest, scores):
+                if (indexes := np.flatnonzero(score > threshold)).size:
+                    result[n] = self.keys[indexes[0]]
+
+        return result
+
+    def match(self, img, threshold: float=0.99):
+        """スコアが{threshold}を超える最初のテンプレートのkeyを返す。該当しなければNone"""
+        return self.match_all([img], threshold)[0]
+
+    def best(self, img) -> tuple:
+        """最もスコアが高いテンプレートのkeyとスコアを返す"""
+        if (key := self.exact.get((img.shape, img.tobytes()))) is not None:
+            return key, 1.
+        score = self.scores([img])[0]
+        i = int(np.argmax(score))
+        return self.keys[i], float(score[i])
+
 def to_jpn_upper(s):
     trans = str.maketrans('ぁぃぅぇぉっゃゅょァィゥェォッャュョ', 'あいうえおつやゆよアイウエオツヤユヨ')
     return s.translate(trans)
 
+ocr_log_locks = {}                  # {OCR履歴のディレクトリ: Lock}
+ocr_log_locks_lock = threading.Lock()
+
+def ocr_log_lock(log_dir: str) -> threading.Lock:
+    """OCR履歴のディレクトリ{log_dir}の読み書きを排他するLockを返す"""
+    with ocr_log_locks_lock:
+        return ocr_log_locks.setdefault(os.path.normpath(log_dir), threading.Lock())
+
 def OCR(img, lang='jpn', candidates=[], log_dir='', scale=1):
     result = ''
     
@@ -76,13 +266,17 @@ def OCR(img, lang='jpn', candidates=[], log_dir='', scale=1):
         os.makedirs(log_dir, exist_ok=True)
         if log_dir[-1] != '/':
             log_dir += '/'
-        for s in glob.glob(log_dir + '*'):
-            template = cv2.cvtColor(cv2.imread(s), cv2.COLOR_BGR2GRAY)
-            if template_match_score(img, template) > 0.99:
-                result = os.path.splitext(os.path.basename(s))[0]
+        with ocr_log_lock(log_dir):
+            for s in glob.glob(log_dir + '*'):
+                if (template := cv2.imread(s)) is None:
+                    continue
+                template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+                if template_match_score(img, template) > 0.99:
+                    result = os.path.splitext(os.path.basename(s))[0]
     
     # 履歴に合致しなければOCR
     if not result:
+        import pyocr.builders
         builder = pyocr.builders.TextBuilder(tesseract_layout=7)
         match lang:
             case 'all':
@@ -92,31 +286,237 @@ def OCR(img, lang='jpn', candidates=[], log_dir='', scale=1):
                 builder = pyocr.builders.DigitBuilder(tesseract_layout=7)
         if scale > 1:
             img = cv2.resize(img, (img.shape[1]*scale, img.shape[0]*scale), interpolation=cv2.INTER_CUBIC)
-        tools = pyocr.get_available_tools()
-        result = tools[0].image_to_string(cv2pil(img), lang=lang, builder=builder)
+        result = ocr_tool().image_to_string(cv2pil(img), lang=lang, builder=builder)
         #print(f'\t\tOCR: {result}')
         if result and log_dir:
-            cv2.imwrite(log_dir+result+'.png', img) # 履歴に追加
+            # 履歴に追加。照合中の他のスレッドが書きかけのファイルを読まないように、一時ファイルから置き換える
+            tmp = f'{log_dir}.{os.getpid()}_{threading.get_ident()}.tmp.png'
+            with ocr_log_lock(log_dir):
+                if cv2.imwrite(tmp, img):
+                    os.replace(tmp, log_dir+result+'.png')
     if len(candidates):
         result = most_similar_element(candidates, result)
     
     return result
 
 
-# キャプチャ設定
-cap = None
-if is_linux:
-    print('config.txt')
-    with open('config.txt') as fin:
-        line = fin.readline()
-        video_id = int(line.split()[1])
-        print(f'\tVideo ID: {video_id}')
+class ScreenClassifier:
+    """既知の画面をフレームごとに1パスで判定するクラス
+
+    判定領域を縮小したグレースケール画像を連結してフレームのシグネチャとし、
+    前回判定したフレームとの差分がすべての判定領域で小さければ再判定せずに前回の結果を返す。
+
+    screens: dict
+        key: 画面名。
+        value: [(y0, y1, x0, x1), 二値化の閾値, 白黒反転, {ラベル: テンプレート画像}, 判定の閾値]。
+        テンプレート画像が空の場合は、領域内に文字(黒画素)があるかどうかを判定する。
+    """
+
+    # 場面の判定順 (先に一致したものを優先する)
+    PHASES = ('battle', 'change', 'selection', 'standby')
+
+    def __init__(self, screens: dict, scale: float=0.25, diff_threshold: float=1.0):
+        self.screens = screens
+        self.scale = scale                      # シグネチャの縮小率
+        self.diff_threshold = diff_threshold    # 再判定するフレーム差分 (判定領域ごとの画素値の平均絶対差の最大値)
+        self.signature = None
+        self.starts = None                      # シグネチャ内の判定領域ごとの開始位置
+        self.result = None
+        self.n_frames, self.n_classified = 0, 0
+
+    def compute_signature(self, img):
+        """判定領域を縮小して連結したシグネチャを返す"""
+        parts = []
+        for (y0, y1, x0, x1), *_ in self.screens.values():
+            img1 = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            size = (max(1, int((x1-x0)*self.scale)), max(1, int((y1-y0)*self.scale)))
+            parts.append(cv2.resize(img1, size, interpolation=cv2.INTER_AREA).ravel())
+        self.starts = np.cumsum([0] + [len(part) for part in parts[:-1]])
+        return np.concatenate(parts)
+
+    def frame_changed(self, signature) -> bool:
+        """前回判定したフレームから変化していればTrueを返す"""
+        if self.signature is None or self.signature.shape != signature.shape:
+            return True
+        diff = np.abs(signature.astype(np.int16) - self.signature.astype(np.int16))
+        # 小さい判定領域の変化が全体の平均に埋もれないように、領域ごとの平均で判定する
+        lengths = np.diff(np.append(self.starts, len(diff)))
+        return (np.add.reduceat(diff, self.starts, dtype=np.int64) / lengths).max() > self.diff_threshold
+
+    def classify(self, img, force: bool=False) -> dict:
+        """画面を判定する
+
+        Returns
+        ----------
+        result: dict
+            'phase': 場面。'battle', 'change', 'selection', 'standby' or None。
+            'confidence': 場面の判定スコア。0~1。
+            'condition': 場の状態の確認画面ならTrue。
+            'winlose': 勝敗表示。'win', 'lose' or ''。
+            'bottom_text': 画面下部にテキストが表示されていればTrue。
+            'scores': {画面名: 最大スコア}
+        """
+        self.n_frames += 1
+        signature = self.compute_signature(img)
+        if not force and not self.frame_changed(signature):
+            return self.result
+
+        self.signature = signature
+        self.n_classified += 1
+
+        scores, labels = {}, {}
+        for name, ((y0, y1, x0, x1), threshold, bitwise_not, templates, _) in self.screens.items():
+            img1 = BGR2BIN(img[y0:y1, x0:x1], threshold=threshold, bitwise_not=bitwise_not)
+            scores[name], labels[name] = 0., ''
+            if not templates:
+                # 文字の有無
+                scores[name] = float(cv2.minMaxLoc(img1)[0] == 0)
+                continue
+            for label in templates:
+                score = template_match_score(img1, templates[label])
+                if scores[name] < score:
+                    scores[name], labels[name] = score, label
+
+        def matched(name):
+            return scores[name] > self.screens[name][4]
+
+        result = {'phase': None, 'confidence': 0.}
+        for phase in self.PHASES:
+            if matched(phase):
+                result['phase'], result['confidence'] = phase, scores[phase]
+                break
+        else:
+            # どの場面にも該当しない確からしさ
+            result['confidence'] = 1 - max(scores[phase] for phase in self.PHASES)
+
+        result['condition'] = matched('condition')
+        result['winlose'] = labels['winlose'] if matched('winlose') else ''
+        result['bottom_text'] = matched('bottom_text')
+        result['scores'] = scores
+
+        self.result = result
+        return result
+
 
-        print('キャプチャデバイスを接続中...')
-        cap = cv2.VideoCapture(video_id)
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+class TextChangeDetector:
+    """テキスト表示領域の変化を検出するクラス
+
+    二値化した領域を縮小してハッシュ化し、同じハッシュが{n_stable}フレーム続いたときに
+    表示が安定したとみなす。安定したテキストは一度だけ新しいテキストとして通知する。
+    """
+
+    def __init__(self, n_stable: int=2, scale: float=0.25):
+        self.n_stable = n_stable
+        self.scale = scale
+        self.decoded_hash = None    # 最後に読み取ったテキストのハッシュ
+        self.pending_hash = None    # 安定待ちのテキストのハッシュ
+        self.count = 0              # 同じハッシュが続いたフレーム数
+
+    def compute_hash(self, img1) -> bytes:
+        """二値化画像のハッシュを返す"""
+        size = (max(1, int(img1.shape[1]*self.scale)), max(1, int(img1.shape[0]*self.scale)))
+        img2 = cv2.resize(img1, size, interpolation=cv2.INTER_AREA) > 127
+        return hashlib.blake2b(np.packbits(img2).tobytes(), digest_size=16).digest()
+
+    def reset(self):
+        self.decoded_hash = self.pending_hash = None
+        self.count = 0
+
+    def update(self, img1) -> bool:
+        """二値化した領域{img1}を与え、新しいテキストが安定して表示されていればTrueを返す"""
+        # 文字が含まれていなければ、次に表示されるテキストはすべて新しいテキストとみなす
+        if 0 not in img1:
+            self.reset()
+            return False
+
+        h = self.compute_hash(img1)
+        if h != self.pending_hash:
+            self.pending_hash, self.count = h, 1
+        else:
+            self.count += 1
+
+        if self.count >= self.n_stable and h != self.decoded_hash:
+            self.decoded_hash = h
+            return True
+        return False
+
+
+class BoardSnapshot:
+    """場の状態の確認画面から読み取った、片方のプレイヤーの盤面情報
+
+    インスタンス変数
+    ----------------------------------------
+    self.player: int
+        対象のプレイヤー。
+
+    self.display_name: str
+        場のポケモンの表示名。
+
+    self.hp: int
+        残りHP。自分のポケモンのみ。
+
+    self.hp_ratio: float
+        残りHP割合。相手のポケモンのみ。
+
+    self.ailment: str
+        状態異常。
+
+    self.rank: list[int]
+        能力ランク。[A,B,C,D,S,命中,回避]。
+
+    self.condition: dict
+        場とポケモンの状態変化。
+
+    self.item: str
+        アイテム。自分のポケモンのみ。
+
+    self.Ttype: str
+        テラスタルしていればテラスタイプ。相手のポケモンのみ。
+    """
+    def __init__(self, player: int):
+        self.player = player
+        self.display_name = ''
+        self.hp = None
+        self.hp_ratio = None
+        self.ailment = ''
+        self.rank = [0]*7
+        self.condition = {}
+        self.item = None
+        self.Ttype = ''
+
+
+class FrameBuffer:
+    """キャプチャタスクが取得した最新のフレームを保持する、スレッドセーフなバッファ"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.timestamp = 0  # フレームを取得した時刻
+
+    def put(self, frame) -> None:
+        """フレームを格納する"""
+        with self.condition:
+            self.frame = frame
+            self.timestamp = time.time()
+            self.condition.notify_all()
+
+    def get(self, timeout: float=1.0):
+        """呼び出し時刻より後に取得されたフレームを返す。{timeout}秒以内に取得されなければ最新のフレームを返す"""
+        t0 = time.time()
+        with self.condition:
+            self.condition.wait_for(lambda: self.timestamp > t0, timeout)
+            return self.frame
+
+
+def load_binary_templates(directory: str, n: int) -> list:
+    """{directory}/1.png ~ {n}.png を、白地が多くなるように二値化して読み込む"""
+    templates = []
+    for i in range(n):
+        img = BGR2BIN(cv2.imread(f'{directory}/{i+1}.png'), threshold=128)
+        if cv2.countNonZero(img)/img.size < 0.5:
+            img = cv2.bitwise_not(img)
+        templates.append(img)
+    return templates
 
 
 class Pokebot(Battle):
@@ -124,6 +524,8 @@ class Pokebot(Battle):
 
     img = None
     phase = ''
+    ponderer = None     # 先読み探索 (Battle.__init__()がreset_game()を呼ぶため、クラス変数で初期化する)
+    selector = None     # 選出の評価
     vs_NPC = True
 
     selection_command_time = 10 # 選出のコマンド入力にかかる時間の初期値
@@ -133,105 +535,199 @@ class Pokebot(Battle):
     GAME_TIME_MINUIT = 20       # 試合時間 [min]
 
     PRESS_INTERVAL = 0.2        # 決定ボタンの入力間隔
-    CAPTURE_TIME = 0.1          # ボタン入力からキャプチャまでの待ち時間
-    TRANS_CAPTURE_TIME = 0.3    # ボタン入力からキャプチャまでの待ち時間 (画面遷移あり)
+    CAPTURE_TIME = 0.1          # ボタン入力からキャプチャまでの待ち時間の初期値
+    TRANS_CAPTURE_TIME = 0.3    # ボタン入力からキャプチャまでの待ち時間の初期値 (画面遷移あり)
     ADDITIONAL_TIME = 0.5       # 一部の画面遷移時に追加する待ち時間
 
-    # nxbt
-    nx, nxid = None, None
+    CURSOR_TIMEOUT = 1.0        # カーソル移動をキャプチャ画面で確認する際の待ち時間の上限
 
-    # テンプレート画像の読み込み
-    templ_battle = BGR2BIN(cv2.imread('data/screen/battle.png'), threshold=200, bitwise_not=True)
-    templ_change = BGR2BIN(cv2.imread('data/screen/change.png'), threshold=150, bitwise_not=True)
-    templ_selection = BGR2BIN(cv2.imread('data/screen/selection.png'), threshold=100, bitwise_not=True)
-    templ_standby = BGR2BIN(cv2.imread('data/screen/standby.png'), threshold=100, bitwise_not=True)
-    templ_condition_window = BGR2BIN(cv2.imread('data/screen/condition.png'), threshold=200, bitwise_not=True)
-    templ_dead_enemy = BGR2BIN(cv2.imread('data/screen/dead_enemy.png'), threshold=128)
+    # コントローラー。init()メソッドで接続する
+    controller: Controller = None
 
-    templ_alives = {}
-    for s in ['alive', 'dead', 'in_battle']:
-        templ_alives[s] = BGR2BIN(cv2.imread(f'data/screen/{s}.png'), threshold=150, bitwise_not=True)
-    
-    templ_winlose = {}
-    for s in ['win','lose']:
-        templ_winlose[s] = BGR2BIN(cv2.imread(f'data/screen/{s}.png'), threshold=140, bitwise_not=True)
-
-    templ_condition_turns = []
-    for i in range(8):
-        s = str(i+1)
-        img = BGR2BIN(cv2.imread(f'data/condition/turn/{s}.png'), threshold=128)
-        if cv2.countNonZero(img)/img.size < 0.5:
-            img = cv2.bitwise_not(img)
-        templ_condition_turns.append(img)
-    
-    templ_condition_counts = []
-    for i in range(3):
-        s = str(i+1)
-        img = BGR2BIN(cv2.imread(f'data/condition/count/{s}.png'), threshold=128)
-        if cv2.countNonZero(img)/img.size < 0.5:
-            img = cv2.bitwise_not(img)
-        templ_condition_counts.append(img)
+    # ボタン入力から画面に反映されるまでの遅延の推定器 {'cursor': 画面遷移なし, 'transition': 画面遷移あり}
+    # init()メソッドで生成し、対戦中の計測値で更新する
+    latency: dict[str, LatencyEstimator] = {}
 
-    templ_condition_horobis = []
-    for i in range(3):
-        s = str(i+1)
-        img = BGR2BIN(cv2.imread(f'data/condition/horobi/{s}.png'), threshold=128)
-        if cv2.countNonZero(img)/img.size < 0.5:
-            img = cv2.bitwise_not(img)
-        templ_condition_counts.append(img)
+    @lazy_resource
+    def frame_source() -> FrameSource:
+        """キャプチャ画像の取得元。初回の参照時にconfig.txtのキャプチャデバイスを開く
+            set_frame_source()により録画の再生に切り替えられる
+        """
+        if not is_linux:
+            return None
+        video_id = int(load_config()['VideoID'])
+        print('キャプチャデバイスを接続中...')
+        return DeviceSource(video_id)
+
+    # テンプレート画像は、初回の参照時に読み込む
+    @lazy_resource
+    def templ_battle():
+        return BGR2BIN(cv2.imread('data/screen/battle.png'), threshold=200, bitwise_not=True)
+
+    @lazy_resource
+    def templ_change():
+        return BGR2BIN(cv2.imread('data/screen/change.png'), threshold=150, bitwise_not=True)
+
+    @lazy_resource
+    def templ_selection():
+        return BGR2BIN(cv2.imread('data/screen/selection.png'), threshold=100, bitwise_not=True)
+
+    @lazy_resource
+    def templ_standby():
+        return BGR2BIN(cv2.imread('data/screen/standby.png'), threshold=100, bitwise_not=True)
+
+    @lazy_resource
+    def templ_condition_window():
+        return BGR2BIN(cv2.imread('data/screen/condition.png'), threshold=200, bitwise_not=True)
+
+    @lazy_resource
+    def templ_dead_enemy():
+        return BGR2BIN(cv2.imread('data/screen/dead_enemy.png'), threshold=128)
+
+    @lazy_resource
+    def templ_alives():
+        return {s: BGR2BIN(cv2.imread(f'data/screen/{s}.png'), threshold=150, bitwise_not=True)
+                for s in ['alive', 'dead', 'in_battle']}
+
+    @lazy_resource
+    def templ_winlose():
+        return {s: BGR2BIN(cv2.imread(f'data/screen/{s}.png'), threshold=140, bitwise_not=True)
+                for s in ['win', 'lose']}
+
+    @lazy_resource
+    def screens():
+        """画面判定の設定 {画面: [(y0, y1, x0, x1), 二値化の閾値, 白黒反転, {ラベル: テンプレート画像}, 判定の閾値]}"""
+        return {
+            'battle': [(997, 1039, 827, 869), 200, True, {'battle': Pokebot.templ_battle}, 0.95], # 黄色点滅時にも読み取れるように閾値を下げている
+            'change': [(140, 200, 770, 860), 150, True, {'change': Pokebot.templ_change}, 0.99],
+            'selection': [(14, 64, 856, 906), 100, True, {'selection': Pokebot.templ_selection}, 0.99],
+            'standby': [(10, 70, 28, 88), 100, True, {'standby': Pokebot.templ_standby}, 0.99],
+            'condition': [(76, 132, 1112, 1372), 200, True, {'condition': Pokebot.templ_condition_window}, 0.99],
+            'winlose': [(940, 1060, 400, 750), 140, True, Pokebot.templ_winlose, 0.99],
+            'bottom_text': [(798, 842, 285, 1000), 250, True, {}, 0.5],
+        }
 
-    # 一部のテンプレート画像はPokemonクラスの初期化後、init()メソッドで読み込む
-    templ_Ttypes = {}
-    templ_ailments = {}
-    templ_conditions = {}
-    conditions, limited_conditions, countable_conditions = [], [], []
+    @lazy_resource
+    def templ_condition_turns():
+        return load_binary_templates('data/condition/turn', 8)
 
-    def init():
-        # ログ用のディレクトリ
-        os.makedirs('log/battle/', exist_ok=True)
+    @lazy_resource
+    def templ_condition_counts():
+        return load_binary_templates('data/condition/count', 3)
 
-        # nxbt設定
-        if is_linux:
-            print('nxbtを接続中...')
-            Pokebot.nx = nxbt.Nxbt()
-            Pokebot.nxid = Pokebot.nx.create_controller(
-                nxbt.PRO_CONTROLLER,
-                reconnect_address=Pokebot.nx.get_switch_addresses(),
-            )
-            Pokebot.nx.wait_for_connection(Pokebot.nxid)
-
-        # 遅延設定の読み込み
-        if os.path.isfile('log/latency.log'):
-            with open('log/latency.log', encoding='utf-8') as fin:
-                lines = fin.readlines()
-                if len(lines) == 2:
-                    Pokebot.CAPTURE_TIME = float(lines[0].split()[1])
-                    Pokebot.TRANS_CAPTURE_TIME = float(lines[1].split()[1])
-                    print(f'画面遷移なしの遅延: {Pokebot.CAPTURE_TIME}')
-                    print(f'画面遷移ありの遅延: {Pokebot.TRANS_CAPTURE_TIME}')
-
-        # 残りのテンプレート画像の読み込み
+    @lazy_resource
+    def templ_condition_horobis():
+        return load_binary_templates('data/condition/horobi', 3)
+
+    # 以下のテンプレート画像はPokemonクラスの初期化後に参照する
+    @lazy_resource
+    def templ_Ttypes():
+        templates = {}
         for t in Pokemon.type_file_code:
             img = BGR2BIN(cv2.imread(f'data/terastal/{Pokemon.type_file_code[t]}.png'), threshold=230, bitwise_not=True)
-            Pokebot.templ_Ttypes[t] = img[24:-26, 20:-22]
-        
-        for s in Pokemon.ailments:
-            Pokebot.templ_ailments[s] = (BGR2BIN(cv2.imread(f'data/screen/{s}.png'), threshold=200, bitwise_not=True))
+            templates[t] = img[24:-26, 20:-22]
+        return templates
+
+    @lazy_resource
+    def templ_ailments():
+        return {s: BGR2BIN(cv2.imread(f'data/screen/{s}.png'), threshold=200, bitwise_not=True)
+                for s in Pokemon.ailments}
 
-        Pokebot.conditions = ['auroraveil'] + list(Battle().condition.keys()) + list(Pokemon().condition.keys())
-        Pokebot.limited_conditions = ['aurora_veil'] + [
-            'ame_mamire','encore','healblock','kanashibari','jigokuzuki','chohatsu','magnetrise','nemuke',
-            'sunny','rainy','snow','sandstorm','elecfield','glassfield','psycofield','mistfield',
-            'gravity','trickroom','oikaze','lightwall','reflector','safeguard','whitemist',
-        ]
-        Pokebot.countable_conditions = ['stock','makibishi','dokubishi']
+    @lazy_resource
+    def conditions():
+        return ['auroraveil'] + list(Battle().condition.keys()) + list(Pokemon().condition.keys())
 
+    @lazy_resource
+    def templ_conditions():
+        templates = {}
         for s in Pokebot.conditions:
             img = BGR2BIN(cv2.imread(f'data/condition/{s}.png'), threshold=128)
             if cv2.countNonZero(img)/img.size < 0.5:
                 img = cv2.bitwise_not(img)
-            Pokebot.templ_conditions[s] = img
-        
+            templates[s] = img
+        return templates
+
+    limited_conditions = ['aurora_veil'] + [
+        'ame_mamire','encore','healblock','kanashibari','jigokuzuki','chohatsu','magnetrise','nemuke',
+        'sunny','rainy','snow','sandstorm','elecfield','glassfield','psycofield','mistfield',
+        'gravity','trickroom','oikaze','lightwall','reflector','safeguard','whitemist',
+    ]
+    countable_conditions = ['stock','makibishi','dokubishi']
+
+    @lazy_resource
+    def reader_pool():
+        """盤面情報の並列読み取り用のスレッドプール
+        (インスタンス変数にするとclone()時に複製できないため、クラス変数とする)
+        """
+        return ThreadPoolExecutor(max_workers=6)
+
+    @lazy_resource
+    def ocr_pool():
+        """OCRの並列実行用のスレッドプール (OCRはTesseractの子プロセスで実行される)"""
+        return ThreadPoolExecutor(max_workers=min(16, (os.cpu_count() or 1)+4))
+
+    @lazy_resource
+    def template_stacks():
+        """まとめて照合するテンプレート画像"""
+        return {
+            'Ttypes': TemplateStack(Pokebot.templ_Ttypes),
+            'ailments': TemplateStack(Pokebot.templ_ailments),
+            'conditions': TemplateStack(Pokebot.templ_conditions),
+            'condition_turns': TemplateStack(Pokebot.templ_condition_turns),
+            'condition_counts': TemplateStack(Pokebot.templ_condition_counts),
+            'condition_horobis': TemplateStack(Pokebot.templ_condition_horobis),
+        }
+
+    @lazy_resource
+    def fuzzy_indexes():
+        """文字列候補の近傍探索用インデックス"""
+        labels = Pokemon.status_label_hiragana + Pokemon.status_label_kanji
+        return {
+            'abilities': FuzzyIndex(Pokemon.abilities),
+            'display_names': FuzzyIndex(list(Pokemon.zukan_name.keys())),
+            'items': FuzzyIndex(list(Pokemon.items.keys())),
+            'items_or_empty': FuzzyIndex(list(Pokemon.items.keys())+['']),
+            'moves_or_empty': FuzzyIndex(list(Pokemon.all_moves.keys())+['']),
+            'types': FuzzyIndex(list(Pokemon.type_id.keys())),
+            'status_labels': FuzzyIndex(labels),
+            # 画面下部のテキストで誤認する可能性のある候補をすべて含ませる
+            'bottom_text': FuzzyIndex(
+                list(Pokemon.all_moves.keys()) + list(Pokemon.items.keys()) + \
+                list(Pokemon.ailments) + ['まひし'] + list(Pokemon.abilities) + labels + ['守り', 'まもり']
+            ),
+        }
+
+    def init():
+        """実機での実行に必要な初期化を行う。Pokebotの生成時に一度だけ呼ばれる
+            テンプレート画像やキャプチャデバイスなどのリソースは、初回の参照時に読み込まれる
+        """
+        if Pokebot.is_init:
+            return
+
+        # ログ用のディレクトリ
+        os.makedirs('log/battle/', exist_ok=True)
+
+        # コントローラーの接続
+        if is_linux and Pokebot.controller is None:
+            Pokebot.controller = NxbtController()
+
+        # 遅延の初期値の読み込み。ex12_latency_meas.pyの計測値を、前回の対戦で推定した値があれば上書きする
+        for filename in ['log/latency.log', 'log/latency_estimate.log']:
+            if os.path.isfile(filename):
+                with open(filename, encoding='utf-8') as fin:
+                    lines = fin.readlines()
+                    if len(lines) == 2:
+                        Pokebot.CAPTURE_TIME = float(lines[0].split()[1])
+                        Pokebot.TRANS_CAPTURE_TIME = float(lines[1].split()[1])
+                        print(f'画面遷移なしの遅延: {Pokebot.CAPTURE_TIME} ({filename})')
+                        print(f'画面遷移ありの遅延: {Pokebot.TRANS_CAPTURE_TIME} ({filename})')
+
+        Pokebot.latency = {
+            'cursor': LatencyEstimator(Pokebot.CAPTURE_TIME, upper=Pokebot.CURSOR_TIMEOUT),
+            'transition': LatencyEstimator(Pokebot.TRANS_CAPTURE_TIME,
+                                           upper=Pokebot.CURSOR_TIMEOUT+Pokebot.TRANS_CAPTURE_TIME),
+        }
+
         Pokebot.is_init = True
 
     def __init__(self):
@@ -243,10 +739,35 @@ class Pokebot(Battle):
         self.party = [[], []] # [自分のPT, 相手のPT]
         self.t0 = time.time()
         self.process_buffer = []
+        self.screen_classifier = ScreenClassifier(self.screens)
+        self.screen = {}
+        self.text_detector = TextChangeDetector()
+        self.frame_buffer = None    # 非同期実行時のフレームバッファ
+        self.recorder = None        # 対戦ログ
+        self.ponderer = None        # 先読み探索
+        self.selector = None        # 選出の評価
+        self.phase_times = {}       # {場面: [処理時間]}
         self.reset_game()
 
+    def __getstate__(self):
+        """複製時やプロセス間の受け渡し時に、キャプチャ画像と実行時のリソースを除外する"""
+        state = self.__dict__.copy()
+        for key in ['img', 'frame_buffer', 'recorder']:
+            if key in state:
+                state[key] = None
+        return state
+
     def selection_command(self, player):
-        """{player}の選出画面で呼ばれる方策関数"""
+        """{player}の選出画面で呼ばれる方策関数
+            選出の評価 (self.selector) が有効なら、残りの思考時間で対戦シミュレーションを行い、勝率の信頼区間の下限が最も高い選出を返す
+        """
+        if self.selector is not None and self.party[not player]:
+            results = self.selector.recommend(self.party[player], self.party[not player],
+                                              time_budget=max(1, self.thinking_time() - 5))
+            for r in results[:3]:
+                print(f"\t{r['names']}\t勝率 {r['win_rate']:.2f} ({r['ci'][0]:.2f}~{r['ci'][1]:.2f}) 試行 {r['n']}")
+            if results[0]['n']:
+                return results[0]['command']
         return random.sample(list(range(len(self.party[player]))), 3)
     
     def reset_game(self):
@@ -256,37 +777,121 @@ class Pokebot(Battle):
         self.turn = 0
         self.selection_finished = False
         self.screen_record = []
+        if self.ponderer is not None:
+            self.ponderer.clear()
 
         # 実戦では相手の観測値と真値は同一
         self.observed[1] = self.selected[1]
 
+        # 相手のポケモンの型の事後分布 {ポケモン名: BuildPosterior}
+        self.posteriors = {}
+
     def capture(self, filename=''):
         """画面をキャプチャする"""
-        if is_linux or filename:
-            cap.read() # バッファ対策
-            _, self.img = cap.read()
+        if self.frame_buffer is not None:
+            # キャプチャタスクが取得した最新のフレーム
+            self.img = self.frame_buffer.get()
+            if filename:
+                cv2.imwrite(filename, self.img)
+        elif self.frame_source is not None:
+            if (img := self.frame_source.latest()) is not None:
+                self.img = img
             if filename:
                 cv2.imwrite(filename, self.img)
+
+    def read_frame(self):
+        """取得元から1フレームを読み込んで返す"""
+        if self.frame_source is None or self.frame_source.finished:
+            time.sleep(0.1)
+            return None
+        return self.frame_source.read()
+
+    def set_frame_source(source, realtime: bool=True) -> FrameSource:
+        """キャプチャ画像の取得元を切り替える
+            source = int -> キャプチャデバイス
+            source = ディレクトリ -> 連番画像を再生
+            source = ファイル -> 動画を再生
+            realtime = False -> 録画を最高速度で再生する
+        """
+        Pokebot.frame_source = open_source(source, realtime=realtime)
+        return Pokebot.frame_source
+
+    def is_source_finished(self) -> bool:
+        """録画の再生が終了していればTrueを返す"""
+        return self.frame_source is not None and self.frame_source.finished
             
     def set_image(self, filename):
         """画像を読み込む"""
         self.img = cv2.imread(filename)
 
-    def press_button(self, button, n=1, interval=0.1, post_sleep=0.1):
-        """ボタンを押す"""
-        if not is_linux:
+    def press_button(self, button, n=1, interval=0.1, post_sleep=0.1, block=True):
+        """ボタンを押す
+            block = False -> 入力の完了を待たずに、完了を表すFutureを返す
+            連続して積まれた入力は、コントローラーが1つのマクロにまとめて送信する
+        """
+        if self.controller is None:
+            return None
+        future = self.controller.press(button, n=n, interval=interval, post_sleep=post_sleep)
+        if block:
+            future.result()
+        return future
+
+    def wait_time(self, transition: bool=False) -> float:
+        """ボタン入力後、画面に反映されるまでの待ち時間の推定値を返す
+            transition = True -> 画面遷移ありの場合
+        """
+        key = 'transition' if transition else 'cursor'
+        if key in self.latency:
+            return self.latency[key].estimate()
+        return self.TRANS_CAPTURE_TIME if transition else self.CAPTURE_TIME
+
+    def wait_screen(self, read, predicate, timeout: float=1.0, latency: str=''):
+        """画面をキャプチャして{read}()で読み取り、{predicate}を満たすまで待つ
+            読み取った値を返す。{timeout}秒以内に満たされなければ最後に読み取った値を返す
+            latency -> ボタン入力の直後に呼ぶ場合に、満たされるまでの時間を遅延の計測値として記録する推定器
+        """
+        t0 = time.time()
+        while True:
+            value = read()
+            if predicate(value):
+                if latency in self.latency:
+                    self.latency[latency].add(time.time() - t0)
+                return value
+            if time.time() - t0 > timeout:
+                if latency in self.latency:
+                    self.latency[latency].add_timeout()
+                return value
+
+    def save_latency(self, filename: str='log/latency_estimate.log') -> None:
+        """推定した遅延を、次回の初期値として保存する
+            ex12_latency_meas.pyの計測値 (log/latency.log) は上書きしない
+        """
+        if not self.latency:
             return
-        macro = ''
-        for i in range(n):
-            macro += f'{button} 0.1s\n'
-            if i < n-1 and interval:
-                macro += f'{interval}s\n'
-        if post_sleep:
-            macro += f'{post_sleep}s\n'
-        if macro:
-            macro_id = self.nx.macro(self.nxid, macro, block=False)
-            while macro_id not in self.nx.state[self.nxid]['finished_macros']:
-                time.sleep(0.01)
+        with open(filename, 'w', encoding='utf-8') as fout:
+            fout.write(f"wo_screen_transition\t{self.wait_time():.3f}\n")
+            fout.write(f"w_screen_transition\t{self.wait_time(transition=True):.3f}\n")
+        for key, estimator in self.latency.items():
+            print(f'遅延 {key}: {estimator.summary()}')
+
+    def move_cursor(self, read_position, target: int, phase: str='') -> bool:
+        """カーソルを{target}の位置まで移動する
+            feedback_input = True -> 固定の待ち時間の代わりに、キャプチャ画面でカーソルの到達を確認する
+            phase -> カーソルが到達しないときに確認する場面。場面が変わっていればFalseを返す
+        """
+        pos = read_position()
+        while pos != target:
+            n = target - pos
+            button = 'DPAD_DOWN' if n > 0 else 'DPAD_UP'
+            if not self.feedback_input:
+                self.press_button(button, n=abs(n), post_sleep=self.wait_time())
+                break
+            self.press_button(button, n=abs(n), post_sleep=0)
+            pos = self.wait_screen(read_position, lambda p: p == target,
+                                   timeout=self.CURSOR_TIMEOUT, latency='cursor')
+            if pos != target and phase and self.read_phase() != phase:
+                return False
+        return True
 
     def game_time(self):
         """残りの試合時間を返す"""
@@ -347,74 +952,59 @@ class Pokebot(Battle):
         print(f'{cmd_list} 番目のポケモンを選出')
         
         for cmd in cmd_list + [6]: # [6]: 決定ボタン
-            while True:
-                pos = self.selection_cursor_position()
-                if pos == cmd:
-                    break
-                n = cmd - pos
-                button = 'DPAD_DOWN' if n > 0 else 'DPAD_UP'
-                self.press_button(button, n=abs(n), post_sleep=self.CAPTURE_TIME)
-                if not self.feedback_input:
-                    break
-                if self.read_phase() != 'selection':
-                    warnings.warn('コマンド入力を完了できませんでした')
-                    self.selected[0] = [deepcopy(p) for p in self.party[0][:3]]
-                    return
+            if not self.move_cursor(self.selection_cursor_position, cmd, phase='selection'):
+                warnings.warn('コマンド入力を完了できませんでした')
+                self.selected[0] = [deepcopy(p) for p in self.party[0][:3]]
+                return
             
             self.press_button('A', n=2, interval=self.PRESS_INTERVAL)
         
         self.selected[0] = [deepcopy(self.party[0][i]) for i in cmd_list[:-1]]
 
-    def input_battle_command(self, cmd):
+    def prepare_battle_input(self):
+        """ターン開始時の画面から技選択画面に移動し、PPを読み取る"""
+        # 技選択画面に移動
+        self.move_cursor(self.battle_cursor_position, 0)
+            
+        self.press_button('A', post_sleep=self.wait_time(transition=True)+self.ADDITIONAL_TIME)
+
+        # PPを取得
+        for i in range(len(self.pokemon[0].pp)):
+            pp = self.read_pp(idx=i, capture=(i==0))
+            # 0の場合は読み直す
+            if pp == 0 and pp != self.pokemon[0].pp[i]:
+                pp = self.read_pp(idx=i, capture=True)
+            self.pokemon[0].pp[i] = pp
+
+        print(f'\tPP {self.pokemon[0].pp}')
+
+    def input_battle_command(self, cmd, prepared=False):
         """ターン開始時にコマンドを入力する
             cmd = 0~3 -> cmd番目の技を選択
             cmd = 10~13 -> テラスタルして(cmd-4)番目の技を選択
             cmd = 20~25 -> (cmd-10)番目に選出したポケモンに交代
+            prepared = True -> prepare_battle_input()により技選択画面を開いている
         """
         
         print(f'コマンド {cmd}')
 
         # 技
         if cmd < 20 or cmd == 30:
-            # 技選択画面に移動
-            while True:
-                if (pos := self.battle_cursor_position()) == 0:
-                    break
-                self.press_button('DPAD_UP', n=pos, post_sleep=self.CAPTURE_TIME)
-                if not self.feedback_input:
-                    break
-                
-            self.press_button('A', post_sleep=self.TRANS_CAPTURE_TIME+self.ADDITIONAL_TIME)
-
-            # PPを取得
-            for i in range(len(self.pokemon[0].pp)):
-                pp = self.read_pp(idx=i, capture=(i==0))
-                # 0の場合は読み直す
-                if pp == 0 and pp != self.pokemon[0].pp[i]:
-                    pp = self.read_pp(idx=i, capture=True)
-                self.pokemon[0].pp[i] = pp
-
-            print(f'\tPP {self.pokemon[0].pp}')
+            if not prepared:
+                self.prepare_battle_input()
 
             if self.pokemon[0].pp[cmd%10] == 0:
                 warnings.warn(f'{self.pokemon[0].moves[cmd%10]}のPPが不足しています')
                 return False
 
             # テラスタル
+            # (カーソル位置は変わらないため完了を待たず、続く入力とまとめて送信する)
             if cmd >= 10:
-                self.press_button('R')
+                self.press_button('R', block=False)
 
             # カーソル移動
-            while True:
-                if (pos := self.move_cursor_position()) == cmd%10:
-                    break
-                dpos = cmd%10 - pos
-                button = 'DPAD_DOWN' if dpos > 0 else 'DPAD_UP'
-                self.press_button(button, n=abs(dpos), post_sleep=self.CAPTURE_TIME)
-                if not self.feedback_input:
-                    break
-                if self.read_phase() != 'battle':
-                    return False
+            if not self.move_cursor(self.move_cursor_position, cmd%10, phase='battle'):
+                return False
 
             # 技を選択
             self.press_button('A')
@@ -423,29 +1013,25 @@ class Pokebot(Battle):
         elif cmd in range(20,26):
             cmd -= 20
 
+            # 技選択画面を開いていれば戻る
+            if prepared:
+                self.press_button('B', post_sleep=self.wait_time(transition=True))
+
             # 交代画面に移動
             print(f'{self.selected[0][cmd].name}に交代')
-            while True:
-                if (pos := self.battle_cursor_position()) == 1:
-                    break
-                dpos = 1 - pos
-                button = 'DPAD_DOWN' if dpos > 0 else 'DPAD_UP'
-                self.press_button(button, n=abs(dpos), post_sleep=self.CAPTURE_TIME)
-                if not self.feedback_input:
-                    break
-                if self.read_phase() != 'battle':
-                    return False
+            if not self.move_cursor(self.battle_cursor_position, 1, phase='battle'):
+                return False
 
             self.press_button('A', post_sleep=0.5)
 
             # カーソル移動
-            self.press_button('DPAD_DOWN', post_sleep=self.CAPTURE_TIME)
+            self.press_button('DPAD_DOWN', post_sleep=self.wait_time())
             for i in range(len(self.selected[0])-2):
                 if self.read_party_condition() == 'alive':
                     display_name = self.read_party_display_name(i+1)
                     if display_name == self.selected[0][cmd].display_name:
                         break
-                self.press_button('DPAD_DOWN', post_sleep=self.CAPTURE_TIME)
+                self.press_button('DPAD_DOWN', post_sleep=self.wait_time())
                 if self.feedback_input and self.read_phase() != 'change':
                     return False
 
@@ -472,18 +1058,18 @@ class Pokebot(Battle):
         cmd -= 20
         print(f'{self.selected[0][cmd].name}に交代')
         if self.is_change_window():
-            self.press_button('DPAD_DOWN', post_sleep=self.CAPTURE_TIME)
+            self.press_button('DPAD_DOWN', post_sleep=self.wait_time())
             for i in range(len(self.selected[0])-2):
                 if self.read_party_display_name(i+1) == self.selected[0][cmd].display_name:
                     break
-                self.press_button('DPAD_DOWN', post_sleep=self.CAPTURE_TIME)
+                self.press_button('DPAD_DOWN', post_sleep=self.wait_time())
             self.press_button('A', n=2, interval=self.PRESS_INTERVAL)       
 
         return True
     
     def read_battle_situlation(self):
         """ターン開始時に盤面情報を収集する"""
-        self.press_button('Y', post_sleep=self.TRANS_CAPTURE_TIME)
+        self.press_button('Y', post_sleep=self.wait_time(transition=True))
 
         # 相手にテラスタル権があれば、テラスタルしているか確認
         Ttype = self.read_enemy_terastal() if self.can_terastal(player=1) else ''
@@ -491,34 +1077,18 @@ class Pokebot(Battle):
         # 自分の盤面情報を取得
         if not 'player0' in self.screen_record:
             print('自分の盤面')
-            self.press_button('A', post_sleep=self.TRANS_CAPTURE_TIME+self.ADDITIONAL_TIME)
+            # 固定の待ち時間の代わりに、画面遷移をキャプチャ画面で確認する
+            self.press_button('A', post_sleep=0)
+            # 待ち時間の上限は推定値によらない固定値とし、打ち切りが推定値を押し上げて上限が伸び続けないようにする
+            self.wait_screen(self.is_condition_window, bool,
+                             timeout=self.CURSOR_TIMEOUT+self.TRANS_CAPTURE_TIME, latency='transition')
+            time.sleep(self.ADDITIONAL_TIME)
 
             if not self.is_condition_window():
                 warnings.warn('画面が不適切です')
                 return False
             
-            # 場のポケモンを取得
-            display_name = self.read_display_name(player=0, capture=False)
-            if self.pokemon[0] is None or display_name != self.pokemon[0].display_name:
-                self.change_pokemon(
-                    player=0,
-                    idx=Pokemon.index(self.selected[0], display_name=display_name),
-                    landing=False,
-                )
-
-            self.pokemon[0].hp = max(1, min(self.read_hp(capture=False), self.pokemon[0].status[0]))
-            self.pokemon[0].ailment = self.read_ailment(capture=False)
-            self.pokemon[0].rank[1:] = self.read_rank(capture=False)
-            self.overwrite_condition(player=0, condition=self.read_condition(capture=False))
-
-            if (item := self.read_item(capture=False)) != self.pokemon[0].item:
-                if item:
-                    self.pokemon[0].item = item
-                else:
-                    self.pokemon[0].item, self.pokemon[0].lost_item = '', self.pokemon[0].item
-
-                # こだわり解除
-                self.pokemon[0].fixed_move = ''
+            self.apply_board(self.read_board(player=0))
 
             # 画面認識が完了したことを記録
             self.screen_record.append('player0')
@@ -529,106 +1099,159 @@ class Pokebot(Battle):
         enemy_changed = False
         if not 'player1' in self.screen_record:
             print('相手の盤面')
-            self.press_button('R', post_sleep=self.TRANS_CAPTURE_TIME)
+            self.press_button('R', post_sleep=self.wait_time(transition=True))
 
             if not self.is_condition_window():
                 warnings.warn('画面が不適切です')
                 return False
             
-            # 場のポケモンを取得
-            display_name = self.read_display_name(player=1, capture=False)
-
-            if self.vs_NPC:
-                self.pokemon[1] = Pokemon(Pokemon.zukan_name[display_name][0], use_template=False)
-                self.pokemon[1].level = 80
-                self.selected[1].clear()
-                self.selected[1].append(self.pokemon[1])
-                self.selected[1][-1].speed_range = [0, 999]
-            
-            elif self.pokemon[1] is None or display_name != self.pokemon[1].display_name:
-                enemy_changed = True
-
-                # 初見なら選出に追加
-                if display_name not in [p.display_name for p in self.selected[1]]:
-                    p = deepcopy(Pokemon.find(self.party[1], display_name=display_name))
-
-                    # フォルムを識別
-                    if (name := self.read_form(display_name, capture=False)):
-                        p.name = name
-
-                    self.selected[1].append(p)
-                    self.selected[1][-1].speed_range = [0, 999]
-
-                    print(f'\t相手の選出 {[p.name for p in self.selected[1]]}')
-
-                # 交代
-                self.change_pokemon(
-                    player=1,
-                    idx=Pokemon.index(self.selected[1], display_name=display_name),
-                    landing=False,
-                )
-                
-            # 相手のテラスタルを取得
-            if Ttype:
-                self.pokemon[1].Ttype = Ttype
-                self.pokemon[1].use_terastal()
-
-            self.pokemon[1].hp_ratio = self.read_hp_ratio(capture=False)
-            self.pokemon[1].ailment = self.read_ailment(capture=False)
-            self.pokemon[1].rank[1:] = self.read_rank(capture=False)
-            self.overwrite_condition(player=1, condition=self.read_condition(capture=False))
+            snapshot = self.read_board(player=1)
+            snapshot.Ttype = Ttype
+            enemy_changed = self.apply_board(snapshot)
 
             # 画面認識が完了したことを記録
             self.screen_record.append('player1')
 
         # コマンド選択画面に戻る
         while True:
-            self.press_button('B', n=2, interval=0.5, post_sleep=self.TRANS_CAPTURE_TIME)
+            self.press_button('B', n=2, interval=0.5, post_sleep=self.wait_time(transition=True))
             if self.is_battle_window() or not self.feedback_input:
                 break
         
         # 相手が交代していれば、相手の控えが瀕死かどうか確認
         if enemy_changed:
-            self.press_button('PLUS', post_sleep=self.TRANS_CAPTURE_TIME)
+            self.press_button('PLUS', post_sleep=self.wait_time(transition=True))
             self.read_enemy_death()
             self.press_button('B', post_sleep=self.PRESS_INTERVAL)
 
         return True
 
-    def is_selection_window(self, capture=True):       
-        """選出画面ならTrueを返す"""
+    def read_board(self, player: int) -> BoardSnapshot:
+        """場の状態の確認画面から{player}の盤面情報を読み取る
+            各項目は互いに独立しているため、スレッドプールで並列に読み取る
+        """
+        readers = {
+            'display_name': lambda: self.read_display_name(player=player, capture=False),
+            'ailment': lambda: self.read_ailment(capture=False),
+            'rank': lambda: self.read_rank(capture=False),
+            'condition': lambda: self.read_condition(capture=False),
+        }
+        if player == 0:
+            readers['hp'] = lambda: self.read_hp(capture=False)
+            readers['item'] = lambda: self.read_item(capture=False)
+        else:
+            readers['hp_ratio'] = lambda: self.read_hp_ratio(capture=False)
+
+        futures = {key: self.reader_pool.submit(reader) for key,reader in readers.items()}
+
+        snapshot = BoardSnapshot(player)
+        for key in futures:
+            setattr(snapshot, key, futures[key].result())
+        return snapshot
+
+    def apply_board(self, snapshot: BoardSnapshot) -> bool:
+        """読み取った盤面情報を反映する。相手の場のポケモンが交代していればTrueを返す"""
+        player = snapshot.player
+        display_name = snapshot.display_name
+        changed = False
+
+        # 場のポケモンを取得
+        if player == 0:
+            if self.pokemon[0] is None or display_name != self.pokemon[0].display_name:
+                self.change_pokemon(
+                    player=0,
+                    idx=Pokemon.index(self.selected[0], display_name=display_name),
+                    landing=False,
+                )
+
+        elif self.vs_NPC:
+            self.pokemon[1] = Pokemon(Pokemon.zukan_name[display_name][0], use_template=False)
+            self.pokemon[1].level = 80
+            self.selected[1].clear()
+            self.selected[1].append(self.pokemon[1])
+            self.selected[1][-1].speed_range = [0, 999]
+        
+        elif self.pokemon[1] is None or display_name != self.pokemon[1].display_name:
+            changed = True
+
+            # 初見なら選出に追加
+            if display_name not in [p.display_name for p in self.selected[1]]:
+                p = deepcopy(Pokemon.find(self.party[1], display_name=display_name))
+
+                # フォルムを識別
+                if (name := self.read_form(display_name, capture=False)):
+                    p.name = name
+
+                self.selected[1].append(p)
+                self.selected[1][-1].speed_range = [0, 999]
+                if p.name in Pokemon.zukan:
+                    self.posteriors[p.name] = BuildPosterior(p.name, p.level)
+
+                print(f'\t相手の選出 {[p.name for p in self.selected[1]]}')
+
+            # 交代
+            self.change_pokemon(
+                player=1,
+                idx=Pokemon.index(self.selected[1], display_name=display_name),
+                landing=False,
+            )
+
+        p = self.pokemon[player]
+
+        # 相手のテラスタルを取得
+        if snapshot.Ttype:
+            p.Ttype = snapshot.Ttype
+            p.use_terastal()
+
+        if player == 0:
+            p.hp = max(1, min(snapshot.hp, p.status[0]))
+        else:
+            p.hp_ratio = snapshot.hp_ratio
+        p.ailment = snapshot.ailment
+        p.rank[1:] = snapshot.rank
+        self.overwrite_condition(player=player, condition=snapshot.condition)
+
+        if player == 0 and snapshot.item != p.item:
+            if snapshot.item:
+                p.item = snapshot.item
+            else:
+                p.item, p.lost_item = '', p.item
+
+            # こだわり解除
+            p.fixed_move = ''
+
+        return changed
+
+    def match_screen(self, screen: str, capture=True) -> str:
+        """{screen}の判定領域がテンプレートに一致すれば、一致したラベルを返す"""
         if capture:
             self.capture()
-        img1 = BGR2BIN(self.img[14:64, 856:906], threshold=100, bitwise_not=True)
-        return template_match_score(img1, self.templ_selection) > 0.99
+        (y0, y1, x0, x1), threshold, bitwise_not, templates, score_threshold = self.screens[screen]
+        img1 = BGR2BIN(self.img[y0:y1, x0:x1], threshold=threshold, bitwise_not=bitwise_not)
+        for label in templates:
+            if template_match_score(img1, templates[label]) > score_threshold:
+                return label
+        return ''
+
+    def is_selection_window(self, capture=True):
+        """選出画面ならTrueを返す"""
+        return bool(self.match_screen('selection', capture=capture))
 
     def is_battle_window(self, capture=True):
         """ターン開始時の画面ならTrueを返す"""
-        if capture:
-            self.capture()
-        img1 = BGR2BIN(self.img[997:1039, 827:869], threshold=200, bitwise_not=True)
-        return template_match_score(img1, self.templ_battle) > 0.95 # 黄色点滅時にも読み取れるように閾値を下げている
+        return bool(self.match_screen('battle', capture=capture))
 
     def is_change_window(self, capture=True):
         """交代画面ならTrueを返す"""
-        if capture:
-            self.capture()
-        img1 = BGR2BIN(self.img[140:200, 770:860], threshold=150, bitwise_not=True)
-        return template_match_score(img1, self.templ_change) > 0.99
+        return bool(self.match_screen('change', capture=capture))
 
     def is_standby_window(self, capture=True):
         """オンライン戦の待機画面ならTrueを返す"""
-        if capture:
-            self.capture()
-        img1 = BGR2BIN(self.img[10:70, 28:88], threshold=100, bitwise_not=True)
-        return template_match_score(img1, self.templ_standby) > 0.99
+        return bool(self.match_screen('standby', capture=capture))
 
     def is_condition_window(self, capture=True):
         """場の状態の確認画面ならTrueを返す"""
-        if capture:
-            self.capture()
-        img1 = BGR2BIN(self.img[76:132, 1112:1372], threshold=200, bitwise_not=True)
-        return template_match_score(img1, self.templ_condition_window) > 0.99
+        return bool(self.match_screen('condition', capture=capture))
 
     def selection_cursor_position(self, capture=True):
         """選出画面でのカーソル位置を返す
@@ -684,28 +1307,15 @@ class Pokebot(Battle):
         return 0
     
     def read_phase(self, capture=True):
-        """場面を読み取る"""
-        # ターン開始時の画面の判定
-        if self.is_battle_window(capture=capture):
-            self.phase = 'battle'
-            return self.phase
-
-        # 交代画面の判定
-        if self.is_change_window(capture=False):
-            self.phase = 'change'
-            return self.phase
-
-        # 選出画面の判定
-        if self.is_selection_window(capture=False):
-            self.phase = 'selection'
-            return self.phase
-
-        # 待機画面の判定
-        if self.is_standby_window(capture=False):
-            self.phase = 'standby'
-            return self.phase
-
-        self.phase = None
+        """場面を読み取る
+
+        ScreenClassifierにより全画面を1パスで判定し、結果をself.screenに記録する。
+        前回判定したフレームから変化がなければ、前回の判定結果を返す。
+        """
+        if capture:
+            self.capture()
+        self.screen = self.screen_classifier.classify(self.img)
+        self.phase = self.screen['phase']
         return self.phase
 
     def read_party_condition(self, capture=True):
@@ -800,12 +1410,7 @@ class Pokebot(Battle):
         img1 = img1[24:-26, 20:-22]
         # 有色 = テラスタルしている
         if cv2.minMaxLoc(img1)[0] == 0:
-            max_score, Ttype = 0, ''
-            for t in self.templ_Ttypes:
-                score = template_match_score(img1, self.templ_Ttypes[t])
-                if max_score < score:
-                    max_score = score
-                    Ttype = t
+            Ttype, _ = self.template_stacks['Ttypes'].best(img1)
         print(f'\t相手のテラスタル {Ttype}')
         return Ttype
 
@@ -816,7 +1421,7 @@ class Pokebot(Battle):
         img1 = BGR2BIN(self.img[80:130, 160:450], threshold=200, bitwise_not=True)
         candidates = []
         if self.vs_NPC and player == 1:
-            candidates = list(Pokemon.zukan_name.keys())
+            candidates = self.fuzzy_indexes['display_names']
         else:
             for p in self.party[player]:
                 candidates += Pokemon.foreign_display_names[p.display_name]
@@ -862,7 +1467,7 @@ class Pokebot(Battle):
             self.capture()
         img1 = BGR2BIN(self.img[350:395, 470:760], threshold=230, bitwise_not=True)
         #cv2.imwrite(f'log/trim.png', img1)
-        return OCR(img1, candidates=list(Pokemon.items.keys())+[''], log_dir='log/ocr/item/')
+        return OCR(img1, candidates=self.fuzzy_indexes['items_or_empty'], log_dir='log/ocr/item/')
 
     def read_rank(self, capture=True):
         """場のポケモンの能力ランクを読み取る"""
@@ -897,12 +1502,9 @@ class Pokebot(Battle):
 
         #cv2.imwrite('log/trim.png',self.img[430:460, 270:360])
         img1 = BGR2BIN(self.img[430:460, 270:360], threshold=200, bitwise_not=True)
-        result = ''
-        for ailment in self.templ_ailments:
-            if template_match_score(img1, self.templ_ailments[ailment]) > 0.99:
-                result = ailment
-                print(f'\t状態異常 {result}')
-                break
+        result = self.template_stacks['ailments'].match(img1) or ''
+        if result:
+            print(f'\t状態異常 {result}')
         return result
 
     def read_condition(self, capture=True):
@@ -913,51 +1515,59 @@ class Pokebot(Battle):
         dy = 86
         condition = {}
 
+        # 状態変化が表示されている行を切り出す
+        rows = []
         for i in range(6):
             img1 = BGR2BIN(self.img[188+dy*i:232+dy*i, 1190:1450], threshold=128)
             if cv2.minMaxLoc(img1)[0]:
                 break
             if cv2.countNonZero(img1)/img1.size < 0.5:
                 img1 = cv2.bitwise_not(img1)
+            rows.append(img1)
 
-            for t in self.templ_conditions:
-                if template_match_score(img1, self.templ_conditions[t]) > 0.99:
-                    if t in self.limited_conditions:
-                        # 残りターン数を取得
-                        img2 = BGR2BIN(self.img[188+dy*i:232+dy*i, 1710:1733], threshold=128)
-                        if cv2.countNonZero(img2)/img2.size < 0.5:
-                            img2 = cv2.bitwise_not(img2)
-                        for j in range(len(self.templ_condition_turns)):
-                            if template_match_score(img2, self.templ_condition_turns[j]) > 0.99:
-                                condition[t] = j+1
-                                break
-                        
-                        # ねがいごと回復設定 (要実装)
-                        if t == 'wish':
-                            pass
-
-                    elif t in self.countable_conditions:
-                        # カウントを取得
-                        img2 = BGR2BIN(self.img[188+dy*i:232+dy*i, 1738:1766], threshold=128)
-                        if cv2.countNonZero(img2)/img2.size < 0.5:
-                            img2 = cv2.bitwise_not(img2)
-                        for j in range(len(self.templ_condition_counts)):
-                            if template_match_score(img2, self.templ_condition_counts[j]) > 0.99:
-                                condition[t] = j+1
-                                break
-
-                    elif t == 'horobi':
-                        # 滅びカウントを取得
-                        img2 = BGR2BIN(self.img[188+dy*i:232+dy*i, 1725:1755], threshold=128)
-                        if cv2.countNonZero(img2)/img2.size < 0.5:
-                            img2 = cv2.bitwise_not(img2)
-                        for j in range(len(self.templ_condition_horobis)):
-                            if template_match_score(img2, self.templ_condition_horobis[j]) > 0.99:
-                                condition[t] = j+1
-                                break
-                    else:
-                        condition[t] = 1
-                    break
+        # 全ての行をまとめて照合する
+        matched = self.template_stacks['conditions'].match_all(rows)
+
+        # 残りターン数やカウントの読み取り位置 {分類: (x0, x1)}
+        counters = {
+            'condition_turns': (1710, 1733),
+            'condition_counts': (1738, 1766),
+            'condition_horobis': (1725, 1755),
+        }
+        targets = {key: [] for key in counters}
+        
+        for i,t in enumerate(matched):
+            if t is None:
+                continue
+            if t in self.limited_conditions:
+                # 残りターン数を取得
+                targets['condition_turns'].append((i, t))
+
+                # ねがいごと回復設定 (要実装)
+                if t == 'wish':
+                    pass
+
+            elif t in self.countable_conditions:
+                # カウントを取得
+                targets['condition_counts'].append((i, t))
+
+            elif t == 'horobi':
+                # 滅びカウントを取得
+                targets['condition_horobis'].append((i, t))
+
+            else:
+                condition[t] = 1
+
+        for key, (x0, x1) in counters.items():
+            imgs = []
+            for i,_ in targets[key]:
+                img2 = BGR2BIN(self.img[188+dy*i:232+dy*i, x0:x1], threshold=128)
+                if cv2.countNonZero(img2)/img2.size < 0.5:
+                    img2 = cv2.bitwise_not(img2)
+                imgs.append(img2)
+            for (_, t), j in zip(targets[key], self.template_stacks[key].match_all(imgs)):
+                if j is not None:
+                    condition[t] = j+1
         
         if condition:
             print(f'\t{condition}')
@@ -985,6 +1595,10 @@ class Pokebot(Battle):
 
     def dump(self):
         """ターンの情報をJSON形式で出力する"""
+        return json.dumps(self.state(), ensure_ascii=False)
+
+    def state(self) -> dict:
+        """ターンの情報を返す"""
         dict = {
             'index': [],            # 場のポケモンの選出番号
             'selected':[[], []]
@@ -1000,10 +1614,14 @@ class Pokebot(Battle):
         dict['condition'] = self.condition
         dict['was_valid'] = self.was_valid
 
-        return json.dumps(dict, ensure_ascii=False)        
+        return dict
 
     def dump_party(self, player=0):
         """パーティの情報をJSON形式で出力する"""
+        return json.dumps(self.party_dict(player), ensure_ascii=False)
+
+    def party_dict(self, player=0) -> dict:
+        """パーティの情報を返す"""
         result = {}
         for i,p in enumerate(self.party[player]):
             result[str(i)] = {
@@ -1018,7 +1636,7 @@ class Pokebot(Battle):
                 'indiv': p.indiv,
                 'effort': p.effort,
             }
-        return json.dumps(result, ensure_ascii=False)
+        return result
 
     def load_party(self):
         """パーティを読み込む"""
@@ -1046,6 +1664,7 @@ class Pokebot(Battle):
         print('パーティは "log/party.log" に保存されます')
         template = BGR2BIN(cv2.imread('data/screen/judge.png'), threshold=128)
         self.party[0] = []
+        jobs = []   # [(キャプチャ画像, {項目: Future})]
         for i in range(6):
             self.capture()
             img1 = BGR2BIN(self.img[1020:1060, 1372:1482], threshold=128)
@@ -1055,28 +1674,85 @@ class Pokebot(Battle):
                     return
                 else:
                     break
-            self.party[0].append(Pokemon())
-            self.read_box_pokemon(i)
-            self.press_button('DPAD_DOWN', post_sleep=self.TRANS_CAPTURE_TIME)
+            # OCRの完了を待たずに次のポケモンの画面に移動する
+            jobs.append((self.img, self.submit_box_pokemon(self.img)))
+            self.press_button('DPAD_DOWN', post_sleep=self.wait_time(transition=True))
             if not is_linux:
                 break
 
+        for i, (img, futures) in enumerate(jobs):
+            self.party[0].append(Pokemon())
+            self.img = img
+            self.read_box_pokemon(i, capture=False, futures=futures)
+
         with open('log/party.log', 'w', encoding='utf-8') as fout:
             fout.write(self.dump_party(player=0))
 
         self.press_button('DPAD_UP', n=len(self.party[0]))
 
-    def read_box_pokemon(self, ind):
-        """ボックスのポケモンを読み込む"""
-        self.capture()
+    def submit_box_pokemon(self, img) -> dict:
+        """ボックス画面{img}から各項目を切り出し、OCRをまとめてスレッドプールに投入する
+            {項目: Future} を返す
+        """
+        ocr_tool() # 並列実行の前にOCRエンジンを初期化しておく
+        jobs = {}
+
+        # 特性
+        img1 = BGR2BIN(img[580:620, 1455:1785], threshold=180, bitwise_not=True)
+        jobs['ability'] = (img1, dict(candidates=self.fuzzy_indexes['abilities'], log_dir='log/ocr/box_ability/'))
+
+        # 名前
+        img1 = BGR2BIN(img[90:130, 1420:1620], threshold=180, bitwise_not=True)
+        jobs['display_name'] = (img1, dict(candidates=self.fuzzy_indexes['display_names'], log_dir='log/ocr/box_name/'))
+
+        # タイプ (フォルムの識別用)
+        for t in range(2):
+            img1 = BGR2BIN(img[150:190, 1335+200*t:1480+200*t], threshold=230)
+            jobs[f'type{t}'] = (img1, dict(candidates=self.fuzzy_indexes['types'], log_dir='log/ocr/box_type/'))
+
+        # もちもの
+        img1 = BGR2BIN(img[635:685, 1455:1785], threshold=180, bitwise_not=True)
+        jobs['item'] = (img1, dict(candidates=self.fuzzy_indexes['items_or_empty'], log_dir='log/ocr/box_item/'))
+
+        # テラスタイプ : 表示位置はタイプの数で変わるため、両方の位置を読み取る
+        for n in range(1, 3):
+            x0 = 1535+200*(n-1)
+            img1 = BGR2BIN(img[154:186, x0:x0+145], threshold=240, bitwise_not=True)
+            jobs[f'Ttype{n}'] = (img1, dict(candidates=self.fuzzy_indexes['types'], log_dir='log/ocr/box_Ttype/'))
+
+        # 技
+        for j in range(4):
+            img1 = BGR2BIN(img[700+60*j:750+60*j, 1320:1570], threshold=180, bitwise_not=True)
+            jobs[f'move{j}'] = (img1, dict(candidates=self.fuzzy_indexes['moves_or_empty'], log_dir='log/ocr/box_move/'))
+
+        # レベル
+        img1 = BGR2BIN(img[25:55, 1775:1830], threshold=180, bitwise_not=True)
+        jobs['level'] = (img1, dict(log_dir='log/ocr/box_level/', lang='num'))
+
+        # ステータス
+        x = [1585, 1710, 1710, 1320, 1320, 1585]
+        y = [215, 330, 440, 330, 440, 512]
+        for j in range(6):
+            img1 = BGR2BIN(img[y[j]:y[j]+45, x[j]:x[j]+155], threshold=180, bitwise_not=True)
+            jobs[f'status{j}'] = (img1, dict(lang=('eng' if j==0 else 'num')))
+
+        return {key: self.ocr_pool.submit(OCR, img1, **kwargs) for key, (img1, kwargs) in jobs.items()}
+
+    def read_box_pokemon(self, ind, capture=True, futures=None):
+        """ボックスのポケモンを読み込む
+            futures -> submit_box_pokemon()で投入済みのOCR。指定しなければ現在の画像から投入する
+        """
+        if capture:
+            self.capture()
+        if futures is None:
+            futures = self.submit_box_pokemon(self.img)
+        ocr = {key: future.result() for key, future in futures.items()}
 
         # 特性：フォルムの識別に使うため先に読み込む
-        img1 = BGR2BIN(self.img[580:620, 1455:1785], threshold=180, bitwise_not=True)
-        ability = OCR(img1, candidates=Pokemon.abilities, log_dir='log/ocr/box_ability/')
+        ability = ocr['ability']
 
         # 名前
-        img1 = BGR2BIN(self.img[90:130, 1420:1620], threshold=180, bitwise_not=True)
-        display_name = OCR(img1, candidates=list(Pokemon.zukan_name.keys()), log_dir='log/ocr/box_name/')
+        display_name = ocr['display_name']
         name = Pokemon.zukan_name[display_name][0]
 
         # フォルム識別
@@ -1084,12 +1760,8 @@ class Pokebot(Battle):
             for s in Pokemon.zukan_name[display_name]:
                 # タイプで識別
                 if Pokemon.form_diff[display_name] == 'type':
-                    types = []
-                    for t in range(2):
-                        img1 = BGR2BIN(self.img[150:190, 1335+200*t:1480+200*t], threshold=230)
-                        type = OCR(img1, candidates=list(Pokemon.type_id.keys()), log_dir='log/ocr/box_type/')
-                        types.append(type)
-                    if types == Pokemon.zukan[s]['type'] or [types[1],types[0]] == Pokemon.zukan[s]['type']:
+                    types = [ocr['type0'], ocr['type1']]
+                    if types == list(Pokemon.zukan[s]['type']) or [types[1],types[0]] == list(Pokemon.zukan[s]['type']):
                         name = s
                         break
                 # 特性で識別
@@ -1110,7 +1782,7 @@ class Pokebot(Battle):
             elif self.img[y[j], x[j]][1] < 80:
                 nature_correction[j] = 1.1
         for nature in Pokemon.nature_corrections:
-            if nature_correction == Pokemon.nature_corrections[nature]:
+            if nature_correction == list(Pokemon.nature_corrections[nature]):
                 self.party[0][ind].nature = nature
                 break
         print(f'\t性格 {self.party[0][ind].nature}')
@@ -1125,27 +1797,19 @@ class Pokebot(Battle):
         print(f'\t特性 {self.party[0][ind].ability}')
 
         # もちもの
-        img1 = BGR2BIN(self.img[635:685, 1455:1785], threshold=180, bitwise_not=True)
-        self.party[0][ind].item = OCR(img1, candidates=list(Pokemon.items.keys())+[''], log_dir='log/ocr/box_item/')
+        self.party[0][ind].item = ocr['item']
         print(f'\tアイテム {self.party[0][ind].item}')
 
         # テラスタイプ
-        x0 = 1535+200*(len(self.party[0][ind].types)-1)
-        img1 = BGR2BIN(self.img[154:186, x0:x0+145], threshold=240, bitwise_not=True)
-        self.party[0][ind].Ttype = OCR(img1, candidates=list(Pokemon.type_id.keys()), log_dir='log/ocr/box_Ttype/')
+        self.party[0][ind].Ttype = ocr[f'Ttype{len(self.party[0][ind].types)}']
         print(f'\tテラスタイプ {self.party[0][ind].Ttype}')
 
         # 技
-        moves = ['']*4
-        for j in range(4):
-            img1 = BGR2BIN(self.img[700+60*j:750+60*j, 1320:1570], threshold=180, bitwise_not=True)
-            moves[j] = OCR(img1, candidates=list(Pokemon.all_moves.keys())+[''], log_dir='log/ocr/box_move/')
-        self.party[0][ind].moves = moves
+        self.party[0][ind].moves = [ocr[f'move{j}'] for j in range(4)]
         print(f'\t技 {self.party[0][ind].moves}')
 
         # レベル
-        img1 = BGR2BIN(self.img[25:55, 1775:1830], threshold=180, bitwise_not=True)
-        self.party[0][ind].level = int(OCR(img1, log_dir='log/ocr/box_level/', lang='num').replace('.', ''))
+        self.party[0][ind].level = int(ocr['level'].replace('.', ''))
         print(f'\tレベル {self.party[0][ind].level}')
 
         # 性別
@@ -1158,12 +1822,9 @@ class Pokebot(Battle):
         print(f'\tSex: {self.party[0][ind].sex}')
 
         # ステータス
-        x = [1585, 1710, 1710, 1320, 1320, 1585]
-        y = [215, 330, 440, 330, 440, 512]
         status = [0]*6
         for j in range(6):
-            img1 = BGR2BIN(self.img[y[j]:y[j]+45, x[j]:x[j]+155], threshold=180, bitwise_not=True)
-            s = OCR(img1, lang=('eng' if j==0 else 'num'))
+            s = ocr[f'status{j}']
             if j==0:
                 s = s[s.find('/')+1:]
             status[j] = int(s)
@@ -1190,6 +1851,9 @@ class Pokebot(Battle):
             candidates = sum([Pokemon.foreign_display_names[p.display_name] for p in self.observed[player]], [])
             dict['display_name'] = most_similar_element(candidates, dict['display_name'])
 
+            if player == 1:
+                self.update_posterior(dict)
+
             for selected in [self.observed[player], self.selected[player]]:
                 # 対象のポケモン
                 p = Pokemon.find(selected, display_name=dict['display_name'])
@@ -1200,7 +1864,7 @@ class Pokebot(Battle):
                     break
                 
                 if 'ability' in dict:
-                    p.ability = dict['ability']
+                    p.ability = p.observed_ability = dict['ability']
                     if p.ability == 'ばけのかわ':
                         p.ability = 'ばけのかわ+'
 
@@ -1303,6 +1967,27 @@ class Pokebot(Battle):
             
             print(f'素早さ推定 {p.name} {p.speed_range[0]}~{p.speed_range[1]}')
 
+            if (posterior := self.posteriors.get(p.name)) is not None:
+                posterior.observe_speed_order(move_order[not e]['speed'], first=(e == 0), r_speed=r_speed)
+                print(f"\tスカーフ {posterior.probability('item', 'こだわりスカーフ'):.2f} S期待値 {posterior.expected_speed():.1f}")
+
+        # ターンのダメージ履歴が揃ったら、相手の型の事後分布に反映する
+        for posterior in self.posteriors.values():
+            posterior.observe_history(self, player=1)
+
+    def update_posterior(self, dict: dict) -> None:
+        """相手のポケモンの特性やアイテムが判明したら、型の事後分布を更新する"""
+        p = Pokemon.find(self.selected[1], display_name=dict['display_name'])
+        if p is None or (posterior := self.posteriors.get(p.name)) is None:
+            return
+        if 'ability' in dict:
+            posterior.observe_ability(dict['ability'])
+        elif 'item' in dict and not p.item and not p.lost_item:
+            # トリックなどで入れ替わったアイテムは対象外
+            posterior.observe_item(dict['item'])
+        elif 'lost_item' in dict and not p.lost_item:
+            posterior.observe_item(dict['lost_item'])
+
     def read_form(self, display_name, capture=True):
         """場のポケモンのフォルムを読み取る"""
         if display_name not in ['ウーラオス','ケンタロス','ザシアン','ザマゼンタ']:
@@ -1318,9 +2003,9 @@ class Pokebot(Battle):
             if cv2.minMaxLoc(img1)[0] == 255:
                 type[i] = ''
             else:
-                type[i] = OCR(img1, candidates=list(Pokemon.type_id.keys()), log_dir='log/ocr/display_type/')
+                type[i] = OCR(img1, candidates=self.fuzzy_indexes['types'], log_dir='log/ocr/display_type/')
         for name in Pokemon.zukan_name[display_name]:
-            zukan_type = Pokemon.zukan[name]['type'].copy()
+            zukan_type = list(Pokemon.zukan[name]['type'])
             if len(zukan_type) == 1:
                 zukan_type.append('')
             if zukan_type == type or zukan_type == [type[1],type[0]]:
@@ -1331,15 +2016,9 @@ class Pokebot(Battle):
 
     def read_win_lose(self, capture=True):
         """勝敗表示を読み取る"""
-        if capture:
-            self.capture()
-        img1 = BGR2BIN(self.img[940:1060, 400:750], threshold=140, bitwise_not=True)
-        result = ''
-        for s in self.templ_winlose:
-            if template_match_score(img1, self.templ_winlose[s]) > 0.99:
-                result = s
-                print(f'ゲーム終了 {result}')
-                break
+        result = self.match_screen('winlose', capture=capture)
+        if result:
+            print(f'ゲーム終了 {result}')
         return result
 
     def trim(self):
@@ -1387,7 +2066,7 @@ class Pokebot(Battle):
         dict = {
             'player': player,
             'display_name': words[0][:-1],
-            'ability': most_similar_element(Pokemon.abilities, words[1])
+            'ability': most_similar_element(self.fuzzy_indexes['abilities'], words[1])
         }
         
         if dict not in self.process_buffer:
@@ -1397,6 +2076,15 @@ class Pokebot(Battle):
         else:
             return False
 
+    def is_new_bottom_text(self, capture=True):
+        """画面下部に新しいテキストが表示され、表示が安定していればTrueを返す
+            同じテキストに対しては一度だけTrueを返す
+        """
+        if capture:
+            self.capture()
+        img1 = BGR2BIN(self.img[798:905, 285:1000], threshold=250, bitwise_not=True)
+        return self.text_detector.update(img1)
+
     def read_bottom_text(self, capture=True):
         """画面下に表示されるテキストを読み取る"""
         if capture:
@@ -1480,7 +2168,7 @@ class Pokebot(Battle):
             dict['display_name'] = words[1][:-1]
             if player == 0:
                 dict['display_name'] = dict['display_name'].replace('相手の','').replace('あいての','')
-            dict['lost_item'] = most_similar_element(list(Pokemon.items.keys()), words[2][:-1])
+            dict['lost_item'] = most_similar_element(self.fuzzy_indexes['items'], words[2][:-1])
 
         # いのちのたま
         elif words[-1][:2] == '少し' or words[-1][:3] == 'すこし':
@@ -1488,7 +2176,7 @@ class Pokebot(Battle):
 
         elif words[-1][:2] in ['手に','てに']:
             # トリック
-            dict['item'] = most_similar_element(list(Pokemon.items.keys()), words[1][:-1])
+            dict['item'] = most_similar_element(self.fuzzy_indexes['items'], words[1][:-1])
 
         # ふうせん破壊
         elif 'ふうせんが' in words[1]:
@@ -1496,16 +2184,16 @@ class Pokebot(Battle):
         
         # へんげんじざい
         elif words[-1][:2] == 'なつ':
-            dict['type'] = most_similar_element(list(Pokemon.type_id.keys()), words[1][:-4])
+            dict['type'] = most_similar_element(self.fuzzy_indexes['types'], words[1][:-4])
 
         # しゅうかく
         elif words[-1][0] == '収' or words[-1][:3] == 'しゆう':
-            dict['item'] = most_similar_element(list(Pokemon.items.keys()), words[1][:-1])
+            dict['item'] = most_similar_element(self.fuzzy_indexes['items'], words[1][:-1])
         
         # クォークチャージ
         elif words[-1][0] == '高' or words[-1][:3] == 'たかま':
             labels = Pokemon.status_label_hiragana + Pokemon.status_label_kanji
-            s = most_similar_element(labels, words[1][:-1])
+            s = most_similar_element(self.fuzzy_indexes['status_labels'], words[1][:-1])
             dict['boost'] = labels.index(s)%5 + 1
         
         # 技・アイテム
@@ -1514,13 +2202,7 @@ class Pokebot(Battle):
             if words[0][-1] not in ['の','は'] or words[-1][1:3] == 'りだ':
                 return False
 
-            # 誤認する可能性のある候補をすべて含ませる
-            candidates = list(Pokemon.all_moves.keys()) + list(Pokemon.items.keys()) + \
-                list(Pokemon.ailments) + ['まひし'] + Pokemon.abilities + \
-                Pokemon.status_label_hiragana + Pokemon.status_label_kanji + \
-                ['守り', 'まもり']
-            
-            s = most_similar_element(candidates, words[1][:-1])
+            s = most_similar_element(self.fuzzy_indexes['bottom_text'], words[1][:-1])
 
             if s in Pokemon.all_moves:
                 dict['move'] = s
@@ -1544,26 +2226,23 @@ class Pokebot(Battle):
         else:
             return False
 
-    def main_loop(self, vs_NPC: bool=False, feedback_input: bool=True) -> None:
-        """Botを実行する
-        
-        Parameters:
-        --------------
-        vs_NPC: bool
-            Trueを指定すると、対NPC戦モードで動作する
-
-        feedback_input: bool
-            Trueを指定すると、コマンド入力後にカーソル位置が正しいかチェックする
-            入力精度が向上するが時間がかかる
-        """
-
+    def start_loop(self, vs_NPC: bool=False, feedback_input: bool=True, ponder: bool=False, select: bool=False) -> None:
+        """Botの実行前の設定を行う"""
         self.feedback_input = feedback_input
         self.vs_NPC = bool(vs_NPC)
         print('対NPC' if self.vs_NPC else '対人戦')
+
+        if ponder and self.ponderer is None:
+            self.ponderer = Ponderer()
+
+        if select and self.selector is None:
+            self.selector = SelectionEngine()
+        if self.selector is not None:
+            self.selector.start()
         
         self.load_party()
 
-        logfile = None
+        self.recorder = None
 
         # 対NPC戦の初期化
         if self.vs_NPC:
@@ -1572,198 +2251,361 @@ class Pokebot(Battle):
 
             filename = 'log/battle/npc.log'
             print(f'ログ出力 {filename}')
-            logfile = open(filename, 'w', encoding='utf-8')
-            logfile.write(self.dump_party(player=0) + '\n')
+            self.recorder = BattleRecorder(filename, header={'vs_NPC': True, 'party': [self.party_dict(0), {}]})
 
-        while True:
-            phase = self.read_phase()
+    def enter_phase(self, phase: str) -> bool:
+        """場面の処理を始める前に呼ばれる。処理を中断すべきならFalseを返す"""
+        if phase is not None:
+            # 対NPC戦でA連打による画面遷移への対策
+            if self.vs_NPC:
+                self.press_button('B', n=4, post_sleep=1)
+                if self.read_phase() != phase:
+                    return False
+
+            print(f'=== Phase : {phase} ===')
+            self.t0 = time.time()
+
+        return True
+
+    def process_phase(self, phase: str) -> None:
+        """場面に応じた処理を行う"""
+        match phase:
+            case 'standby':
+                self.press_button('A', post_sleep=0.5)
+            case 'selection':
+                self.on_selection()
+            case 'battle':
+                self.on_battle()
+            case 'change':
+                self.on_change()
+            case _:
+                self.on_message()
+
+    def on_selection(self) -> None:
+        """選出画面の処理"""
+        if self.selection_finished:
+            return
+
+        # 時間計測開始
+        t0 = time.time()
+
+        # 試合をリセット
+        self.reset_game()
+        
+        if os.path.isdir('log/ocr/'):
+            shutil.rmtree('log/ocr/')
+            print("OCR履歴 'log/ocr/' を削除")
+
+        # 相手のパーティを読み込む
+        self.press_button('B', n=4)
+        self.read_enemy_party()
+        dt = time.time() - t0
+
+        # コマンドを取得
+        cmd = self.selection_command(player=0)
+
+        # コマンドを入力
+        t0 = time.time()
+        self.input_selection_command(cmd) 
+        dt += time.time() - t0
+        
+        # コマンド入力にかかった時間を記録
+        print(f'操作時間 {dt:.1f}')
+        self.selection_command_time = max(self.selection_command_time, dt)
+
+        # 自分の選出に追加
+        self.selected[0] = [deepcopy(self.party[0][i]) for i in cmd]
+
+        # 前の試合のログが開かれたままなら閉じる
+        if self.recorder is not None:
+            self.recorder.close()
+
+        # 試合のログを生成
+        filename = 'log/battle/'+datetime.now(timezone(timedelta(hours=+9), 'JST')).strftime('%Y%m%d_%H%M%S')+'.log'
+        print(f'ログ出力 {filename}')
+        self.recorder = BattleRecorder(filename, header={'vs_NPC': False, 'party': [self.party_dict(0), self.party_dict(1)]})
+
+        self.selection_finished = True
+        self.turn = 0
+
+    def on_battle(self) -> None:
+        """ターン開始時の処理"""
+        t0 = time.time()
+        if not self.begin_turn():
+            return
+
+        # コマンドを取得
+        dt = time.time() - t0
+        if (cmd := self.pondered_command()) is None:
+            cmd = self.battle_command(player=0)
+
+        self.end_turn(cmd, dt)
+
+    def pondered_command(self):
+        """現在の盤面に一致する先読み探索の結果があればコマンドを返し、なければNoneを返す"""
+        if self.ponderer is None:
+            return None
+        return self.ponderer.result(self, player=0)
+
+    def begin_turn(self) -> bool:
+        """盤面を読み取り、前ターンの結果を反映する。方策関数を呼べる状態になればTrueを返す"""
+        self.selection_finished = False
+
+        if not self.read_battle_situlation():
+            warnings.warn('画面認識に失敗しました。再取得します')
+            self.press_button('B', n=4)
+            return False
+
+        # バッファ内の情報を反映させる
+        self.read_buffer()
+
+        # 前ターンの終状態を記録
+        if self.recorder is not None:
+            self.recorder.record(self.state())
+
+        # 前ターンの結果を反映
+        for p in self.pokemon:
+            if p.last_pp_move:
+                p.acted_turn += 1
+
+                if 'こだわり' in p.item and not p.fixed_move:
+                    p.fixed_move = p.last_pp_move
+
+            if p.ailment == 'SLP' and p.sleep_count > 1:
+                p.sleep_count -= 1
+
+        # 相手の場のポケモンの観測値を表示
+        self.pokemon[1].show()
+
+        return True
+
+    def end_turn(self, cmd: int, dt: float, prepared: bool=False) -> None:
+        """コマンドを入力してターンを終える
+            dt: ここまでにかかった操作時間
+            prepared: 技選択画面を開いてPPを読み取り済みならTrue
+        """
+        t0 = time.time()
+
+        self.turn += 1
+
+        # コマンドを入力
+        if not self.input_battle_command(cmd, prepared=prepared):
+            warnings.warn(f'コマンド入力を完了できませんでした')
+            self.press_button('B', n=4)
+            return
+
+        # 操作時間を記録
+        dt += time.time() - t0
+        print(f'操作時間 {dt:.1f}s')
+        self.battle_command_time = max(self.battle_command_time, dt)
+
+        # コマンドを記録
+        self.command[0] = cmd
+
+        # このターンの行動を反映
+        if cmd in range(10, 20):
+            # テラスタル
+            self.pokemon[0].use_terastal()
+        elif cmd in range(20, 30):
+            # 交代
+            self.change_pokemon(player=0, command=cmd, landing=False)
+
+        # 相手の行動を待つ間に、次のターンの盤面を先読み探索する
+        if self.ponderer is not None:
+            self.ponderer.start(self, player=0)
+
+        # 連続で認識しないように待つ
+        time.sleep(1)
+        
+        # 画面の読み取り履歴をクリア
+        self.screen_record.clear()
+
+    def on_change(self) -> None:
+        """任意交代時の処理"""
+        t0 = time.time()
+
+        print('場と控えのポケモンのHPを更新')
+        for i in range(len(self.selected[0])):
+            hp = self.read_party_hp(i, capture=(i==0))
+            if hp == 0:
+                hp = self.read_party_hp(i, capture=True) # 0なら再チェック
             
-            if phase is not None:
-                # 対NPC戦でA連打による画面遷移への対策
-                if self.vs_NPC:
-                    self.press_button('B', n=4, post_sleep=1)
-                    if self.read_phase() != phase:
-                        continue
+            p = Pokemon.find(self.selected[0], display_name=self.read_party_display_name(i))
+            p.hp = hp
+            print(f'\t{p.name} HP {p.hp}/{p.status[0]}')
+            break
 
-                print(f'=== Phase : {phase} ===')
-                self.t0 = time.time()
+        # バッファ内の情報を反映させる
+        self.read_buffer()
 
-            match phase:
-                case 'standby':
-                    self.press_button('A', post_sleep=0.5)
+        # コマンドを取得
+        dt = time.time() - t0
+        cmd = self.change_command(player=0)
+        t0 = time.time()
 
-                case 'selection':
-                    if self.selection_finished:
-                        continue
+        # コマンドを入力
+        self.input_change_command(cmd)
 
-                    # 時間計測開始
-                    t0 = time.time()
+        # 操作時間を記録
+        dt += time.time() - t0
+        print(f'操作時間 {dt:.1f}')
+        self.change_command_time = max(self.change_command_time, dt)
 
-                    # 試合をリセット
-                    self.reset_game()
-                    
-                    if os.path.isdir('log/ocr/'):
-                        shutil.rmtree('log/ocr/')
-                        print("OCR履歴 'log/ocr/' を削除")
-
-                    # 相手のパーティを読み込む
-                    self.press_button('B', n=4)
-                    self.read_enemy_party()
-                    dt = time.time() - t0
-
-                    # コマンドを取得
-                    cmd = self.selection_command(player=0)
-
-                    # コマンドを入力
-                    t0 = time.time()
-                    self.input_selection_command(cmd) 
-                    dt += time.time() - t0
-                    
-                    # コマンド入力にかかった時間を記録
-                    print(f'操作時間 {dt:.1f}')
-                    self.selection_command_time = max(self.selection_command_time, dt)
-
-                    # 自分の選出に追加
-                    self.selected[0] = [deepcopy(self.party[0][i]) for i in cmd]
-
-                    # 前の試合のログが開かれたままなら閉じる
-                    if logfile is not None and not logfile.closed:
-                        logfile.close()
-
-                    # 試合のログを生成
-                    filename = 'log/battle/'+datetime.now(timezone(timedelta(hours=+9), 'JST')).strftime('%Y%m%d_%H%M%S')+'.log'
-                    print(f'ログ出力 {filename}')
-                    logfile = open(filename, 'w', encoding='utf-8')
-                    logfile.write(self.dump_party(player=0) + '\n')
-                    logfile.write(self.dump_party(player=1) + '\n')
-
-                    self.selection_finished = True
-                    self.turn = 0
-
-                case 'battle':
-                    t0 = time.time()
-                    self.selection_finished = False
-
-                    if not self.read_battle_situlation():
-                        warnings.warn('画面認識に失敗しました。再取得します')
-                        self.press_button('B', n=4)
-                    else:
-                        # バッファ内の情報を反映させる
-                        self.read_buffer()
-
-                        # 前ターンの終状態を記録
-                        if logfile is not None:
-                            logfile.write(self.dump() + '\n')
-
-                        # 前ターンの結果を反映
-                        for p in self.pokemon:
-                            if p.last_pp_move:
-                                p.acted_turn += 1
-
-                                if 'こだわり' in p.item and not p.fixed_move:
-                                    p.fixed_move = p.last_pp_move
-
-                            if p.ailment == 'SLP' and p.sleep_count > 1:
-                                p.sleep_count -= 1
-
-                        # 相手の場のポケモンの観測値を表示
-                        self.pokemon[1].show()
-
-                        # コマンドを取得
-                        dt = time.time() - t0
-                        cmd = self.battle_command(player=0)
-                        t0 = time.time()
-
-                        self.turn += 1
-
-                        # コマンドを入力
-                        if self.input_battle_command(cmd):
-                            # 操作時間を記録
-                            dt += time.time() - t0
-                            print(f'操作時間 {dt:.1f}s')
-                            self.battle_command_time = max(self.battle_command_time, dt)
-
-                            # コマンドを記録
-                            self.command[0] = cmd
-
-                            # このターンの行動を反映
-                            if cmd in range(10, 20):
-                                # テラスタル
-                                self.pokemon[0].use_terastal()
-                            elif cmd in range(20, 30):
-                                # 交代
-                                self.change_pokemon(player=0, command=cmd, landing=False)
-
-                            # 連続で認識しないように待つ
-                            time.sleep(1)
-                        else:
-                            warnings.warn(f'コマンド入力を完了できませんでした')
-                            self.press_button('B', n=4)
-                            continue
-                        
-                        # 画面の読み取り履歴をクリア
-                        self.screen_record.clear()
+        # 交代
+        self.change_pokemon(player=0, command=cmd, landing=False)
 
-                case 'change':
-                    t0 = time.time()
+        # 画面の読み取り履歴をクリア
+        self.screen_record.clear()
 
-                    print('場と控えのポケモンのHPを更新')
-                    for i in range(len(self.selected[0])):
-                        hp = self.read_party_hp(i, capture=(i==0))
-                        if hp == 0:
-                            hp = self.read_party_hp(i, capture=True) # 0なら再チェック
-                        
-                        p = Pokemon.find(self.selected[0], display_name=self.read_party_display_name(i))
-                        p.hp = hp
-                        print(f'\t{p.name} HP {p.hp}/{p.status[0]}')
-                        break
+        # 連続で認識しないように待つ
+        time.sleep(2)
 
-                    # バッファ内の情報を反映させる
-                    self.read_buffer()
+    def on_message(self) -> None:
+        """場面に該当しない画面 (技の演出など) での処理"""
+        # 試合中でなければ中断
+        if self.recorder is None or self.recorder.closed:
+            return
+        
+        # 画面下部に新しいテキストが表示されていれば取得
+        if all(self.pokemon) and self.is_new_bottom_text(capture=False) and \
+            self.read_bottom_text(capture=False):
+            # 特性発動時のテキストも確認
+            for player in range(2):
+                self.read_ability_text(player, capture=False)
+        
+        # 勝敗を観測したらログを閉じる
+        if not self.vs_NPC:
+            if (result := self.screen['winlose']):
+                print(f'ゲーム終了 {result}')
+                self.recorder.close(result)
+                self.save_latency()
+        else:
+            self.press_button('A')
+        
+        # 画面の読み取り履歴をクリア
+        self.screen_record.clear()
 
-                    # コマンドを取得
-                    dt = time.time() - t0
-                    cmd = self.change_command(player=0)
-                    t0 = time.time()
+    def main_loop(self, vs_NPC: bool=False, feedback_input: bool=True, ponder: bool=False, select: bool=False) -> None:
+        """Botを実行する
+        
+        Parameters:
+        --------------
+        vs_NPC: bool
+            Trueを指定すると、対NPC戦モードで動作する
 
-                    # コマンドを入力
-                    self.input_change_command(cmd)
+        feedback_input: bool
+            Trueを指定すると、コマンド入力後にカーソル位置が正しいかチェックする
+            入力精度が向上するが時間がかかる
 
-                    # 操作時間を記録
-                    dt += time.time() - t0
-                    print(f'操作時間 {dt:.1f}')
-                    self.change_command_time = max(self.change_command_time, dt)
+        ponder: bool
+            Trueを指定すると、相手の行動を待つ間に次のターンの盤面をワーカープロセスで先読み探索する
+            方策関数battle_command()はワーカープロセスで実行されるため、インスタンスの状態を書き換えても反映されない
 
-                    # 交代
-                    self.change_pokemon(player=0, command=cmd, landing=False)
+        select: bool
+            Trueを指定すると、選出画面で相手のパーティに対する選出の候補をワーカープロセスでシミュレーションして評価する
+            独自の方策で評価する場合は、self.selector = SelectionEngine(battle_class=...) を設定しておく
+        """
+        self.start_loop(vs_NPC, feedback_input, ponder, select)
 
-                    # 画面の読み取り履歴をクリア
-                    self.screen_record.clear()
+        while not self.is_source_finished():
+            t0 = time.time()
+            phase = self.read_phase()
+            if self.enter_phase(phase):
+                self.process_phase(phase)
+                self.record_phase_time(phase, time.time()-t0)
 
-                    # 連続で認識しないように待つ
-                    time.sleep(2)
-                
-                case _:
-                    # 試合中でなければ中断
-                    if logfile is None or logfile.closed:
-                        continue
-                    
-                    # 画面下部のテキストを取得
-                    if all(self.pokemon) and self.read_bottom_text(capture=False):
-                        # 特性発動時のテキストも確認
-                        for player in range(2):
-                            self.read_ability_text(player, capture=False)
-                    
-                    # 勝敗を観測したらログを閉じる
-                    if not self.vs_NPC:
-                        if (result := self.read_win_lose(capture=False)):
-                            logfile.write(f'{result}\n')
-                            logfile.close()
-                    else:
-                        self.press_button('A')
-                    
-                    # 画面の読み取り履歴をクリア
-                    self.screen_record.clear()
+    def record_phase_time(self, phase: str, dt: float) -> None:
+        """場面の処理時間を記録する"""
+        self.phase_times.setdefault(phase or 'message', []).append(dt)
+
+    def phase_time_summary(self) -> dict:
+        """場面ごとの処理時間の統計を返す
+            {場面: {'n': 回数, 'mean': 平均, 'p50': 中央値, 'p95': 95パーセンタイル, 'max': 最大}}
+        """
+        summary = {}
+        for phase, times in self.phase_times.items():
+            summary[phase] = {
+                'n': len(times),
+                'mean': float(np.mean(times)),
+                'p50': float(np.percentile(times, 50)),
+                'p95': float(np.percentile(times, 95)),
+                'max': float(np.max(times)),
+            }
+        return summary
+
+    def search_snapshot(self):
+        """方策関数の探索用に、現在の盤面を複製したインスタンスを返す"""
+        return deepcopy(self)
+
+    async def capture_task(self) -> None:
+        """キャプチャデバイスからフレームを取得し続け、フレームバッファを更新する"""
+        while True:
+            frame = await asyncio.to_thread(self.read_frame)
+            if frame is not None:
+                self.frame_buffer.put(frame)
+
+    async def async_on_battle(self) -> None:
+        """ターン開始時の処理。方策関数の探索と技選択画面への移動を並行して行う"""
+        t0 = time.time()
+        if not await asyncio.to_thread(self.begin_turn):
+            return
+
+        # 盤面が確定した時点で探索を開始する。先読み探索の結果があればそれを使う
+        # 探索は複製した盤面で行うため、入力処理による盤面の更新の影響を受けない
+        if (cmd := self.pondered_command()) is not None:
+            search = asyncio.get_running_loop().create_future()
+            search.set_result(cmd)
+        else:
+            snapshot = self.search_snapshot()
+            search = asyncio.get_running_loop().run_in_executor(None, snapshot.battle_command, 0)
+
+        # 探索中にカーソルを移動して技選択画面を開き、PPを読み取る
+        await asyncio.to_thread(self.prepare_battle_input)
+        dt = time.time() - t0
+
+        # 残りの思考時間を期限として探索の完了を待つ
+        try:
+            cmd = await asyncio.wait_for(asyncio.shield(search), timeout=max(0, self.thinking_time()))
+        except asyncio.TimeoutError:
+            cmd = Battle.battle_command(self, player=0)
+            warnings.warn(f'思考時間を超過したため、コマンド{cmd}を選択します')
+
+        # 技選択画面から確定入力までを行う
+        await asyncio.to_thread(self.end_turn, cmd, dt, True)
+
+    async def async_main_loop(self, vs_NPC: bool=False, feedback_input: bool=True, ponder: bool=False, select: bool=False) -> None:
+        """Botを非同期に実行する
+
+        キャプチャ、画面認識、方策関数の探索、コマンド入力を並行するタスクとして実行する。
+            - キャプチャタスクは常に最新のフレームをフレームバッファに格納する
+            - ターン開始時には、盤面を読み取った時点で探索を開始し、
+              探索中に技選択画面への移動とPPの読み取りを行う
+            - 探索は残りの思考時間を期限とし、超過した場合はランダムなコマンドを入力する
+
+        Parameters:
+        --------------
+        main_loop()と同じ
+        """
+        self.frame_buffer = FrameBuffer()
+        capture = asyncio.create_task(self.capture_task())
+
+        try:
+            await asyncio.to_thread(self.start_loop, vs_NPC, feedback_input, ponder, select)
+
+            while not self.is_source_finished():
+                t0 = time.time()
+                await asyncio.to_thread(self.capture)
+                phase = self.read_phase(capture=False)
+                if not await asyncio.to_thread(self.enter_phase, phase):
+                    continue
+                if phase == 'battle':
+                    await self.async_on_battle()
+                else:
+                    await asyncio.to_thread(self.process_phase, phase)
+                self.record_phase_time(phase, time.time()-t0)
+        finally:
+            capture.cancel()
+            self.frame_buffer = None
 
 
 # デバッグ用
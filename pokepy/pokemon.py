@@ -7,6 +7,8 @@ from copy import deepcopy
 import random
 import warnings
 
+from pokepy.sampler import AliasTable
+
 
 def round_half_up(v: float) -> int:
     """四捨五入した値を返す"""
@@ -92,6 +94,16 @@ class Pokemon:
                     [65.0, 11.3, 11.0, 4.7, 4.5, 1.2, 0.7, 0.6, 0.4, 0.2]]
         }
 
+    Pokemon.data: GameData
+        Pokemon.init()またはPokemon.use()で有効にした読み取り専用のデータ。
+        上記を含むデータの表は、このオブジェクトの表を参照する。
+
+    Pokemon.samplers: dict
+        key: ポケモン名。
+        value: Pokemon.homeの項目ごとの使用率に従って抽選するAliasTable。
+        (例)
+        Pokemon.samplers['カイリュー']['item'].sample(rng)
+
     Pokemon.nature_corrections: dict
         key: 性格。
         value: 性格補正値リスト。
@@ -104,11 +116,11 @@ class Pokemon:
         'ドラゴン': 14, 'あく': 15, 'はがね': 16, 'フェアリー': 17, 'ステラ': 18
     }
 
-    Pokemon.type_corrections: list
+    Pokemon.type_corrections: tuple
         (例) どくタイプの技でくさおタイプに攻撃したときのタイプ補正値。
         Pokemon.type_corrections[7][4] = 2.0
     
-    Pokemon.abilities: list[str]
+    Pokemon.abilities: tuple[str]
         全ての特性。
     
     Pokemon.items: dict
@@ -166,6 +178,9 @@ class Pokemon:
     self.lost_item: str
         失ったアイテム。
     
+    self.observed_ability: str
+        対戦中に開示された特性。未開示なら空文字。
+    
     self.Ttype: str
         テラスタイプ。
     
@@ -224,6 +239,11 @@ class Pokemon:
     japanese_display_name = {}  # {各言語の表示名: 日本語の表示名}
     foreign_display_names = {}  # {日本語の表示名: [全言語の表示名]}
     home = {}
+    season = None               # 読み込んだランクマッチのシーズン
+    data = None                 # 有効なGameData
+    samplers = {}               # {ポケモン名: {項目: AliasTable}}
+    conditional_samplers = {}   # {(ポケモン名, 項目, 候補): 候補に制限したAliasTable}
+    SET_KEYS = ('nature', 'ability', 'item', 'Ttype', 'move')
 
     type_file_code = {}         # {テラスタイプ: 画像コード}
     template_file_code = {}     # {ポケモン名: テンプレート画像コード}
@@ -255,6 +275,8 @@ class Pokemon:
         'がんせきプレート':'いわ','もののけプレート':'ゴースト','りゅうのプレート':'ドラゴン','こわもてプレート':'あく','こうてつプレート':'はがね','せいれいプレート':'フェアリー',
     }
 
+    RESET_FORMS = {'テラパゴス(ステラ)': 'テラパゴス(テラスタル)'}   # {フォルム: 試合開始時に戻るフォルム}
+
     ailments = ('PSN', 'PAR', 'BRN', 'SLP', 'FLZ')
     weathers = ('sunny', 'rainy', 'snow', 'sandstorm')
     fields = ('elecfield', 'glassfield', 'psycofield', 'mistfield')
@@ -294,6 +316,7 @@ class Pokemon:
             self.org_ability = Pokemon.zukan[name]['ability'][0]
         self.item = ''
         self.lost_item = ''
+        self.observed_ability = ''      # 対戦中に開示された特性
 
         self.__status = [0]*6
         self.__indiv = [31]*6
@@ -333,8 +356,8 @@ class Pokemon:
             self.name == 'イルカマン(ナイーブ)'
             self.update_status()
 
-        if self.name == 'テラパゴス(ステラ)':
-            self.name = 'テラパゴス(テラスタル)'
+        if self.name in Pokemon.RESET_FORMS:
+            self.name = Pokemon.RESET_FORMS[self.name]
             self.org_ability = 'テラスシェル'
             self.update_status()
 
@@ -420,6 +443,29 @@ class Pokemon:
             self.Ttype = Pokemon.home[self.__name]['Ttype'][0][0]
             self.moves = Pokemon.home[self.__name]['move'][0][:4]
 
+    def apply_set(self, pokemon_set: dict):
+        """Pokemon.sample_set()で抽選した型を設定する"""
+        self.__nature = pokemon_set['nature']
+        self.org_ability = pokemon_set['ability']
+        self.item = pokemon_set['item']
+        self.Ttype = pokemon_set['Ttype']
+        self.moves = pokemon_set['moves']
+        self.update_status()
+
+    def apply_hidden_set(self, pokemon_set: dict):
+        """Battle.determinize()で抽選した型を設定する。判明している技のPPと残りHPの割合は保持する"""
+        pp = dict(zip(self.__moves, self.pp))
+        self.__nature = pokemon_set['nature']
+        self.__effort = list(pokemon_set['effort'])
+        self.ability = self.__org_ability = pokemon_set['ability']
+        if not self.lost_item:
+            self.item = pokemon_set['item']
+        if not self.terastal:
+            self.Ttype = pokemon_set['Ttype']
+        self.moves = pokemon_set['moves']
+        self.pp = [pp.get(m, v) for m, v in zip(self.__moves, self.pp)]
+        self.update_status()
+
     # Getter
     @property
     def name(self):
@@ -507,8 +553,8 @@ class Pokemon:
         else:
             self.__name = name
             self.__display_name = Pokemon.zukan[self.__name]['display_name']
-            self.__types = Pokemon.zukan[self.__name]['type'].copy()
-            self.__base = Pokemon.zukan[self.__name]['base'].copy()
+            self.__types = list(Pokemon.zukan[self.__name]['type'])
+            self.__base = list(Pokemon.zukan[self.__name]['base'])
             self.__weight = Pokemon.zukan[self.__name]['weight']
             self.update_status()
 
@@ -518,8 +564,8 @@ class Pokemon:
         else:
             self.__name = name
             self.__display_name = Pokemon.zukan[self.__name]['display_name']
-            self.__types = Pokemon.zukan[self.__name]['type'].copy()
-            self.__base = Pokemon.zukan[self.__name]['base'].copy()
+            self.__types = list(Pokemon.zukan[self.__name]['type'])
+            self.__base = list(Pokemon.zukan[self.__name]['base'])
             self.__weight = Pokemon.zukan[self.__name]['weight']
             self.update_status(keep_damage=True)
 
@@ -774,6 +820,12 @@ class Pokemon:
         return s[1:]
 
     def calculate_status(name: str, nature: str, efforts: list[int], indivs: list[int]=[31]*6) -> list[int]:
+        """ステータスを返す。個体値がすべて31なら事前に計算した表から引く"""
+        if indivs == [31]*6 and efforts == [e - e%4 for e in efforts]:
+            from pokepy.stattable import StatTable
+            # コンストラクタ (reset_game) と同様にフォルムを戻してから表を引く
+            name = Pokemon.RESET_FORMS.get(name, name)
+            return StatTable.get().status(name, nature, efforts)
         p = Pokemon(name)
         p.nature = nature
         p.indiv = indivs
@@ -781,239 +833,163 @@ class Pokemon:
         p.update_status()
         return p.status
 
-    def init(season=None):
-        """ライブラリを初期化する"""
-
-        # シーズンが指定されていなければ、最新のシーズンを取得する
-        if season is None:
-            dt_now = datetime.now(timezone(timedelta(hours=+9), 'JST'))
-            y, m, d = dt_now.year, dt_now.month, dt_now.day
-            season = max(12*(y-2022) + m - 11 - (d==1), 1)
-
-        # タイプ画像コードの読み込み
-        with open('data/terastal/codelist.txt', encoding='utf-8') as fin:
-            for line in fin:
-                data = line.split()
-                Pokemon.type_file_code[data[1]] = data[0]
-            #print(Pokemon.type_file_code)
-
-        # テンプレート画像コードの読み込み
-        with open('data/template/codelist.txt', encoding='utf-8') as fin:
-            for line in fin:
-                data = line.split()
-                Pokemon.template_file_code[data[0]] = data[1]
-            #print(Pokemon.template_file_code)
-
-        # 図鑑の読み込み
-        with open('data/zukan.txt', encoding='utf-8') as fin:
-            next(fin)
-            for line in fin:
-                data = line.split()
-                name = to_hankaku(data[1])
-                Pokemon.zukan[name] = {}
-                Pokemon.zukan[name]['type'] = [s for s in data[2:4] if s != '-' ]
-                Pokemon.zukan[name]['ability'] = [s for s in data[4:8] if s != '-' ]
-                Pokemon.zukan[name]['base'] = list(map(int, data[8:14]))
-
-                for s in Pokemon.zukan[name]['ability']:
-                    Pokemon.abilities.append(s)
-
-                # 表示名の設定
-                display_name = name
-                if 'ロトム' in name:
-                    display_name = 'ロトム'
-                else:
-                    if '(' in name:
-                        display_name = name[:display_name.find('(')]
-                    display_name = display_name.replace('パルデア','')
-                    display_name = display_name.replace('ヒスイ','')
-                    display_name = display_name.replace('ガラル','')
-                    display_name = display_name.replace('アローラ','')
-                    display_name = display_name.replace('ホワイト','')
-                    display_name = display_name.replace('ブラック','')
-                Pokemon.zukan[name]['display_name'] = display_name
-                
-                if display_name not in Pokemon.zukan_name:
-                    Pokemon.zukan_name[display_name] = [name]
-                elif name not in Pokemon.zukan_name[display_name]:
-                    Pokemon.zukan_name[display_name].append(name)
-                    # フォルム違いの差分を記録
-                    for key in ['type', 'ability']:
-                        if Pokemon.zukan[Pokemon.zukan_name[display_name][0]][key] != Pokemon.zukan[name][key]:
-                            Pokemon.form_diff[display_name] = key
-                            break
+    def build_samplers(name: str, data=None) -> dict:
+        """{name}の項目ごとの抽選テーブルを作成してGameData{data}に登録する。Noneなら有効なGameData (Pokemon.samplers) に登録する
+            使用率データがないポケモンは図鑑の特性とタイプから一様に抽選する
+        """
+        data = data or Pokemon.data
+        samplers = {}
+        if name in data.home:
+            for key in Pokemon.SET_KEYS:
+                items, weights = data.home[name][key]
+                if key == 'move':
+                    pairs = [(m, w) for m, w in zip(items, weights) if m in data.all_moves]
+                    items, weights = [m for m, _ in pairs], [w for _, w in pairs]
+                if sum(weights) > 0:
+                    samplers[key] = AliasTable(items, weights)
+
+        defaults = {
+            'nature': ['まじめ'],
+            'ability': data.zukan[name]['ability'],
+            'item': [''],
+            'Ttype': data.zukan[name]['type'][:1],
+        }
+        for key, items in defaults.items():
+            if key not in samplers:
+                samplers[key] = AliasTable(items, [1]*len(items))
 
-            Pokemon.abilities = list(set(Pokemon.abilities))
-            Pokemon.abilities.sort()
-            
-            #print(Pokemon.zukan)
-            #print(Pokemon.abilities)
-            #print(Pokemon.zukan_name)
-            #print(Pokemon.form_diff)
-
-        # 外国語名の読み込み
-        with open('data/foreign_name.txt', encoding='utf-8') as fin:
-            next(fin)
-            for line in fin:
-                data = list(map(to_hankaku, line.split()))
-                for i in range(len(data)):
-                    Pokemon.japanese_display_name[to_hankaku(data[i])] = to_hankaku(data[0])
-                Pokemon.foreign_display_names[to_hankaku(data[0])] = [to_hankaku(s) for s in data]
-            #print(Pokemon.japanese_display_name)
-            #print(Pokemon.foreign_display_names)
-
-        # 体重の読み込み
-        with open('data/weight.txt', encoding='utf-8') as fin:
-            next(fin)
-            for line in fin:
-                data = line.split()
-                Pokemon.zukan[to_hankaku(data[0])]['weight'] = float(data[1])
-
-        # 特性の読み込み
-        with open('data/ability_category.txt', encoding='utf-8') as fin:
-            for line in fin:
-                data = list(map(to_hankaku, line.split()))
-                Pokemon.ability_category[data[0]] = data[1:]
-                if 'ばけのかわ' in Pokemon.ability_category[data[0]]:
-                    Pokemon.ability_category[data[0]].append('ばけのかわ+')
-                #print(data[0]), print(Pokemon.ability_category[data[0]])
-
-        # アイテムの読み込み
-        with open('data/item.txt', encoding='utf-8') as fin:
-            next(fin)
-            for line in fin:
-                data = line.split()
-                item = to_hankaku(data[0])
-                Pokemon.items[item] = {'power': int(data[1])} # なげつける威力
-                if data[2] != '-':
-                    Pokemon.item_buff_type[item] = data[2]
-                if data[3] != '-':
-                    Pokemon.item_debuff_type[item] = data[3]
-                Pokemon.item_correction[item] = float(data[4])
-                if int(data[5]):
-                    Pokemon.consumable_items.append(item)
-
-            Pokemon.item_correction[''] = 1
-            #print(Pokemon.items)
-            #print(Pokemon.item_correction)
-
-        # 技の分類の読み込み
-        with open('data/move_category.txt', encoding='utf-8') as fin:
-            for line in fin:
-                data = list(map(to_hankaku, line.split()))
-                Pokemon.move_category[data[0]] = data[1:]
-                #print(data[0]), print(Pokemon.move_category[data[0]])
-
-        with open('data/move_value.txt', encoding='utf-8') as fin:
-            for line in fin:
-                data = line.split()
-                Pokemon.move_value[data[0]] = {}
-                for i in range(int(len(data[1:])/2)):
-                    Pokemon.move_value[data[0]][to_hankaku(data[2*i+1])] = float(data[2*i+2])
-                #print(data[0], Pokemon.move_value[data[0]])
-
-        # 技の読み込み
-        with open('data/move.txt', encoding='utf-8') as fin:
-            eng = {'物理':'phy', '特殊':'spe'}
-            next(fin)
-            for line in fin:
-                data = line.split()
-                move = to_hankaku(data[0])
-                if '変化' in data[2]:
-                    data[2] = 'sta' + format(int(data[2][2:]), '04b')
-                else:
-                    data[2] = eng[data[2]]
-                Pokemon.all_moves[move] = {
-                    'type': data[1], # タイプ
-                    'class': data[2], # 分類
-                    'power': int(data[3]), # 威力
-                    'hit': int(data[4]), # 命中率
-                    'pp': int(int(data[5])*1.6) # PP
-                }
-
-            # 威力変動技を初期化する
-            for move in Pokemon.move_category['power_var']:
-                Pokemon.all_moves[move]['power'] = 1
- 
-       # 技の優先度の読み込み
-        with open('data/move_priority.txt', encoding='utf-8') as fin:
-            for line in fin:
-                data = line.split()
-                for move in data[1:]:
-                    Pokemon.move_priority[to_hankaku(move)] = int(data[0])
-            #print(Pokemon.move_priority)
-
-       # 技の追加効果の読み込み
-        with open('data/move_effect.txt', encoding='utf-8') as fin:
-            next(fin)
-            for line in fin:
-                data = line.split()
-                move = to_hankaku(data[0])
-                Pokemon.move_effect[move] = {}
-                Pokemon.move_effect[move]['object'] = int(data[1])
-                Pokemon.move_effect[move]['prob'] = float(data[2])
-                Pokemon.move_effect[move]['rank'] = [0] + list(map(int, data[3:10]))
-                Pokemon.move_effect[move]['ailment'] = list(map(int, data[10:15]))
-                Pokemon.move_effect[move]['confusion'] = int(data[15])
-                Pokemon.move_effect[move]['flinch'] = float(data[16])
-            #print(Pokemon.move_effect)
-
-        # 連続技の読み込み
-        with open('data/combo_move.txt', encoding='utf-8') as fin:
-            for line in fin:
-                data = line.split()
-                Pokemon.combo_hit[to_hankaku(data[0])] = [int(data[1]), int(data[2])]
-            #print(Pokemon.combo_hit)
-
-        # 性格補正の読み込み
-        with open('data/nature.txt', encoding='utf-8') as fin:
-            for line in fin:
-                data = line.split()
-                Pokemon.nature_corrections[data[0]] = list(map(float, data[1:7]))
-            #print(Pokemon.nature_corrections)
-
-        # タイプ相性補正の読み込み
-        with open('data/type.txt', encoding='utf-8') as fin:
-            line = fin.readline()
-            data = line.split()
-            for i in range(len(data)):
-                Pokemon.type_id[data[i]] = i
-            for line in fin:
-                data = line.split()
-                Pokemon.type_corrections.append(list(map(float, data)))
-            #print(Pokemon.type_id)
-            #print(Pokemon.type_corrections)
-       
-        # ランクマッチの統計データの読み込み
-        filename = 'battle_data/season'+str(season)+'.json'
-        print(f'{filename}')
+        data.samplers[name] = samplers
+        return samplers
+
+    def sample_set(name: str, rng=None, constraints: dict={}, data=None) -> dict:
+        """{name}の型を使用率に従って抽選し、{'nature', 'ability', 'item', 'Ttype', 'moves'} を返す
+
+        rng: random.Random
+            乱数生成器。Noneならrandomモジュールを使う
+
+        constraints: dict
+            {項目: 値}。値が文字列なら固定し、リストなどの集合なら候補をその中に制限する。
+            'moves' には判明している技のリストを指定する。判明している技は必ず含まれ、残りを抽選で補う
+
+        data: GameData
+            使用率を参照するGameData。Noneなら有効なGameDataを参照する
+        """
+        rng = rng or random
+        data = data or Pokemon.data
+        samplers = data.samplers.get(name) or Pokemon.build_samplers(name, data)
+
+        result = {}
+        for key in ('nature', 'ability', 'item', 'Ttype'):
+            value = constraints.get(key)
+            if value is None:
+                result[key] = samplers[key].sample(rng)
+            elif type(value) == str:
+                result[key] = value
+            else:
+                cache_key = (name, key, tuple(sorted(value)))
+                if (table := data.conditional_samplers.get(cache_key)) is None:
+                    table = data.conditional_samplers[cache_key] = samplers[key].restrict(value)
+                result[key] = table.sample(rng)
+
+        moves = [m for m in constraints.get('moves', []) if m][:4]
+        if len(moves) < 4 and 'move' in samplers:
+            moves += samplers['move'].sample_distinct(4 - len(moves), rng, exclude=moves)
+        result['moves'] = moves
+
+        return result
+
+    def sample_effort(name: str, nature: str, level: int=50, speed_range: list[int]=None, r_speed: float=1,
+                      data=None) -> list[int]:
+        """性格から典型的な努力値の配分を返す
+            性格で上昇する能力に252、素早さ (または耐久) に252を振り、残りをHPに振る。
+            {speed_range}が指定されていれば、素早さ x {r_speed} がその範囲に収まるように素早さの努力値を調整し、
+            収まらなければNoneを返す
+        """
+        data = data or Pokemon.data
+        nc = data.nature_corrections[nature]
+        base = data.zukan[name]['base']
+        up = [i for i in range(1, 6) if nc[i] > 1]
+
+        effort = [0]*6
+        if not up:
+            effort[0], effort[2 if base[2] >= base[4] else 4] = 252, 252
+        elif up[0] in [1, 3]:
+            effort[up[0]], effort[5] = 252, 252
+        elif up[0] == 5:
+            effort[5], effort[1 if base[1] >= base[3] else 3] = 252, 252
+        else:
+            effort[0], effort[up[0]] = 252, 252
+        if effort[0] == 0:
+            effort[0] = 4
+
+        if speed_range is None:
+            return effort
+
+        # 素早さの努力値を範囲内で最も近い値に調整し、差分をHPに振り直す
+        from pokepy.stattable import StatTable, EFFORTS
+        speeds = (StatTable.get().stat_by_effort(name, nature, 5, level)*r_speed).astype(int)
+        allowed = EFFORTS[(speed_range[0] <= speeds) & (speeds <= speed_range[1])].tolist()
+        if not allowed:
+            return None
+        if effort[5] not in allowed:
+            e = min(allowed, key=lambda x: abs(x - effort[5]))
+            effort[0] = min(252, effort[0] + max(0, effort[5] - e))
+            effort[5] = e
+        return effort
+
+    def load_home(filename: str, zukan: dict=None) -> dict:
+        """ランクマッチの統計データ{filename}を読み込み、Pokemon.homeと同じ形式の辞書を返す
+            データの補完には図鑑{zukan} (Noneなら Pokemon.zukan) を参照する
+        """
+        zukan = zukan or Pokemon.zukan
+        home = {}
         with open(filename, encoding='utf-8') as fin:
             dict = json.load(fin)
             for org_name in dict:
                 name = to_hankaku(org_name)
-                Pokemon.home[name] = {}
-                Pokemon.home[name]['nature'] = dict[org_name]['nature']
-                Pokemon.home[name]['ability'] = dict[org_name]['ability']
-                Pokemon.home[name]['item'] = dict[org_name]['item']
-                Pokemon.home[name]['Ttype'] = dict[org_name]['Ttype']
-                Pokemon.home[name]['move'] = dict[org_name]['move']
+                home[name] = {}
+                home[name]['nature'] = dict[org_name]['nature']
+                home[name]['ability'] = dict[org_name]['ability']
+                home[name]['item'] = dict[org_name]['item']
+                home[name]['Ttype'] = dict[org_name]['Ttype']
+                home[name]['move'] = dict[org_name]['move']
 
                 # 半角表記に統一する
                 for key in ['ability','item','move']:
-                    for i,s in enumerate(Pokemon.home[name][key][0]):
-                        Pokemon.home[name][key][0][i] = to_hankaku(s)
+                    for i,s in enumerate(home[name][key][0]):
+                        home[name][key][0][i] = to_hankaku(s)
 
                 # データの補完
-                if not Pokemon.home[name]['nature'][0]:
-                    Pokemon.home[name]['nature'] = [['まじめ'], [100]]
-                if not Pokemon.home[name]['ability'][0]:
-                    Pokemon.home[name]['ability'] = [[Pokemon.zukan[name]['ability'][0]], [100]]
-                if not Pokemon.home[name]['item'][0]:
-                    Pokemon.home[name]['item'] = [[''], [100]]
-                if not Pokemon.home[name]['Ttype'][0]:
-                    Pokemon.home[name]['Ttype'] = [[Pokemon.zukan[name]['type'][0]], [100]]
-            
-            #print(Pokemon.home.keys())
+                if not home[name]['nature'][0]:
+                    home[name]['nature'] = [['まじめ'], [100]]
+                if not home[name]['ability'][0]:
+                    home[name]['ability'] = [[zukan[name]['ability'][0]], [100]]
+                if not home[name]['item'][0]:
+                    home[name]['item'] = [[''], [100]]
+                if not home[name]['Ttype'][0]:
+                    home[name]['Ttype'] = [[zukan[name]['type'][0]], [100]]
+        return home
+
+    def init(season=None):
+        """ライブラリを初期化する
+            データファイルを読み込んだGameDataを作成して有効にする。複数回呼んでもデータは重複しない
+        """
+        from pokepy.gamedata import GameData
+        Pokemon.use(GameData.load(season))
+
+    def use(data):
+        """GameData{data}を有効にする。Pokemon.zukan などのクラス変数は{data}の表を参照する"""
+        from pokepy.gamedata import GameData
+        for key in GameData.FIELDS:
+            setattr(Pokemon, key, getattr(data, key))
+        Pokemon.data = data
+
+        # 型の抽選テーブルはGameDataごとに保持する
+        Pokemon.samplers = data.samplers
+        Pokemon.conditional_samplers = data.conditional_samplers
+        for name in data.home:
+            if name not in data.samplers:
+                Pokemon.build_samplers(name, data)
 
 # ダメージ
 class Damage:
@@ -1066,6 +1042,11 @@ class Battle:
 
     インスタンス変数
     ----------------------------------------
+    self.data: GameData
+        対戦で参照する静的データ。省略すると生成時に有効なGameData (Pokemon.data) を参照する。
+        ダメージ計算や対戦シミュレーションの表の参照はこのオブジェクトを経由するため、
+        異なるGameDataを参照するBattleを同じプロセス内で同時に扱える。
+
     self.pokemon: [Pokemon, Pokemon]
         場のポケモン。
     
@@ -1078,6 +1059,9 @@ class Battle:
         self.observed[player].speed_range: list[int]
             過去のターンの行動順から判別した、とりうる素早さの範囲。[min, max]
 
+        self.observed[player].observed_ability: str
+            開示された特性。未開示なら空文字。
+
     self.condition: dict
         盤面状況。
 
@@ -1138,7 +1122,8 @@ class Battle:
     STRUGGLE = 30
     NO_COMMAND = 40
 
-    def __init__(self, seed: int=None):
+    def __init__(self, seed: int=None, data=None):
+        self.data = data if data is not None else Pokemon.data
         self.seed = seed if seed is not None else int(time.time())
         self.copy_count = 0
         self.reset_game()
@@ -1164,7 +1149,7 @@ class Battle:
         self.selected = [[], []]
         self.observed = [[], []]
         self.damage_history = []
-        self.stellar = [list(Pokemon.type_id.keys())]*2
+        self.stellar = [list(self.data.type_id.keys())]*2
 
         self.condition = {
             'sunny': 0,             # はれ 残りターン
@@ -1264,12 +1249,12 @@ class Battle:
         p1 = self.pokemon[player] # 手番
         p2 = self.pokemon[not player] # 相手側
         
-        if not move or p1.item == 'とくせいガード' or p1.ability in Pokemon.ability_category['undeniable']:
+        if not move or p1.item == 'とくせいガード' or p1.ability in self.data.ability_category['undeniable']:
             return p1.ability
 
         if move in ['シャドーレイ','フォトンゲイザー','メテオドライブ'] or \
             p2.ability in ['かたやぶり','ターボブレイズ','テラボルテージ'] or \
-            (p2.ability == 'きんしのちから' and 'sta' in Pokemon.all_moves[move]['class']):
+            (p2.ability == 'きんしのちから' and 'sta' in self.data.all_moves[move]['class']):
             return ''
 
         return p1.ability
@@ -1293,14 +1278,14 @@ class Battle:
     def move_type(self, player: int, move: str) -> str:
         """{player}の場のポケモンが{move}を使用したときの技のタイプを返す"""
         p = self.pokemon[player]
-        move_type = Pokemon.all_moves[move]['type']
+        move_type = self.data.all_moves[move]['type']
         
         if move in ['テラバースト','テラクラスター'] and p.terastal:
             return p.Ttype
         
         match p.ability:
             case 'うるおいボイス':
-                if move in Pokemon.move_category['sound']:
+                if move in self.data.move_category['sound']:
                     return 'みず'
             case 'エレキスキン':
                 if move_type == 'ノーマル':
@@ -1408,9 +1393,9 @@ class Battle:
                 elif not self.is_float(player2) and move_type == 'じめん' and t == 'ひこう':
                     continue
                 else:
-                    r *= Pokemon.type_corrections[Pokemon.type_id[move_type]][Pokemon.type_id[t]]
+                    r *= self.data.type_corrections[self.data.type_id[move_type]][self.data.type_id[t]]
                     if move == 'フライングプレス':
-                        r *= Pokemon.type_corrections[Pokemon.type_id['ひこう']][Pokemon.type_id[t]]
+                        r *= self.data.type_corrections[self.data.type_id['ひこう']][self.data.type_id[t]]
                     if r == 0:
                         if p2.item == 'ねらいのまと':
                             r = 1
@@ -1432,7 +1417,7 @@ class Battle:
         p2 = self.pokemon[player2] # 防御側
         move_type = self.move_type(player, move)
         move_class = p1.move_class(move)
-        move_power = Pokemon.all_moves[move]['power']
+        move_power = self.data.all_moves[move]['power']
 
         r = 4096
 
@@ -1519,7 +1504,7 @@ class Battle:
                 if p1.Ttype == 'ステラ' and p1.terastal:
                     r = round_half_up(r*1.25)
             case 'なげつける':
-                r = r*Pokemon.items[p1.item]['power'] if p1.item else 0
+                r = r*self.data.items[p1.item]['power'] if p1.item else 0
             case 'にぎりつぶす' | 'ハードプレス':
                 p0 = 120 if move == 'にぎりつぶす' else 100
                 r *= round_half_down(p0*p2.hp/p2.status[0])
@@ -1566,22 +1551,22 @@ class Battle:
                 if player == self.action_order[-1]:
                     r = round_half_up(r*5325/4096)
             case 'エレキスキン':
-                if Pokemon.all_moves[move]['type'] == 'ノーマル':
+                if self.data.all_moves[move]['type'] == 'ノーマル':
                     r = round_half_up(r*4915/4096)
             case 'かたいつめ':
-                if move in Pokemon.move_category['contact']:
+                if move in self.data.move_category['contact']:
                     r = round_half_up(r*5325/4096)
             case 'がんじょうあご':
-                if move in Pokemon.move_category['bite']:
+                if move in self.data.move_category['bite']:
                     r = round_half_up(r*1.5)
             case 'きれあじ':
-                if move in Pokemon.move_category['cut']:
+                if move in self.data.move_category['cut']:
                     r = round_half_up(r*1.5)
             case 'スカイスキン':
-                if Pokemon.all_moves[move]['type'] == 'ノーマル':
+                if self.data.all_moves[move]['type'] == 'ノーマル':
                     r = round_half_up(r*4915/4096)
             case 'すてみ':
-                if move in Pokemon.move_value['rebound'] or move in Pokemon.move_value['mis_rebound']:
+                if move in self.data.move_value['rebound'] or move in self.data.move_value['mis_rebound']:
                     r = round_half_up(r*4915/4096)
             case 'すなのちから':
                 if self.weather() == 'sandstorm' and move_type in ['いわ','じめん','はがね']:
@@ -1597,10 +1582,10 @@ class Battle:
                         v = 1/v
                     r = round_half_up(r*v)
             case 'ちからずく':
-                if move in Pokemon.move_category['effect']:
+                if move in self.data.move_category['effect']:
                     r = round_half_up(r*5325/4096)
             case 'てつのこぶし':
-                if move in Pokemon.move_category['punch']:
+                if move in self.data.move_category['punch']:
                     r = round_half_up(r*4915/4096)
             case 'とうそうしん':
                 match p1.sex*p2.sex:
@@ -1612,19 +1597,19 @@ class Battle:
                 if p1.ailment == 'PSN' and move_class == 'phy':
                     r = round_half_up(r*1.5)
             case 'ノーマルスキン':
-                if move != 'わるあがき' and Pokemon.all_moves[move]['type'] != 'ノーマル':
+                if move != 'わるあがき' and self.data.all_moves[move]['type'] != 'ノーマル':
                     r = round_half_up(r*4915/4096)
             case 'パンクロック':
-                if move in Pokemon.move_category['sound']:
+                if move in self.data.move_category['sound']:
                     r = round_half_up(r*5325/4096)
             case 'フェアリースキン':
-                if Pokemon.all_moves[move]['type'] == 'ノーマル':
+                if self.data.all_moves[move]['type'] == 'ノーマル':
                     r = round_half_up(r*4915/4096)
             case 'フリーズスキン':
-                if Pokemon.all_moves[move]['type'] == 'ノーマル':
+                if self.data.all_moves[move]['type'] == 'ノーマル':
                     r = round_half_up(r*4915/4096)
             case 'メガランチャー':
-                if move in Pokemon.move_category['wave']:
+                if move in self.data.move_category['wave']:
                     r = round_half_up(r*1.5)
         if r != r0:
             self.damage_log[player].append(f'{p1.ability} x{r/r0:.1f}')
@@ -1651,13 +1636,13 @@ class Battle:
                     r = round_half_up(r*5325/4096)
                     self.damage_log[player].append(p1.item) # アイテム消費判定用
             case 'パンチグローブ':
-                if move in Pokemon.move_category['punch']:
+                if move in self.data.move_category['punch']:
                     r = round_half_up(r*4506/4096)
             case 'ものしりメガネ':
                 if move_class == 'spe':
                     r = round_half_up(r*4505/4096)
-            case p1.item if p1.item in Pokemon.item_buff_type:
-                if move_type == Pokemon.item_buff_type[p1.item]:
+            case p1.item if p1.item in self.data.item_buff_type:
+                if move_type == self.data.item_buff_type[p1.item]:
                     r = round_half_up(r*4915/4096)
         if r != r0:
             self.damage_log[player].append(f'{p1.item} x{r/r0:.1f}')
@@ -1840,17 +1825,17 @@ class Battle:
         r0 = r
         match p1.ability:
             case 'わざわいのたま':
-                if move_class == 'spe' and move not in Pokemon.move_category['physical']:
+                if move_class == 'spe' and move not in self.data.move_category['physical']:
                     r = round_half_up(r*3072/4096)
             case 'わざわいのつるぎ':
-                if move_class == 'phy' or move in Pokemon.move_category['physical']:
+                if move_class == 'phy' or move in self.data.move_category['physical']:
                     r = round_half_up(r*3072/4096)
         if r != r0:
             self.damage_log[player].append(f'{p1.ability} x{r0/r:.2f}')
 
         # 防御側
-        if ((move_class == 'phy' or move in Pokemon.move_category['physical']) and p2.boost_index == 2) or \
-            (move_class == 'spe' and move not in Pokemon.move_category['physical'] and p2.boost_index == 4):
+        if ((move_class == 'phy' or move in self.data.move_category['physical']) and p2.boost_index == 2) or \
+            (move_class == 'spe' and move not in self.data.move_category['physical'] and p2.boost_index == 4):
             r = round_half_up(r*5325/4096)
             self.damage_log[player].append('ブーストエナジーBD x0.77')
 
@@ -1860,7 +1845,7 @@ class Battle:
                 if True:
                     r = round_half_up(r*1.5)
             case 'とつげきチョッキ':
-                if move_class == 'spe' and move not in Pokemon.move_category['physical']:
+                if move_class == 'spe' and move not in self.data.move_category['physical']:
                     r = round_half_up(r*1.5)
         if r != r0:
             self.damage_log[player].append(f'{p2.item} x{r0/r:.2f}')
@@ -1868,16 +1853,16 @@ class Battle:
         r0 = r
         match self.ability(player2, move):
             case 'くさのけがわ':
-                if self.condition['glassfield'] and (move_class == 'phy' or move in Pokemon.move_category['physical']):
+                if self.condition['glassfield'] and (move_class == 'phy' or move in self.data.move_category['physical']):
                     r = round_half_up(r*1.5)
             case 'すいほう':
                 if move_type == 'ほのお':
                     r = round_half_up(r*2)
             case 'ファーコート':
-                if move_class == 'phy' or move in Pokemon.move_category['physical']:
+                if move_class == 'phy' or move in self.data.move_category['physical']:
                     r = round_half_up(r*2)
             case 'ふしぎなうろこ':
-                if p2.ailment and (move_class == 'phy' or move in Pokemon.move_category['physical']):
+                if p2.ailment and (move_class == 'phy' or move in self.data.move_category['physical']):
                     r = round_half_up(r*1.5)
             case 'フラワーギフト':
                 if self.weather() == 'sunny':
@@ -1930,7 +1915,7 @@ class Battle:
         r0 = r
         match self.ability(player2, move):
             case 'かぜのり':
-                if move in Pokemon.move_category['wind']:
+                if move in self.data.move_category['wind']:
                     r = 0
                     self.damage_log[player].append(p2.ability) # 特性発動判定用
             case 'こおりのりんぷん':
@@ -1960,16 +1945,16 @@ class Battle:
                 if self.defence_type_correction(player, move) > 1:
                     r = round_half_up(r*0.75)
             case 'パンクロック':
-                if move in Pokemon.move_category['sound']:
+                if move in self.data.move_category['sound']:
                     r = round_half_up(r*0.5)
             case 'フィルター' | 'プリズムアーマー':
                 if self.defence_type_correction(player, move) > 1:
                     r = round_half_up(r*3072/4096)
             case 'ぼうおん':
-                if move in Pokemon.move_category['sound']:
+                if move in self.data.move_category['sound']:
                     r = 0
             case 'ぼうだん':
-                if move in Pokemon.move_category['bullet']:
+                if move in self.data.move_category['bullet']:
                     r = 0
             case 'ファントムガード' | 'マルチスケイル':
                 if not lethal and p2.hp == p2.status[0]:
@@ -1977,7 +1962,7 @@ class Battle:
             case 'もふもふ':
                 if move_type == 'ほのお':
                     r = round_half_up(r*2)
-                elif move in Pokemon.move_category['contact']:
+                elif move in self.data.move_category['contact']:
                     r = round_half_up(r*0.5)
         if r != r0:
             self.damage_log[player].append(f'{p2.ability} x{r/r0:.2f}')
@@ -1999,7 +1984,7 @@ class Battle:
             self.damage_log[player].append(f'{p1.item} x{r/r0:.1f}')
 
         # 壁
-        if not self.critical and p1.ability != 'すりぬけ' and move not in Pokemon.move_category['wall_break']:
+        if not self.critical and p1.ability != 'すりぬけ' and move not in self.data.move_category['wall_break']:
             if self.condition['reflector'][player2] and move_class == 'phy':
                 r = round_half_up(r*0.5)
                 self.damage_log[player].append('リフレクター x0.5')
@@ -2009,7 +1994,7 @@ class Battle:
                 self.damage_log[player].append('ひかりのかべ x0.5')
 
         # 粉技無効
-        if move in Pokemon.move_category['powder']:
+        if move in self.data.move_category['powder']:
             if self.is_overcoat(player2, move):
                 r = 0
                 self.damage_log[player].append('ぼうじん')
@@ -2023,10 +2008,10 @@ class Battle:
 
         # 半減実
         r0 = r
-        if p2.item in Pokemon.item_debuff_type and not self.is_nervous(player2):
-            if Pokemon.item_debuff_type[p2.item] == 'ノーマル' and move_type == 'ノーマル':
+        if p2.item in self.data.item_debuff_type and not self.is_nervous(player2):
+            if self.data.item_debuff_type[p2.item] == 'ノーマル' and move_type == 'ノーマル':
                 r = round_half_up(r*0.5)
-            elif r_defence_type > 1 and move_type == Pokemon.item_debuff_type[p2.item]:
+            elif r_defence_type > 1 and move_type == self.data.item_debuff_type[p2.item]:
                 r = round_half_up(r*0.5)
         if r != r0:
             self.damage_log[player].append(f'{p2.item} x{r/r0:.1f}')
@@ -2072,7 +2057,7 @@ class Battle:
 
         move_type = self.move_type(player, move)
         move_class = p1.move_class(move)
-        move_power = Pokemon.all_moves[move]['power']
+        move_power = self.data.all_moves[move]['power']
 
         if move_power == 0:
             return []
@@ -2117,9 +2102,9 @@ class Battle:
         final_attack = max(1, round_half_down(final_attack*r_attack/4096))
 
         # 最終防御・ランク補正
-        ind = 2 if move_class == 'phy' or move in Pokemon.move_category['physical'] else 4
+        ind = 2 if move_class == 'phy' or move in self.data.move_category['physical'] else 4
         final_defence = p2.status[ind]
-        r_rank = 1 if move in Pokemon.move_category['ignore_rank'] else p2.rank_correction(ind)
+        r_rank = 1 if move in self.data.move_category['ignore_rank'] else p2.rank_correction(ind)
 
         if self.ability(player, move) == 'てんねん':
             if r_rank > 1:
@@ -2222,7 +2207,7 @@ class Battle:
 
         # 加算ダメージ計算
         for move in move_list:
-            critical |= move in Pokemon.move_category['critical']
+            critical |= move in self.data.move_category['critical']
             
             for i in range(self.num_hits(player, move, n=n_hit)):
                 if i==0 or move == 'トリプルアクセル':
@@ -2572,11 +2557,11 @@ class Battle:
     
     def num_hits(self, player: int, move: str, n: int=None) -> int:
         """{player}の場のポケモンが{move}を使用したときの技の発動回数を返す"""
-        if move not in Pokemon.combo_hit:
+        if move not in self.data.combo_hit:
             return 1
         
         p1 = self.pokemon[player] # 攻撃側
-        n_min, n_max = Pokemon.combo_hit[move][0], Pokemon.combo_hit[move][1]
+        n_min, n_max = self.data.combo_hit[move][0], self.data.combo_hit[move][1]
         
         if n is not None and n_min <= n <= n_max:
             return n
@@ -2937,7 +2922,7 @@ class Battle:
                 self.add_hp(player, int(p1.status[0]/3)*r_fruit)
             case 'ヒメリのみ':
                 ind = p1.pp.index(0) if 0 in p1.pp else 0
-                p1.pp[ind] = min(Pokemon.all_moves[p1.moves[ind]]['pp'], 10*r_fruit)
+                p1.pp[ind] = min(self.data.all_moves[p1.moves[ind]]['pp'], 10*r_fruit)
                 self.log[player].append(f'{p1.moves[ind]} PP {p1.pp[ind]}')
             case 'カゴのみ' | 'クラボのみ' | 'チーゴのみ' | 'ナナシのみ' | 'モモンのみ' | 'ラムのみ':
                 self.set_ailment(player, '')
@@ -3026,7 +3011,7 @@ class Battle:
                     self.log[pl].append('かがくへんかガス 特性無効')
                     break
                 elif self.pokemon[pl].ability == 'トレース' and \
-                    self.pokemon[not pl].ability not in Pokemon.ability_category['unreproducible']:
+                    self.pokemon[not pl].ability not in self.data.ability_category['unreproducible']:
                     self.pokemon[pl].ability = self.pokemon[not pl].ability
                     self.log[pl].append(f'トレース -> {self.pokemon[not pl].ability}')
             
@@ -3050,25 +3035,25 @@ class Battle:
         if p.condition['encore'] and move != p.last_pp_move:
             return 'アンコール状態'
         # かいふくふうじ
-        if p.condition['healblock'] and (move in Pokemon.move_category['heal'] or move in Pokemon.move_value['drain']):
+        if p.condition['healblock'] and (move in self.data.move_category['heal'] or move in self.data.move_value['drain']):
             return 'かいふくふうじ状態'
         # かなしばり
         if p.condition['kanashibari'] and move == p.last_pp_move:
             return 'かなしばり状態'
         # じごくづき
-        if p.condition['jigokuzuki'] and move in Pokemon.move_category['sound']:
+        if p.condition['jigokuzuki'] and move in self.data.move_category['sound']:
             return 'じごくづき状態'
         # ちょうはつ
-        if p.condition['chohatsu'] and 'sta' in Pokemon.all_moves[move]['class']:
+        if p.condition['chohatsu'] and 'sta' in self.data.all_moves[move]['class']:
             return 'ちょうはつ状態'
         # 連発できない技
-        if move == p.last_used_move and move in Pokemon.move_category['unrepeatable']:
+        if move == p.last_used_move and move in self.data.move_category['unrepeatable']:
             return '連発'
         # こだわり
         if p.fixed_move and move != p.fixed_move:
             return 'こだわり状態'
         # とつげきチョッキ
-        if p.item == 'とつげきチョッキ' and Pokemon.all_moves[move]['class'] not in ['phy','spe']:
+        if p.item == 'とつげきチョッキ' and self.data.all_moves[move]['class'] not in ['phy','spe']:
             return 'とつげきチョッキ'
 
         return ''
@@ -3244,7 +3229,7 @@ class Battle:
                 if ability1 in ['めんえき','パステルベール']:
                     self.log[player].append(ability1)
                     return False
-                if any(t in type1 for t in ['どく','はがね']) and not (p2.ability == 'ふしょく' and move and 'sta' in Pokemon.all_moves[move]['class']):
+                if any(t in type1 for t in ['どく','はがね']) and not (p2.ability == 'ふしょく' and move and 'sta' in self.data.all_moves[move]['class']):
                     return False
             case 'PAR':
                 if 'でんき' in type1:
@@ -3432,7 +3417,7 @@ class Battle:
 
         # 必中効果
         if p1.lockon or 'ノーガード' in [p1.ability, ability2] or \
-            (self.weather(player2) == 'rainy' and move in Pokemon.move_category['rainy_hit']) or \
+            (self.weather(player2) == 'rainy' and move in self.data.move_category['rainy_hit']) or \
             (self.weather() == 'snow' and move == 'ふぶき') or \
             (move == 'どくどく' and 'どく' in p1.types):
             return 1
@@ -3449,15 +3434,15 @@ class Battle:
                 if move not in ['なみのり','うずしお']:
                     return 0
 
-        if move in Pokemon.move_category['one_ko']:
+        if move in self.data.move_category['one_ko']:
             return 0.2 if move == 'ぜったいれいど' and 'こおり' not in p1.types else 0.3
         
         # 技の命中率
-        prob = Pokemon.all_moves[move]['hit']
+        prob = self.data.all_moves[move]['hit']
 
         if self.weather(player) == 'sunny' and move in ['かみなり','ぼうふう']:
             prob *= 0.5
-        if ability2 == 'ミラクルスキン' and 'sta' in Pokemon.all_moves[move]['class'] and Pokemon.all_moves[move]['hit'] <= 100:
+        if ability2 == 'ミラクルスキン' and 'sta' in self.data.all_moves[move]['class'] and self.data.all_moves[move]['hit'] <= 100:
             prob = min(prob, 50)
 
         # 命中補正
@@ -3468,7 +3453,7 @@ class Battle:
 
         match p1.ability:
             case 'はりきり':
-                if Pokemon.all_moves[move]['class'] == 'phy':
+                if self.data.all_moves[move]['class'] == 'phy':
                     m = round_half_up(m*3277/4096)
             case 'ふくがん':
                 m = round_half_up(m*5325/4096)
@@ -3498,7 +3483,7 @@ class Battle:
 
         # ランク補正
         delta = p1.rank[6]*(ability2 != 'てんねん')
-        if p1.ability not in ['しんがん','てんねん','するどいめ','はっこう'] and move not in Pokemon.move_category['ignore_rank']:
+        if p1.ability not in ['しんがん','てんねん','するどいめ','はっこう'] and move not in self.data.move_category['ignore_rank']:
             delta -= p2.rank[7] 
         delta = max(-6, min(6, delta))
         r = (3+delta)/3 if delta >=0 else 3/(3-delta)
@@ -3512,7 +3497,7 @@ class Battle:
         p1 = self.pokemon[player] # 攻撃側
         p2 = self.pokemon[player2] # 防御側
 
-        if self.ability(player2, move) in ['シェルアーマー','カブトアーマー'] or move in Pokemon.move_category['one_ko']:
+        if self.ability(player2, move) in ['シェルアーマー','カブトアーマー'] or move in self.data.move_category['one_ko']:
             return 0
                 
         m = p1.condition['critical']
@@ -3525,9 +3510,9 @@ class Battle:
         if p1.item in ['するどいツメ','ピントレンズ']:
             m += 1
         match move:
-            case move if move in Pokemon.move_category['critical']:
+            case move if move in self.data.move_category['critical']:
                 m += 3
-            case move if move in Pokemon.move_category['semi_critical']:
+            case move if move in self.data.move_category['semi_critical']:
                 m += 1
 
         #print(1/24*(m==0) + 0.125*(m==1) + 0.5*(m==2) + 1*(m>=3))
@@ -3539,20 +3524,20 @@ class Battle:
 
         p = self.pokemon[player]
 
-        if move in Pokemon.move_priority:
-            speed += 10*Pokemon.move_priority[move]
+        if move in self.data.move_priority:
+            speed += 10*self.data.move_priority[move]
         
         match p.ability:
             case 'いたずらごころ':
-                if 'sta' in Pokemon.all_moves[move]['class']:
+                if 'sta' in self.data.all_moves[move]['class']:
                     speed += 10
                     self.log[player].append(p.ability)
             case 'はやてのつばさ':
-                if p.hp == p.status[0] and Pokemon.all_moves[move]['type'] == 'ひこう':
+                if p.hp == p.status[0] and self.data.all_moves[move]['type'] == 'ひこう':
                     speed += 10
                     self.log[player].append(p.ability)
             case 'ヒーリングシフト':
-                if move in Pokemon.move_category['heal'] or move in Pokemon.move_value['drain']:
+                if move in self.data.move_category['heal'] or move in self.data.move_value['drain']:
                     speed += 30
                     self.log[player].append(p.ability)
 
@@ -3560,7 +3545,7 @@ class Battle:
             speed += 10
 
         # 下位優先度 (1e0)
-        if p.ability == 'きんしのちから' and 'sta' in Pokemon.all_moves[move]['class']:
+        if p.ability == 'きんしのちから' and 'sta' in self.data.all_moves[move]['class']:
             speed -= 1
             self.log[player].append(p.ability)
         elif p.ability == 'クイックドロウ' and random and self._random.random() < 0.3:
@@ -3604,12 +3589,17 @@ class Battle:
 
         return True
 
+    def observe_ability(self, player: int) -> None:
+        """{player}の場のポケモンの特性を観測値に記録する"""
+        p_obs = Pokemon.find(self.observed[player], name=self.pokemon[player].name)
+        p_obs.ability = p_obs.observed_ability = self.pokemon[player].ability
+
     def complement_pokemon(self, pokemon) -> None:
         """ポケモンの情報を補完する"""
         # 技の補完
         if not pokemon.moves:
-            if pokemon.name in Pokemon.home:
-                pokemon.add_move(Pokemon.home[pokemon.name]['move'][0][0])
+            if pokemon.name in self.data.home:
+                pokemon.add_move(self.data.home[pokemon.name]['move'][0][0])
             else:
                 pokemon.add_move('テラバースト')
 
@@ -3662,6 +3652,161 @@ class Battle:
 
         return battle
 
+    def determinize(self, player: int, k: int=1, rng=None, max_trials: int=100) -> list:
+        """{player}視点で、相手の隠れた情報を観測に矛盾しないように抽選した盤面を{k}個返す
+
+            相手の選出を観測値に置き換え、性格、特性、アイテム、テラスタイプ、技、努力値を使用率に従って抽選する。
+            判明している技、アイテム、特性、テラスタル後のタイプはそのまま使い、
+            素早さの範囲 (speed_range) とダメージ履歴に矛盾する型は棄却する。
+            {max_trials}回抽選しても矛盾しない型が見つからなければ観測値をそのまま使う。
+
+        Parameters
+        ----------
+        player: int
+            視点となるプレイヤー。
+
+        k: int
+            抽選する盤面の数。
+
+        rng: random.Random
+            乱数生成器。Noneならrandomモジュールを使う。
+
+        Returns
+        ----------
+        list[Battle]
+        """
+        rng = rng or random
+        opp = int(not player)
+
+        # 相手の選出を観測値に置き換えた盤面
+        base = deepcopy(self)
+        base.copy_count += 1
+        name = base.pokemon[opp].name if base.pokemon[opp] is not None else None
+        if base.observed[opp]:
+            base.selected[opp] = deepcopy(base.observed[opp])
+        if name is not None:
+            base.pokemon[opp] = Pokemon.find(base.selected[opp], name=name)
+
+        # 型をまとめて抽選する。ダメージ履歴との照合結果は型ごとに使い回す
+        cache = {}
+        sets = [[base.sample_hidden_set(player, p, rng, cache, max_trials) for p in base.selected[opp]]
+                for _ in range(k)]
+
+        # 記録済みのダメージ履歴は書き換えないため、複製せずに共有する
+        shared = {id(dmg): dmg for dmg in base.damage_history}
+
+        worlds = []
+        for pokemon_sets in sets:
+            battle = deepcopy(base, shared.copy())
+            battle.seed = rng.randrange(1 << 31)
+            battle._random.seed(battle.seed)
+
+            for p, s in zip(battle.selected[opp], pokemon_sets):
+                if s is not None:
+                    p.apply_hidden_set(s)
+                battle.complement_pokemon(p)
+
+            # 相手が後手かつ未行動なら、相手が選択した技を抽選した技に置き換える
+            if battle.pokemon[opp] is not None and not battle.standby[player] and battle.standby[opp]:
+                battle.move[opp] = rng.choice([battle.pokemon[opp].moves[cmd]
+                                               for cmd in battle.available_commands(opp) if cmd < 10] or ['わるあがき'])
+
+            # 相手の場のポケモンが瀕死なら、交代コマンドを抽選する
+            if battle.pokemon[opp] is not None and battle.pokemon[opp].hp == 0 and (indexes := battle.changeable_indexes(opp)):
+                battle.reserved_change_commands[opp].append(20 + rng.choice(indexes))
+
+            worlds.append(battle)
+
+        return worlds
+
+    def sample_hidden_set(self, player: int, p: Pokemon, rng, cache: dict, max_trials: int=100) -> dict:
+        """{player}から見た相手のポケモン{p}の隠れた型を、観測に矛盾しないように抽選する
+            矛盾しない型が見つからなければNoneを返す
+        """
+        constraints = {'moves': p.moves}
+        if p.item or p.lost_item:
+            constraints['item'] = p.item
+        if p.observed_ability:
+            constraints['ability'] = p.observed_ability
+        if p.terastal:
+            constraints['Ttype'] = p.Ttype
+        speed_range = getattr(p, 'speed_range', None)
+
+        # 一度矛盾しない型が見つからなかったポケモンは、以降の抽選を省略する
+        if ('failed', p.name) in cache:
+            return None
+
+        for _ in range(max_trials):
+            s = Pokemon.sample_set(p.name, rng, constraints, data=self.data)
+
+            # 素早さの範囲は判明している補正で割り戻した値のため、未知のスカーフの補正を考慮する
+            r_speed = 1.5 if s['item'] == 'こだわりスカーフ' and 'item' not in constraints else 1
+            s['effort'] = Pokemon.sample_effort(p.name, s['nature'], p.level, speed_range, r_speed, data=self.data)
+            if s['effort'] is None:
+                continue
+
+            key = (p.name, s['nature'], tuple(s['effort']), s['item'], s['ability'])
+            if (consistent := cache.get(key)) is None:
+                if (scenes := cache.get(p.name)) is None:
+                    scenes = cache[p.name] = self.damage_scenes(player, p.name)
+                consistent = cache[key] = self.is_consistent_with_damages(player, p.name, s, scenes)
+            if consistent:
+                return s
+
+        cache[('failed', p.name)] = True
+        return None
+
+    def damage_scenes(self, player: int, name: str) -> list:
+        """{player}の相手のポケモン{name}が関わるダメージ履歴について、ダメージが発生した状況を再現した
+            (Damage, Battle) のリストを返す
+        """
+        opp = int(not player)
+        scenes = []
+        for dmg in self.damage_history:
+            if dmg.pokemon[opp]['_Pokemon__name'] != name or \
+                self.data.all_moves[dmg.move]['class'] not in ['phy', 'spe']:
+                continue
+            battle = Battle()
+            for pl in range(2):
+                p = dmg.pokemon[pl]
+                battle.pokemon[pl] = Pokemon(p['_Pokemon__name'], use_template=False)
+                battle.pokemon[pl].__dict__ |= deepcopy(p)
+            battle.stellar[dmg.attack_player] = dmg.stellar
+            battle.condition = dmg.condition
+            scenes.append((dmg, battle))
+        return scenes
+
+    def is_consistent_with_damages(self, player: int, name: str, pokemon_set: dict, scenes: list=None) -> bool:
+        """{player}の相手のポケモン{name}の型を{pokemon_set}としたとき、ダメージ履歴と矛盾しなければTrueを返す
+            {scenes}にはBattle.damage_scenes()の戻り値を指定できる
+        """
+        opp = int(not player)
+        if scenes is None:
+            scenes = self.damage_scenes(player, name)
+
+        for dmg, battle in scenes:
+            # 相手の型を置き換える
+            p2 = battle.pokemon[opp]
+            p2.ability = pokemon_set['ability']
+            p2.item = pokemon_set['item']
+            p2.nature = pokemon_set['nature']
+            p2.effort = list(pokemon_set['effort'])
+
+            damages = battle.oneshot_damages(dmg.attack_player, dmg.move, critical=dmg.critical)
+            if not damages:
+                continue
+
+            if dmg.attack_player == opp:
+                # 相手の攻撃 : 自分のポケモンが受けたダメージと比較する
+                if not (damages[0] <= dmg.damage <= damages[-1]):
+                    return False
+            else:
+                # 自分の攻撃 : 相手のHPは割合でしか分からないため、表示の丸めを許容して比較する
+                if not (damages[0]/p2.status[0] - 0.01 <= dmg.damage_ratio <= damages[-1]/p2.status[0] + 0.01):
+                    return False
+
+        return True
+
     def estimate_status(self, player: int, name: str, status_index: int) -> bool:
         """ダメージ履歴からポケモンのステータスと補正アイテムを推定し、観測値に上書きする。
 
@@ -3719,7 +3864,7 @@ class Battle:
 
             # 不適切な条件
             if dmg.attack_player != player or dmg.pokemon[player]['_Pokemon__name'] != name or \
-                Pokemon.all_moves[dmg.move]['class'] != cls or \
+                self.data.all_moves[dmg.move]['class'] != cls or \
                 dmg.move in ['イカサマ','ボディプレス']:
                 continue
             
@@ -3755,7 +3900,7 @@ class Battle:
             return False
 
         # 探索する性格
-        nn = p2.nature if Pokemon.nature_corrections[p2.nature][status_index] == 1 else 'まじめ'
+        nn = p2.nature if self.data.nature_corrections[p2.nature][status_index] == 1 else 'まじめ'
         nu = 'いじっぱり' if cls == 'phy' else 'ひかえめ'
         nd = 'ひかえめ' if cls == 'phy' else 'いじっぱり'
         
@@ -3788,10 +3933,10 @@ class Battle:
         match p2.item:
             case 'こだわりハチマキ':
                 if cls == 'phy':
-                    eff_status *= Pokemon.item_correction[p2.item]
+                    eff_status *= self.data.item_correction[p2.item]
             case 'こだわりメガネ':
                 if cls == 'spe':
-                    eff_status *= Pokemon.item_correction[p2.item]
+                    eff_status *= self.data.item_correction[p2.item]
         
         # 現在のA/C指数に最も近い探索条件を見つける
         i = 0
@@ -3804,10 +3949,10 @@ class Battle:
             match items[i]:
                 case 'こだわりハチマキ':
                     if cls == 'phy':
-                        st *= Pokemon.item_correction[items[i]]
+                        st *= self.data.item_correction[items[i]]
                 case 'こだわりメガネ':
                     if cls == 'spe':
-                        st *= Pokemon.item_correction[items[i]]
+                        st *= self.data.item_correction[items[i]]
 
             if +1 in signs:
                 if eff_status <= st:
@@ -3872,8 +4017,8 @@ class Battle:
 
             # 不適切な条件
             if dmg.attack_player != player or dmg.pokemon[player]['_Pokemon__name'] != name or \
-                Pokemon.all_moves[dmg.move]['class'] != cls or \
-                dmg.move in Pokemon.move_category['physical']:
+                self.data.all_moves[dmg.move]['class'] != cls or \
+                dmg.move in self.data.move_category['physical']:
                 continue
 
             # ダメージが発生した状況を再現する
@@ -3909,11 +4054,11 @@ class Battle:
             return False
 
         # 探索する性格
-        nn = p2.nature if Pokemon.nature_corrections[p2.nature][status_index] == 1 else 'まじめ'
+        nn = p2.nature if self.data.nature_corrections[p2.nature][status_index] == 1 else 'まじめ'
         nu = 'のんき' if cls == 'phy' else 'なまいき'
-        if Pokemon.nature_corrections[p2.nature][1] == 0.9:
+        if self.data.nature_corrections[p2.nature][1] == 0.9:
             nu = 'ずぶとい' if cls == 'phy' else 'おだやか'
-        elif Pokemon.nature_corrections[p2.nature][3] == 0.9:
+        elif self.data.nature_corrections[p2.nature][3] == 0.9:
             nu = 'わんぱく' if cls == 'phy' else 'しんちょう'
         
         # 探索する条件 (低耐久順)
@@ -4079,7 +4224,7 @@ class Battle:
                 elif self.command[player] == Battle.STRUGGLE:
                     self.move[player] = 'わるあがき'
                 elif self.command[player] == Battle.NO_COMMAND:
-                    if p.last_used_move in Pokemon.move_category['immovable']:
+                    if p.last_used_move in self.data.move_category['immovable']:
                         self.move[player] = None
                         self.pokemon[player].inaccessible = 0
                     else:
@@ -4168,7 +4313,7 @@ class Battle:
         for player in self.action_order:
             player2 = not player # 防御側
             move = self.move[player]
-            move_class = Pokemon.all_moves[move]['class'] if move else None
+            move_class = self.data.all_moves[move]['class'] if move else None
 
             if not any(self.breakpoint):
                 self.standby[player] = False
@@ -4205,7 +4350,7 @@ class Battle:
 
                 # こおり判定
                 elif self.pokemon[player].ailment == 'FLZ':
-                    if move in Pokemon.move_category['unfreeze'] or self._random.random() < 0.2:
+                    if move in self.data.move_category['unfreeze'] or self._random.random() < 0.2:
                         self.set_ailment(player, '')
                     else:
                         self.log[player].append('行動不能 こおり')
@@ -4273,12 +4418,12 @@ class Battle:
 
                 # ねごとによる技の変更
                 if move == 'ねごと':
-                    unselected_moves = [''] + Pokemon.move_category['non_negoto'] + Pokemon.move_category['charge']
+                    unselected_moves = ['', *self.data.move_category['non_negoto'], *self.data.move_category['charge']]
                     candidates = [move for move in self.pokemon[player].moves if move not in unselected_moves]
 
                     if self.pokemon[player].ailment == 'SLP' and candidates:
                         move = self._random.choice(candidates)
-                        move_class = Pokemon.all_moves[move]['class']
+                        move_class = self.data.all_moves[move]['class']
                         self.log[player].append(f'ねごと -> {move}')
 
                         # 技の観測
@@ -4288,12 +4433,12 @@ class Battle:
                         self.was_valid[player] = False
         
                 # まもる系の連発
-                if move in Pokemon.move_category['protect'] and \
-                    self.pokemon[player].last_used_move in Pokemon.move_category['protect']:
+                if move in self.data.move_category['protect'] and \
+                    self.pokemon[player].last_used_move in self.data.move_category['protect']:
                     self.was_valid[player] = False
 
                 # 場に出たターンしか使えない技
-                if move in Pokemon.move_category['first_act'] and self.pokemon[player].acted_turn:
+                if move in self.data.move_category['first_act'] and self.pokemon[player].acted_turn:
                     self.was_valid[player] = False
 
                 # 発動する技の確定
@@ -4312,7 +4457,7 @@ class Battle:
                         self.was_valid[player] = self.pokemon[player].ailment == 'SLP'
                     case 'じんらい' | 'ふいうち':
                         self.was_valid[player] = player == self.action_order[0] and \
-                            self.move[player2] and Pokemon.all_moves[self.move[player2]]['class'] in ['phy','spe']
+                            self.move[player2] and self.data.all_moves[self.move[player2]]['class'] in ['phy','spe']
                     case 'なげつける':
                         self.was_valid[player] = bool(self.pokemon[player].item) and self.pokemon[player].item_removable()
                     case 'はやてがえし':
@@ -4327,8 +4472,7 @@ class Battle:
                     self.log[player].append(self.pokemon[player2].ability)
                     
                     # 特性の観測
-                    Pokemon.find(self.observed[player2], name=self.pokemon[player2].name).ability = \
-                        self.pokemon[player2].ability
+                    self.observe_ability(player2)
                 
                 if 'しめりけ' in (abilities := [p.ability for p in self.pokemon]) and \
                     move in ['じばく','だいばくはつ','ビックリヘッド','ミストバースト']:
@@ -4337,29 +4481,27 @@ class Battle:
 
                     # 特性の観測
                     if abilities.index('しめりけ') == player2:
-                        Pokemon.find(self.observed[player2], name=self.pokemon[player2].name).ability = \
-                            self.pokemon[player2].ability
+                        self.observe_ability(player2)
 
                 # へんげんじざい判定
                 if self.pokemon[player].ability in ['へんげんじざい','リベロ'] and self.was_valid[player] and \
                     not self.pokemon[player].terastal and move != 'わるあがき' and \
                     self.pokemon[player].types == self.pokemon[player].org_types and \
-                    self.pokemon[player].types != [t := Pokemon.all_moves[move]['type']]:
+                    self.pokemon[player].types != [t := self.data.all_moves[move]['type']]:
                     self.pokemon[player].lost_types += self.pokemon[player].types
                     self.pokemon[player].added_types += [t]
                     self.log[player].append(f'{self.pokemon[player].ability} {t}タイプ')
 
                     # 特性の観測
-                    Pokemon.find(self.observed[player], name=self.pokemon[player].name).ability = \
-                        self.pokemon[player].ability
+                    self.observe_ability(player)
 
                 # ため技
-                if move in Pokemon.move_category['charge'] + Pokemon.move_category['hide']:
+                if move in self.data.move_category['charge'] + self.data.move_category['hide']:
                     self.pokemon[player].inaccessible = not self.pokemon[player].inaccessible
 
                     if self.pokemon[player].inaccessible:
                         # 発動前処理
-                        if move in Pokemon.move_category['hide']:
+                        if move in self.data.move_category['hide']:
                             self.pokemon[player].hide_move = move
                         else:
                             match move:
@@ -4382,8 +4524,8 @@ class Battle:
                 self.pokemon[player].hide_move = ''
                         
                 # 強制反動技
-                if move in Pokemon.move_value['force_rebound'] and self.was_valid[player] and \
-                    self.add_hp(player, -round_half_up(self.pokemon[player].status[0] * Pokemon.move_value['force_rebound'][move])):
+                if move in self.data.move_value['force_rebound'] and self.was_valid[player] and \
+                    self.add_hp(player, -round_half_up(self.pokemon[player].status[0] * self.data.move_value['force_rebound'][move])):
                     self.log[player].insert(-1, '反動')
                     if self.pokemon[player].hp == 0 and self.winner(record=True) is not None: # 勝敗判定
                         return
@@ -4396,15 +4538,14 @@ class Battle:
                 # あくタイプによるいたずらごころ無効
                 if self.pokemon[player].ability == 'いたずらごころ' and 'あく' in self.pokemon[player2].types and \
                     self.pokemon[player].last_pp_move and self.pokemon[player].last_used_move and \
-                    (Pokemon.all_moves[self.pokemon[player].last_pp_move]['class'][-3] == '1' or \
-                    ('sta' in Pokemon.all_moves[self.pokemon[player].last_pp_move]['class'] and \
-                     Pokemon.all_moves[self.pokemon[player].last_used_move]['class'] in ['phy','spe'])):
+                    (self.data.all_moves[self.pokemon[player].last_pp_move]['class'][-3] == '1' or \
+                    ('sta' in self.data.all_moves[self.pokemon[player].last_pp_move]['class'] and \
+                     self.data.all_moves[self.pokemon[player].last_used_move]['class'] in ['phy','spe'])):
                     self.was_valid[player] = False
                     self.log[player].append('いたずらごころ無効')
 
                     # 特性の観測
-                    Pokemon.find(self.observed[player], name=self.pokemon[player].name).ability = \
-                        self.pokemon[player].ability
+                    self.observe_ability(player)
 
                 # わざが無効なら中断
                 if not self.was_valid[player]:
@@ -4412,7 +4553,7 @@ class Battle:
                     continue
 
                 # まもる判定
-                if self.protect and move not in Pokemon.move_category['unprotect'] and \
+                if self.protect and move not in self.data.move_category['unprotect'] and \
                     not (self.pokemon[player].ability == 'ふかしのこぶし' and self.pokemon[player].contacts(move)):
 
                     self.was_valid[player2] = move_class in ['phy','spe']
@@ -4436,8 +4577,8 @@ class Battle:
                                     self.add_rank(player, 5, -1, by_enemy=True)
 
                         # 反動ダメージ             
-                        if move in Pokemon.move_value['mis_rebound'] and \
-                            self.add_hp(player, -int(self.pokemon[player].status[0] * Pokemon.move_value['mis_rebound'][move])):
+                        if move in self.data.move_value['mis_rebound'] and \
+                            self.add_hp(player, -int(self.pokemon[player].status[0] * self.data.move_value['mis_rebound'][move])):
                             self.log[player].insert(-1, '反動')
 
                         self.pokemon[player].inaccessible = 0
@@ -4452,7 +4593,7 @@ class Battle:
 
                 for i in range(n_hit):
                     # 命中判定
-                    if i == 0 or Pokemon.combo_hit[move][1] in [3,10]:
+                    if i == 0 or self.data.combo_hit[move][1] in [3,10]:
                         hits = self._random.random() < self.hit_probability(player, move)
                         
                     if not hits:
@@ -4463,26 +4604,26 @@ class Battle:
                         else:
                             self.log[player].append(f'{i}ヒット')
 
-                        if move in Pokemon.move_value['mis_rebound'] and \
-                            self.add_hp(player, -int(self.pokemon[player].status[0] * Pokemon.move_value['mis_rebound'][move])):
+                        if move in self.data.move_value['mis_rebound'] and \
+                            self.add_hp(player, -int(self.pokemon[player].status[0] * self.data.move_value['mis_rebound'][move])):
                             self.log[player].insert(-1, '反動')
 
                         if i == 0 and self.pokemon[player].item == 'からぶりほけん' and \
-                            move not in Pokemon.move_category['one_ko'] and self.pokemon[player].rank[5] < 6:
+                            move not in self.data.move_category['one_ko'] and self.pokemon[player].rank[5] < 6:
                                 self.consume_item(player)
                                 self.was_valid[player] = True
                         
                         break
                     
                     # 攻撃技の処理
-                    if Pokemon.all_moves[move]['class'] in ['phy', 'spe']:                    
+                    if self.data.all_moves[move]['class'] in ['phy', 'spe']:                    
                         # 急所判定
                         critical = self._random.random() < self.critical_probability(player, move)
                         if critical:
                             self.log[player].append('急所')
 
                         # ダメージ計算
-                        if Pokemon.all_moves[move]['power'] > 0:
+                        if self.data.all_moves[move]['power'] > 0:
                             pf = i+1 if move == 'トリプルアクセル' else 1
                             oneshot_damages = self.oneshot_damages(player, move, critical=critical, power_factor=pf)
                             self.damage[player] = self.choose_damage(player, oneshot_damages) if oneshot_damages else 0
@@ -4513,7 +4654,7 @@ class Battle:
                                     self.damage[player] = int(self.pokemon[player2].hp/2)
                                 case 'カウンター' | 'ミラーコート':
                                     s = 'phy' if move == 'カウンター' else 'spe'
-                                    if self.pokemon[player2].last_used_move and Pokemon.all_moves[self.pokemon[player2].last_used_move]['class'] == s:
+                                    if self.pokemon[player2].last_used_move and self.data.all_moves[self.pokemon[player2].last_used_move]['class'] == s:
                                         self.damage[player] = int(self.damage[player2]*2)
                                 case 'ほうふく' | 'メタルバースト':
                                     self.damage[player] = int(self.damage[player2]*1.5)
@@ -4534,7 +4675,7 @@ class Battle:
                             self.was_valid[player] = False
                         else:
                             # 壁破壊
-                            if self.damage[player] and move in Pokemon.move_category['wall_break']:
+                            if self.damage[player] and move in self.data.move_category['wall_break']:
                                 if self.condition['reflector'][player2] + self.condition['lightwall'][player2]:
                                     self.condition['reflector'][player2] = self.condition['lightwall'][player2] = 0
                                     self.log[player].append('かべ破壊')
@@ -4546,7 +4687,7 @@ class Battle:
                                     self.consume_item(j)
 
                             # ダメージ付与
-                            substituted = self.pokemon[player2].sub_hp and move not in Pokemon.move_category['sound'] and self.pokemon[player].ability != 'すりぬけ'
+                            substituted = self.pokemon[player2].sub_hp and move not in self.data.move_category['sound'] and self.pokemon[player].ability != 'すりぬけ'
                             if substituted:
                                 # ダメージ上限 = みがわり残りHP
                                 self.damage[player] = min(self.pokemon[player2].sub_hp, self.damage[player])
@@ -4581,8 +4722,7 @@ class Battle:
                                             self.log[player].append(self.pokemon[player2].ability)
 
                                             # 特性の観測
-                                            Pokemon.find(self.observed[player2], name=self.pokemon[player2].name).ability = \
-                                                self.pokemon[player2].ability
+                                            self.observe_ability(player2)
 
                                         elif self.pokemon[player2].item == 'きあいのタスキ':
                                             self.damage[player] -= 1
@@ -4600,8 +4740,8 @@ class Battle:
                                     return
 
                             # 追加効果 (ランク変化・状態異常・ひるみ)
-                            if move in Pokemon.move_effect:
-                                effect = Pokemon.move_effect[move]
+                            if move in self.data.move_effect:
+                                effect = self.data.move_effect[move]
                                 pl = (effect['object'] + player) % 2
                                 p = self.pokemon[pl]
                                 r_prob = 2 if self.pokemon[player].ability == 'てんのめぐみ' else 1
@@ -4631,7 +4771,7 @@ class Battle:
                             if not substituted and self.can_move_affects(player, move):
                                 # わざ以外のひるみ判定
                                 if self.pokemon[player2].ability != 'せいしんりょく' and not self.flinch and \
-                                    (move not in Pokemon.move_effect or (move in Pokemon.move_effect and Pokemon.move_effect[move]['flinch'] == 0)):
+                                    (move not in self.data.move_effect or (move in self.data.move_effect and self.data.move_effect[move]['flinch'] == 0)):
                                     if self.pokemon[player].ability == 'あくしゅう':
                                         self.flinch = self._random.random() < 0.1
                                     elif self.pokemon[player].item in ['おうじゃのしるし','するどいキバ']:
@@ -4690,8 +4830,8 @@ class Battle:
                                 p_obs.item, p_obs.lost_item = self.pokemon[player].item, self.pokemon[player].lost_item
 
                             # HP吸収
-                            if move in Pokemon.move_value['drain'] and self.damage[player] and \
-                                self.add_hp(player, self.absorbed_value(player, Pokemon.move_value['drain'][move]*self.damage[player])):
+                            if move in self.data.move_value['drain'] and self.damage[player] and \
+                                self.add_hp(player, self.absorbed_value(player, self.data.move_value['drain'][move]*self.damage[player])):
                                 self.log[player].insert(-1, 'HP吸収')
 
                             # みがわりを攻撃した場合は、与えたダメージを0とする
@@ -4699,7 +4839,7 @@ class Battle:
                                 self.damage[player] = 0
 
                             if move == 'コアパニッシャー' and not substituted:
-                                if player == self.action_order[-1] and self.pokemon[player2].ability not in Pokemon.ability_category['protected']:
+                                if player == self.action_order[-1] and self.pokemon[player2].ability not in self.data.ability_category['protected']:
                                     self.log[player].append(f'追加効果 {self.pokemon[player2].ability}消失')
                                     self.pokemon[player2].ability = ''
 
@@ -4727,8 +4867,7 @@ class Battle:
 
                                 # 特性の観測
                                 if observed:
-                                    Pokemon.find(self.observed[player], name=self.pokemon[player].name).ability = \
-                                        self.pokemon[player].ability
+                                    self.observe_ability(player)
 
                             # 防御側の特性
                             if not substituted:
@@ -4777,7 +4916,7 @@ class Battle:
                                             self.log[player2].insert(-1, self.pokemon[player2].ability)
                                             observed = True
                                     case 'ふうりょくでんき':
-                                        if move in Pokemon.move_category['wind'] and not self.pokemon[player2].condition['charge']:
+                                        if move in self.data.move_category['wind'] and not self.pokemon[player2].condition['charge']:
                                             self.pokemon[player2].condition['charge'] = 1
                                             self.log[player2].append(f'{self.pokemon[player2].ability} じゅうでん')
                                             observed = True
@@ -4791,7 +4930,7 @@ class Battle:
                                             observed = True
 
                                 # 物理攻撃時のみ
-                                match self.pokemon[player2].ability * (Pokemon.all_moves[move]['class'] == 'phy'):
+                                match self.pokemon[player2].ability * (self.data.all_moves[move]['class'] == 'phy'):
                                     case 'くだけるよろい':
                                         if self.add_rank(player2, 0, 0, [0,0,-1,0,0,2]):
                                             self.log[player2].insert(-1, self.pokemon[player2].ability)
@@ -4859,8 +4998,7 @@ class Battle:
 
                                 # 特性の観測
                                 if observed:
-                                    Pokemon.find(self.observed[player2], name=self.pokemon[player2].name).ability = \
-                                        self.pokemon[player2].ability
+                                    self.observe_ability(player2)
 
                             # やきつくす判定
                             if move == 'やきつくす' and self.pokemon[player2].item and \
@@ -4884,13 +5022,13 @@ class Battle:
                             if not substituted and self.pokemon[player2].hp:
                                 match self.pokemon[player2].item:
                                     case 'きゅうこん' | 'ひかりごけ':
-                                        if Pokemon.all_moves[move]['type'] == 'みず':
+                                        if self.data.all_moves[move]['type'] == 'みず':
                                             self.consume_item(player2)
                                     case 'じゅうでんち':
-                                        if Pokemon.all_moves[move]['type'] == 'でんき':
+                                        if self.data.all_moves[move]['type'] == 'でんき':
                                             self.consume_item(player2)
                                     case 'ゆきだま':
-                                        if Pokemon.all_moves[move]['type'] == 'こおり':
+                                        if self.data.all_moves[move]['type'] == 'こおり':
                                             self.consume_item(player2)
                                     case 'じゃくてんほけん':
                                         if self.defence_type_correction(player, move) > 1:
@@ -4901,10 +5039,10 @@ class Battle:
                                         if self.defence_type_correction(player, move) > 1:
                                             self.consume_item(player2)
                                     case 'ジャポのみ':
-                                        if Pokemon.all_moves[move]['class'] == 'phy':
+                                        if self.data.all_moves[move]['class'] == 'phy':
                                             self.consume_item(player2)
                                     case 'レンブのみ':
-                                        if Pokemon.all_moves[move]['class'] == 'spe':
+                                        if self.data.all_moves[move]['class'] == 'spe':
                                             self.consume_item(player2)
 
                             # みちづれ判定
@@ -4919,8 +5057,8 @@ class Battle:
                             if move == 'わるあがき':
                                 self.add_hp(player, -round_half_up(self.pokemon[player].status[0]/4), move=move)
                                 self.log[player].insert(-1, '反動')
-                            elif move in Pokemon.move_value['rebound'] and self.damage[player] and self.pokemon[player].ability != 'いしあたま' and \
-                                self.add_hp(player, -round_half_up(self.damage[player]*Pokemon.move_value['rebound'][move])):
+                            elif move in self.data.move_value['rebound'] and self.damage[player] and self.pokemon[player].ability != 'いしあたま' and \
+                                self.add_hp(player, -round_half_up(self.damage[player]*self.data.move_value['rebound'][move])):
                                 self.log[player].insert(-1, '反動')
 
                             # わざ効果
@@ -4955,7 +5093,7 @@ class Battle:
                             # わざ効果 (みがわりに無効化される)
                             if not substituted:
                                 # バインド技
-                                if move in Pokemon.move_category['bind'] and self.pokemon[player2].condition['bind'] == 0:
+                                if move in self.data.move_category['bind'] and self.pokemon[player2].condition['bind'] == 0:
                                     turn = 7 if self.pokemon[player].item == 'ねばりのかぎづめ' else 5
                                     ratio = 6 if self.pokemon[player].item == 'しめつけバンド' else 8
                                     self.pokemon[player2].condition['bind'] = turn + 0.1 * ratio
@@ -5021,7 +5159,7 @@ class Battle:
                                 
                             # 相手のこおり状態の解除
                             if self.pokemon[player2].ailment == 'FLZ' and self.damage[player] and \
-                                (Pokemon.all_moves[move]['type'] == 'ほのお' or move in Pokemon.move_category['unfreeze']):
+                                (self.data.all_moves[move]['type'] == 'ほのお' or move in self.data.move_category['unfreeze']):
                                 self.set_ailment(player2, '')
 
                     # 変化技の処理
@@ -5035,8 +5173,7 @@ class Battle:
                             self.log[player].append('マジックミラー')
 
                             # 特性の観測
-                            Pokemon.find(self.observed[player2], name=self.pokemon[player2].name).ability = \
-                                self.pokemon[player2].ability
+                            self.observe_ability(player2)
 
                         # みがわりによる無効
                         self.was_valid[player] = self.pokemon[pl2].sub_hp == 0 or move_class[-2] == '0'
@@ -5049,8 +5186,7 @@ class Battle:
                                 self.was_valid[player] = False
 
                                 # 特性の観測
-                                Pokemon.find(self.observed[player2], name=self.pokemon[player2].name).ability = \
-                                    self.pokemon[player2].ability
+                                self.observe_ability(player2)
 
                         if self.was_valid[player]:
                             match move:
@@ -5101,7 +5237,7 @@ class Battle:
                                 case 'アンコール':
                                     self.was_valid[player] = self.pokemon[pl2].condition['encore'] == 0 and \
                                         self.ability(pl2, move) != 'アロマベール' and bool(self.pokemon[pl2].last_pp_move) and \
-                                        self.pokemon[pl2].last_pp_move not in Pokemon.move_category['non_encore'] and \
+                                        self.pokemon[pl2].last_pp_move not in self.data.move_category['non_encore'] and \
                                         self.pokemon[pl2].pp[self.pokemon[pl2].last_pp_move_index()] > 0
                                     if self.was_valid[player]:
                                         self.pokemon[pl2].condition['encore'] = 3
@@ -5149,7 +5285,7 @@ class Battle:
                                     self.was_valid[player] = bool(self.add_rank(pl2, 4, -2, by_enemy=True)) and pl2 == player2
                                 case 'うつしえ' | 'なりきり':
                                     self.was_valid[player] = not self.pokemon[pl1].has_protected_ability() and \
-                                        self.pokemon[pl2].ability not in Pokemon.ability_category['unreproducible'] and \
+                                        self.pokemon[pl2].ability not in self.data.ability_category['unreproducible'] and \
                                         self.pokemon[pl1].ability != self.pokemon[pl2].ability
                                     if self.was_valid[player]:
                                         self.pokemon[pl1].ability = self.pokemon[pl2].ability
@@ -5364,7 +5500,7 @@ class Battle:
                                     if self.was_valid[player]:
                                         p = self.pokemon[pl1]
                                         p.lost_types += p.types
-                                        p.added_types = [Pokemon.all_moves[p.moves[0]]['type']]
+                                        p.added_types = [self.data.all_moves[p.moves[0]]['type']]
                                         self.log[player].append(f'-> {p.types[0]}タイプ')
                                 case 'でんじふゆう':
                                     self.was_valid[player] = self.pokemon[pl1].condition['magnetrise'] == 0
@@ -5577,8 +5713,7 @@ class Battle:
 
                     # 特性の観測
                     if ability:
-                        Pokemon.find(self.observed[pl2], name=self.pokemon[pl2].name).ability = \
-                        self.pokemon[pl2].ability
+                        self.observe_ability(pl2)
 
                     # 即時発動アイテムの判定 (攻撃中)
                     for j in [player, player2]:
@@ -5599,13 +5734,13 @@ class Battle:
                         # テラバーストのランク下降
                         if self.add_rank(player, 0, 0, rank_list=[0,-1,0,-1]):
                             self.log[player].insert(-1, '追加効果')
-                    elif ((t := Pokemon.all_moves[move]['type']) in self.stellar[player]) and 'テラパゴス' not in self.pokemon[player].name:
+                    elif ((t := self.data.all_moves[move]['type']) in self.stellar[player]) and 'テラパゴス' not in self.pokemon[player].name:
                         # 一度強化したタイプをリストから削除
                         self.stellar[player].remove(t)
                         self.log[player].append(f"ステラ {t}消費")
 
                 # 反動で動けない技
-                if move in Pokemon.move_category['immovable'] and self.was_valid[player]:
+                if move in self.data.move_category['immovable'] and self.was_valid[player]:
                     self.pokemon[player].inaccessible = 1
 
                 # 攻撃側の特性
@@ -5634,8 +5769,7 @@ class Battle:
 
                     # 特性の観測
                     if observed:
-                        Pokemon.find(self.observed[player], name=self.pokemon[player].name).ability = \
-                            self.pokemon[player].ability
+                        self.observe_ability(player)
 
                 # 防御側の特性
                 if self.damage[player]:
@@ -5643,10 +5777,10 @@ class Battle:
 
                     match self.pokemon[player2].ability:
                         case 'へんしょく':
-                            if self.pokemon[player2].types != [Pokemon.all_moves[move]['type']]:
+                            if self.pokemon[player2].types != [self.data.all_moves[move]['type']]:
                                 self.pokemon[player2].lost_types += self.pokemon[player2].types
-                                self.pokemon[player2].added_types = [Pokemon.all_moves[move]['type']]
-                                self.log[player2].append(f"{self.pokemon[player2].ability} -> {Pokemon.all_moves[move]['type']}")
+                                self.pokemon[player2].added_types = [self.data.all_moves[move]['type']]
+                                self.log[player2].append(f"{self.pokemon[player2].ability} -> {self.data.all_moves[move]['type']}")
                                 observed = True
                         case 'ぎゃくじょう':
                             if self.pokemon[player2].berserk_triggered and self.add_rank(player2, 3, +1):
@@ -5661,8 +5795,7 @@ class Battle:
 
                     # 特性の観測
                     if observed:
-                        Pokemon.find(self.observed[player2], name=self.pokemon[player2].name).ability = \
-                            self.pokemon[player2].ability
+                        self.observe_ability(player2)
 
 
                 # 被弾時に発動するアイテム
@@ -5672,10 +5805,10 @@ class Battle:
                             if self.available_commands(player, phase='change'):
                                 self.consume_item(player2)
                         case 'アッキのみ':
-                            if Pokemon.all_moves[move]['class'] == 'phy':
+                            if self.data.all_moves[move]['class'] == 'phy':
                                 self.consume_item(player2)
                         case 'タラプのみ':
-                            if Pokemon.all_moves[move]['class'] == 'spe':
+                            if self.data.all_moves[move]['class'] == 'spe':
                                 self.consume_item(player2)
 
                 observed = False
@@ -5772,7 +5905,7 @@ class Battle:
 
             if not any(self.breakpoint):
                 # あばれる状態の判定
-                if move in Pokemon.move_category['continuous']:
+                if move in self.data.move_category['continuous']:
                     if self.pokemon[player].inaccessible == 0:
                         self.pokemon[player].inaccessible = self._random.randint(1,2)
                         self.log[player].append(f'{move} 残り{self.pokemon[player].inaccessible}ターン')
@@ -5785,7 +5918,7 @@ class Battle:
                                 self.log[player].append(f'{move}解除 こんらん')
 
                 if self.pokemon[player].hp and self.pokemon[player].item == 'のどスプレー' and \
-                    self.pokemon[player].last_used_move in Pokemon.move_category['sound']:
+                    self.pokemon[player].last_used_move in self.data.move_category['sound']:
                     self.consume_item(player)
 
                 # 即時発動アイテムの判定 (手番が移る直前)
@@ -5860,8 +5993,7 @@ class Battle:
 
                 # 特性の観測
                 if observed:
-                    Pokemon.find(self.observed[player], name=self.pokemon[player].name).ability = \
-                        self.pokemon[player].ability
+                    self.observe_ability(player)
 
             if self.winner(record=True) is not None: # 勝敗判定
                 return
@@ -5904,8 +6036,7 @@ class Battle:
                 
                     # 特性の観測
                     if observed:
-                        Pokemon.find(self.observed[player], name=self.pokemon[player].name).ability = \
-                            self.pokemon[player].ability
+                        self.observe_ability(player)
 
             # たべのこし
             for player in self.speed_order:
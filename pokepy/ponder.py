@@ -0,0 +1,178 @@
+from pokepy.pokemon import *
+from pokepy.sharedtables import worker_pool
+import os
+
+
+def board_key(battle: Battle, hp_bins: int=10) -> tuple:
+    """盤面の照合に用いるキーを返す
+        場のポケモン、HP割合 ({hp_bins}段階)、状態異常、能力ランク、テラスタルの有無、
+        および発生している場の状態の組み合わせ
+    """
+    key = []
+    for p in battle.pokemon:
+        hp_bin = min(hp_bins-1, int(p.hp_ratio*hp_bins))
+        key.append((p.name, hp_bin, p.ailment, tuple(p.rank[1:]), p.terastal))
+
+    fields = []
+    for s, v in battle.condition.items():
+        if (any(v) if type(v) == list else v):
+            fields.append(s)
+    key.append(tuple(fields))
+
+    return tuple(key)
+
+def expected_damage_ratio(battle: Battle, player: int, move: str) -> float:
+    """{player}が{move}を使ったときの、相手の残りHPに対するダメージの期待値の割合 (上限1)。ダメージがない技なら0"""
+    defender = battle.pokemon[not player]
+    if not defender.hp or not (damages := battle.oneshot_damages(player, move)):
+        return 0.
+    n_hits = battle.data.combo_hit[move][1] if move in battle.data.combo_hit else 1
+    return min(1., n_hits*sum(damages)/len(damages)/defender.hp)
+
+def search(battle: Battle, player: int) -> int:
+    """ワーカープロセスで実行する探索"""
+    battle.t0 = time.time()
+    return battle.battle_command(player)
+
+
+class Ponderer:
+    """相手の行動や技の演出を待つ間に、次のターンの盤面を予測して先読み探索するクラス
+
+    自分のコマンドが確定した時点で、相手の予想コマンドごとに現在の盤面からターンを進めた盤面を生成し、
+    ワーカープロセスで方策関数battle_command()を実行する。
+    次のターン開始時に読み取った盤面と予測した盤面のキーが一致すれば、先読みした結果を返す。
+    """
+
+    STATUS_SCORE = 0.2      # 変化技の選ばれやすさ
+    TERASTAL_FACTOR = 0.5   # テラスタルして技を選ぶ場合の係数
+    SWITCH_FACTOR = 0.5     # 交代の選ばれやすさの係数
+
+    def __init__(self, max_workers: int=None, max_predictions: int=8, hp_bins: int=10, wait: float=0):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2)//2)
+        self.max_predictions = max_predictions  # 探索する予測盤面の上限
+        self.hp_bins = hp_bins                  # 盤面の照合に用いるHP割合の分解能
+        self.wait = wait                        # 探索中の結果を待つ時間 [s]
+        self.pool = None
+        self.futures = {}                       # {盤面キー: Future}
+        self.n_hits, self.n_lookups = 0, 0
+
+    def __getstate__(self):
+        # プロセスプールは複製しない
+        state = self.__dict__.copy()
+        state['pool'], state['futures'] = None, {}
+        return state
+
+    def command_scores(self, battle: Battle, player: int) -> dict[int, float]:
+        """{player}のコマンドごとの選ばれやすさを、1手先のダメージから見積もる
+            技: 相手の残りHPに対するダメージの期待値の割合 (倒せるなら1)。変化技は STATUS_SCORE
+            テラスタルして技: 技の値の TERASTAL_FACTOR 倍 (1試合に1度しか使えないため温存されやすい)
+            交代: 場のポケモンが相手から受ける最大のダメージ割合と、交代先が受ける最大のダメージ割合の差の SWITCH_FACTOR 倍
+        """
+        p = battle.pokemon[player]
+        opponent_moves = [m for m in battle.pokemon[not player].moves if m]
+
+        def threat() -> float:
+            return max([expected_damage_ratio(battle, not player, m) for m in opponent_moves], default=0.)
+
+        scores, current_threat = {}, None
+        for cmd in battle.available_commands(player):
+            if cmd < 20:
+                move = p.moves[cmd % 10]
+                if battle.data.all_moves[move]['class'][:3] == 'sta':
+                    score = Ponderer.STATUS_SCORE
+                else:
+                    score = expected_damage_ratio(battle, player, move)
+                scores[cmd] = score*Ponderer.TERASTAL_FACTOR if cmd >= 10 else score
+            elif cmd < 30:
+                if current_threat is None:
+                    current_threat = threat()
+                # 交代先を一時的に場に出して、受けるダメージを見積もる
+                battle.pokemon[player] = battle.selected[player][cmd - 20]
+                try:
+                    scores[cmd] = Ponderer.SWITCH_FACTOR*max(0., current_threat - threat())
+                finally:
+                    battle.pokemon[player] = p
+            else:
+                scores[cmd] = 0.
+        return scores
+
+    def likely_commands(self, battle: Battle, player: int) -> list[int]:
+        """{player}が選択しうるコマンドを、選ばれやすい順に返す
+            同じ値なら 技、交代、テラスタルして技 の順
+        """
+        try:
+            scores = self.command_scores(battle, player)
+        except Exception as e:
+            warnings.warn(f'コマンドの見積もりに失敗しました {e}')
+            scores = {}
+        commands = battle.available_commands(player)
+        return sorted(commands, key=lambda cmd: (-scores.get(cmd, 0.), cmd in range(10, 20), cmd in range(20, 30)))
+
+    def clear(self) -> None:
+        """探索結果を破棄する。探索待ちの盤面はキャンセルする"""
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+
+    def start(self, battle: Battle, player: int=0) -> int:
+        """{player}のコマンドbattle.command[player]が確定した時点で呼び、次のターンの盤面の探索を開始する
+            探索を開始した盤面の数を返す
+        """
+        self.clear()
+        if self.pool is None:
+            self.pool = worker_pool(self.max_workers)
+
+        base = battle.clone(player)
+        cmd = battle.command[player]
+
+        for c in self.likely_commands(base, not player)[:self.max_predictions]:
+            predicted = deepcopy(base)
+            commands = [cmd, c] if player == 0 else [c, cmd]
+
+            # 瀕死による交代が発生した場合は、方策関数に従って交代する
+            try:
+                predicted.proceed(commands=commands)
+            except Exception as e:
+                warnings.warn(f'盤面の予測に失敗しました {commands} {e}')
+                continue
+
+            if predicted.winner() is not None or not all(p.hp for p in predicted.pokemon):
+                continue
+
+            key = board_key(predicted, self.hp_bins)
+            if key in self.futures:
+                continue
+
+            predicted.phase = 'battle'
+            self.futures[key] = self.pool.submit(search, predicted, player)
+
+        return len(self.futures)
+
+    def result(self, battle: Battle, player: int=0):
+        """盤面{battle}に一致する先読み探索の結果を返す。結果がなければNoneを返す"""
+        self.n_lookups += 1
+        future = self.futures.pop(board_key(battle, self.hp_bins), None)
+        self.clear()
+
+        if future is None:
+            return None
+        try:
+            cmd = future.result(timeout=self.wait)
+        except TimeoutError:
+            return None
+        except Exception as e:
+            warnings.warn(f'先読み探索に失敗しました {e}')
+            return None
+
+        if cmd not in battle.available_commands(player):
+            return None
+
+        self.n_hits += 1
+        print(f'先読み探索の結果を使用 コマンド {cmd} ({self.n_hits}/{self.n_lookups})')
+        return cmd
+
+    def shutdown(self) -> None:
+        self.clear()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
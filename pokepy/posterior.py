@@ -0,0 +1,269 @@
+from pokepy.pokemon import *
+from pokepy.stattable import StatTable
+import numpy as np
+
+
+# 努力値の配分の候補 [H, A, B, C, D, S]
+SPREADS = {
+    'AS': [4, 252, 0, 0, 0, 252],
+    'CS': [4, 0, 0, 252, 0, 252],
+    'HA': [252, 252, 0, 0, 4, 0],
+    'HC': [252, 0, 0, 252, 4, 0],
+    'HB': [252, 0, 252, 0, 4, 0],
+    'HD': [252, 0, 4, 0, 252, 0],
+    'HS': [252, 0, 4, 0, 0, 252],
+    'HBD': [252, 0, 128, 0, 128, 0],
+}
+
+OTHER = '*'     # 使用率データにないアイテム
+EPS = 1e-6      # 矛盾する観測の尤度の下限。観測や計算の誤差で事後確率が0になるのを防ぐ
+
+
+class BuildTable:
+    """ポケモン1匹の型の候補 (性格 x 努力値 x アイテム x 特性) を列挙した表
+        ポケモンとレベルごとに1度だけ作成し、BuildPosteriorの間で共有する
+    """
+
+    tables = {}     # {(ポケモン名, レベル, シーズン): BuildTable}
+
+    def get(name: str, level: int=50):
+        if (table := BuildTable.tables.get(key := (name, level, Pokemon.season))) is None:
+            table = BuildTable.tables[key] = BuildTable(name, level)
+        return table
+
+    def __init__(self, name: str, level: int=50):
+        self.name = name
+        self.level = level
+
+        home = Pokemon.home.get(name, {})
+        self.natures, nature_w = home.get('nature', [['まじめ'], [100]])
+        self.abilities, ability_w = home.get('ability', [Pokemon.zukan[name]['ability'], [1]*len(Pokemon.zukan[name]['ability'])])
+        self.items, item_w = [list(x) for x in home.get('item', [[''], [100]])]
+        # 素早さの推定に必要なため、スカーフは使用率データになくても候補に含める
+        if 'こだわりスカーフ' not in self.items:
+            self.items.append('こだわりスカーフ')
+            item_w.append(0.5)
+        if OTHER not in self.items:
+            self.items.append(OTHER)
+            item_w.append(max(1, 100 - sum(item_w)))
+        self.spreads = list(SPREADS.keys())
+
+        # 性格と努力値の組み合わせごとのステータス
+        nature_ids = np.repeat(np.arange(len(self.natures)), len(self.spreads))
+        efforts = np.tile(np.array([SPREADS[spread] for spread in self.spreads]), (len(self.natures), 1))
+        status = StatTable.get().statuses([name]*len(nature_ids), [self.natures[i] for i in nature_ids], efforts, level)
+        status = status.reshape(len(self.natures), len(self.spreads), 6)
+
+        # 性格で上昇する能力に努力値を振る配分を優先する
+        spread_w = np.ones((len(self.natures), len(self.spreads)))
+        for i, nature in enumerate(self.natures):
+            up = [k for k in range(1, 6) if Pokemon.nature_corrections[nature][k] > 1]
+            for j, spread in enumerate(self.spreads):
+                if up and SPREADS[spread][up[0]] < 252:
+                    spread_w[i, j] = 0.2
+
+        # 候補を1次元に展開する
+        n, s, t, a = np.meshgrid(np.arange(len(self.natures)), np.arange(len(self.spreads)),
+                                 np.arange(len(self.items)), np.arange(len(self.abilities)), indexing='ij')
+        self.nature, self.spread, self.item, self.ability = n.ravel(), s.ravel(), t.ravel(), a.ravel()
+        self.status = status[self.nature, self.spread]
+        self.log_prior = np.log(np.array(nature_w, dtype=float)[self.nature] / sum(nature_w)) + \
+            np.log(spread_w[self.nature, self.spread]) + \
+            np.log(np.array(item_w, dtype=float)[self.item] / sum(item_w)) + \
+            np.log(np.array(ability_w, dtype=float)[self.ability] / sum(ability_w))
+
+        # スカーフ込みの素早さ
+        scarf = np.array([item == 'こだわりスカーフ' for item in self.items])[self.item]
+        self.speed = np.where(scarf, (self.status[:, 5]*1.5).astype(np.int32), self.status[:, 5])
+
+    def __len__(self):
+        return len(self.nature)
+
+    def item_id(self, item: str) -> int:
+        return self.items.index(item) if item in self.items else self.items.index(OTHER)
+
+    def attack_item_factor(self, move: str) -> np.ndarray:
+        """アイテムごとの、{move}の攻撃側のダメージ補正"""
+        cls = 'phy' if Pokemon.all_moves[move]['class'] == 'phy' else 'spe'
+        factors = []
+        for item in self.items:
+            r = 1
+            if (item == 'こだわりハチマキ' and cls == 'phy') or (item == 'こだわりメガネ' and cls == 'spe') or \
+                item == 'いのちのたま':
+                r = Pokemon.item_correction[item]
+            elif item in Pokemon.item_buff_type and Pokemon.item_buff_type[item] == Pokemon.all_moves[move]['type']:
+                r = Pokemon.item_correction[item]
+            factors.append(r)
+        return np.array(factors)[self.item]
+
+    def defence_item_factor(self, move: str) -> np.ndarray:
+        """アイテムごとの、{move}の防御側のダメージ補正"""
+        special = Pokemon.all_moves[move]['class'] == 'spe' and move not in Pokemon.move_category['physical']
+        return np.array([2/3 if item == 'とつげきチョッキ' and special else 1 for item in self.items])[self.item]
+
+
+class BuildPosterior:
+    """相手のポケモン1匹の型 (性格、努力値、アイテム、特性) の事後分布
+
+    Pokemon.homeの使用率を事前分布とし、観測のたびに候補ごとの尤度を掛けて更新する。
+    更新は候補の表に対するnumpyの演算のみで、1回あたり数十マイクロ秒で終わる。
+    ダメージの尤度は、基準の型で計算したダメージをステータスとアイテムの補正の比で拡大縮小して近似する。
+    特性によるダメージ補正は考慮しない。
+
+        posterior = BuildPosterior('カイリュー')
+        posterior.observe_item('こだわりハチマキ')
+        posterior.observe_speed_order(speed=150, first=False)
+        posterior.probability('item', 'こだわりスカーフ')
+        posterior.expected_speed()
+    """
+
+    def __init__(self, name: str, level: int=50):
+        self.name = name
+        self.level = level
+        self.log_w = self.table.log_prior.copy()
+        self.n_damages = 0      # observe_history()で処理したダメージ履歴の数
+
+    @property
+    def table(self) -> BuildTable:
+        return BuildTable.get(self.name, self.level)
+
+    def __deepcopy__(self, memo):
+        posterior = BuildPosterior.__new__(BuildPosterior)
+        posterior.__dict__ |= self.__dict__
+        posterior.log_w = self.log_w.copy()
+        return posterior
+
+    def weights(self) -> np.ndarray:
+        """候補ごとの事後確率"""
+        w = np.exp(self.log_w - self.log_w.max())
+        return w / w.sum()
+
+    def update(self, likelihood: np.ndarray) -> None:
+        """候補ごとの尤度{likelihood}で事後分布を更新する"""
+        self.log_w += np.log(np.maximum(likelihood, EPS))
+        self.log_w -= self.log_w.max()
+
+    def observe_item(self, item: str) -> None:
+        """アイテムが判明した"""
+        self.update((self.table.item == self.table.item_id(item)).astype(float))
+
+    def observe_ability(self, ability: str) -> None:
+        """特性が判明した"""
+        if ability in self.table.abilities:
+            self.update((self.table.ability == self.table.abilities.index(ability)).astype(float))
+
+    def observe_speed_order(self, speed: int, first: bool, r_speed: float=1) -> None:
+        """素早さ{speed}の相手に対して先手 (first=True) または後手をとった
+            {r_speed}は判明しているランクや場の状態による素早さの補正
+        """
+        eff_speed = self.table.speed * r_speed
+        if first:
+            likelihood = (eff_speed > speed) + 0.5*(eff_speed == speed)
+        else:
+            likelihood = (eff_speed < speed) + 0.5*(eff_speed == speed)
+        self.update(likelihood)
+
+    def observe_damage(self, move: str, attack: bool, damages: list[int], status: list[int],
+                       damage: int=None, damage_ratio: float=None) -> None:
+        """ダメージを観測した
+
+        Parameters
+        ----------
+        move: str
+            技。
+
+        attack: bool
+            このポケモンが攻撃側ならTrue、防御側ならFalse。
+
+        damages: list[int]
+            アイテムなしの基準の型で計算した乱数ごとのダメージ。
+
+        status: list[int]
+            基準の型のステータス。
+
+        damage: int
+            攻撃側のとき、相手が受けたダメージ。
+
+        damage_ratio: float
+            防御側のとき、このポケモンが受けたダメージの割合。
+        """
+        table = self.table
+        damages = np.array(damages, dtype=float)
+        physical = Pokemon.all_moves[move]['class'] == 'phy' or move in Pokemon.move_category['physical']
+
+        if attack:
+            index = 1 if Pokemon.all_moves[move]['class'] == 'phy' else 3
+            factor = table.status[:, index] / status[index] * table.attack_item_factor(move)
+            predicted = damages[None, :] * factor[:, None]
+            hits = np.abs(predicted - damage) <= 1 + 0.02*damage
+        else:
+            index = 2 if physical else 4
+            factor = status[index] / table.status[:, index] * table.defence_item_factor(move)
+            predicted = damages[None, :] * factor[:, None] / table.status[:, [0]]
+            hits = np.abs(predicted - damage_ratio) <= 0.01 + 0.02*damage_ratio
+
+        self.update(hits.mean(axis=1))
+
+    def observe_damage_record(self, dmg: Damage, player: int) -> None:
+        """ダメージ履歴{dmg}で更新する。{player}はこのポケモンのプレイヤー"""
+        if dmg.pokemon[player]['_Pokemon__name'] != self.name or \
+            Pokemon.all_moves[dmg.move]['class'] not in ['phy', 'spe'] or dmg.move in ['イカサマ', 'ボディプレス']:
+            return
+
+        # ダメージが発生した状況を再現し、基準の型でダメージを計算する
+        battle = Battle()
+        for pl in range(2):
+            p = dmg.pokemon[pl]
+            battle.pokemon[pl] = Pokemon(p['_Pokemon__name'], use_template=False)
+            battle.pokemon[pl].__dict__ |= deepcopy(p)
+        battle.stellar[dmg.attack_player] = dmg.stellar
+        battle.condition = dmg.condition
+
+        p = battle.pokemon[player]
+        p.item = ''
+        p.nature = 'まじめ'
+        p.effort = [0]*6
+
+        if not (damages := battle.oneshot_damages(dmg.attack_player, dmg.move, critical=dmg.critical)):
+            return
+
+        if dmg.attack_player == player:
+            self.observe_damage(dmg.move, True, damages, p.status, damage=dmg.damage)
+        else:
+            self.observe_damage(dmg.move, False, damages, p.status, damage_ratio=dmg.damage_ratio)
+
+    def observe_history(self, battle: Battle, player: int) -> None:
+        """{battle}のダメージ履歴のうち、未処理のものを順に反映する"""
+        for dmg in battle.damage_history[self.n_damages:]:
+            self.observe_damage_record(dmg, player)
+        self.n_damages = len(battle.damage_history)
+
+    def marginal(self, key: str) -> dict:
+        """'nature', 'spread', 'item', 'ability' のいずれかの周辺分布 {値: 確率} を確率の高い順に返す"""
+        table = self.table
+        names = {'nature': table.natures, 'spread': table.spreads, 'item': table.items, 'ability': table.abilities}[key]
+        p = np.bincount(getattr(table, key), weights=self.weights(), minlength=len(names))
+        return {names[i]: float(p[i]) for i in np.argsort(-p)}
+
+    def probability(self, key: str, value: str) -> float:
+        """{key}が{value}である確率"""
+        return self.marginal(key).get(value, 0.)
+
+    def expected_status(self, index: int) -> float:
+        """ステータスの期待値"""
+        return float(self.weights() @ self.table.status[:, index])
+
+    def expected_speed(self, scarf: bool=True) -> float:
+        """素早さの期待値。{scarf}=Trueならスカーフの補正を含める"""
+        return float(self.weights() @ (self.table.speed if scarf else self.table.status[:, 5]))
+
+    def most_likely(self) -> dict:
+        """最も確率の高い型"""
+        table = self.table
+        i = int(np.argmax(self.log_w))
+        return {
+            'nature': table.natures[table.nature[i]],
+            'effort': SPREADS[table.spreads[table.spread[i]]],
+            'item': table.items[table.item[i]],
+            'ability': table.abilities[table.ability[i]],
+        }
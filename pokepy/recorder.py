@@ -0,0 +1,194 @@
+from copy import deepcopy
+import itertools
+import json
+import queue
+import threading
+
+
+FORMAT = 'pokepy-battle-log'
+VERSION = 1
+
+# 差分の表記に用いるキー
+LIST_KEY = '$list'  # 同じ長さのリストの要素ごとの差分 {'$list': {index: 差分}}
+DEL_KEY = '$del'    # 削除されたdictのキー {'$del': [key]}
+
+_UNCHANGED = object()
+
+
+def diff(old, new):
+    """{old}から{new}への差分を返す。変化がなければ_UNCHANGEDを返す
+        dict同士、同じ長さのリスト同士は変化した要素のみを記録し、それ以外は新しい値で置き換える
+    """
+    if type(old) == dict and type(new) == dict:
+        delta = {}
+        for key, value in new.items():
+            if key not in old:
+                delta[key] = value
+            elif (d := diff(old[key], value)) is not _UNCHANGED:
+                delta[key] = d
+        if (removed := [key for key in old if key not in new]):
+            delta[DEL_KEY] = removed
+        return delta if delta else _UNCHANGED
+
+    if type(old) == list and type(new) == list and len(old) == len(new):
+        delta = {}
+        for i, (o, n) in enumerate(zip(old, new)):
+            if (d := diff(o, n)) is not _UNCHANGED:
+                delta[str(i)] = d
+        return {LIST_KEY: delta} if delta else _UNCHANGED
+
+    return _UNCHANGED if old == new else new
+
+def patch(old, delta):
+    """{old}に差分{delta}を適用した値を返す。{old}は書き換えない"""
+    if type(delta) != dict:
+        return delta
+
+    if type(old) == list and LIST_KEY in delta:
+        new = list(old)
+        for i, d in delta[LIST_KEY].items():
+            new[int(i)] = patch(old[int(i)], d)
+        return new
+
+    if type(old) == dict:
+        new = dict(old)
+        for key in delta.get(DEL_KEY, []):
+            new.pop(key, None)
+        for key, d in delta.items():
+            if key != DEL_KEY:
+                new[key] = patch(old.get(key), d)
+        return new
+
+    return delta
+
+
+class BattleRecorder:
+    """対戦の記録を差分形式でファイルに書き出すクラス
+
+    1行目にヘッダ、以降はターンごとに前ターンの盤面からの差分を1行ずつ記録する。
+    書き込みはバックグラウンドのスレッドで行い、キューが空になった時点でまとめてフラッシュする。
+    record()は盤面を複製してキューに積むだけなので、ターンの処理がファイル書き込みを待つことはない。
+
+        {"format": "pokepy-battle-log", "version": 1, ...ヘッダ}
+        {"turn": 0, "delta": {...}}   # 最初のターンは盤面全体
+        {"turn": 1, "delta": {...}}
+        ...
+        {"result": "win"}
+    """
+
+    def __init__(self, filename: str, header: dict, buffer_size: int=1<<16):
+        self.filename = filename
+        self.queue = queue.Queue()
+        self.closed = False
+        self.n_turns = 0
+        self.file = open(filename, 'w', encoding='utf-8', buffering=buffer_size)
+        self.queue.put({'format': FORMAT, 'version': VERSION} | header)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __getstate__(self):
+        raise TypeError('BattleRecorder cannot be copied')
+
+    def record(self, state: dict) -> None:
+        """ターンの盤面{state}を記録する"""
+        if self.closed:
+            return
+        self.queue.put(('state', self.n_turns, deepcopy(state)))
+        self.n_turns += 1
+
+    def close(self, result: str=None) -> None:
+        """試合結果{result}を記録してファイルを閉じる。書き込みの完了を待つ"""
+        if self.closed:
+            return
+        self.closed = True
+        if result is not None:
+            self.queue.put({'result': result})
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self) -> None:
+        """書き込みスレッド"""
+        last = {}
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if type(item) == tuple:
+                _, turn, state = item
+                delta = diff(last, state)
+                item = {'turn': turn, 'delta': {} if delta is _UNCHANGED else delta}
+                last = state
+            self.file.write(json.dumps(item, ensure_ascii=False) + '\n')
+            if self.queue.empty():
+                self.file.flush()
+        self.file.close()
+
+
+def iter_battle_log(filename: str):
+    """対戦ログを1行ずつ読み込み、(種類, 値) を順に返すジェネレータ
+        差分形式とPokebot.dump()を1行ずつ書き出していた従来の形式のどちらも読み込める
+
+        ('header', ヘッダ)              差分形式のみ
+        ('party', (プレイヤー, パーティ))
+        ('state', ターンの盤面)           差分はターンごとの盤面に復元して返す
+        ('result', 試合結果)
+    """
+    with open(filename, encoding='utf-8') as fin:
+        lines = (line.strip() for line in fin)
+        lines = (line for line in lines if line)
+
+        if (first := next(lines, None)) is None:
+            return
+        try:
+            data = json.loads(first)
+        except json.JSONDecodeError:
+            data = None
+
+        # 差分形式
+        if type(data) == dict and data.get('format') == FORMAT:
+            yield 'header', data
+            for player, party in enumerate(data.get('party', [])):
+                yield 'party', (player, party)
+            state = {}
+            for line in lines:
+                data = json.loads(line)
+                if 'delta' in data:
+                    state = patch(state, data['delta'])
+                    yield 'state', state
+                elif 'result' in data:
+                    yield 'result', data['result']
+            return
+
+        # 従来の形式 : パーティ (1~2行)、ターンごとの盤面、試合結果
+        n_party = 0
+        for i, line in enumerate(itertools.chain([first], lines)):
+            if i > 0:
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    data = None
+            if data is None:
+                yield 'result', line
+            elif type(data) == dict and 'selected' in data:
+                yield 'state', data
+            elif type(data) == dict and n_party < 2:
+                yield 'party', (n_party, data)
+                n_party += 1
+
+def read_battle_log(filename: str) -> dict:
+    """対戦ログを読み込み、ターンごとの盤面を復元する
+
+        {'header': ヘッダ, 'party': [自分のパーティ, 相手のパーティ], 'states': [ターンごとの盤面], 'result': 試合結果}
+    """
+    log = {'header': {}, 'party': [{}, {}], 'states': [], 'result': None}
+    for kind, data in iter_battle_log(filename):
+        match kind:
+            case 'header':
+                log['header'] = data
+            case 'party':
+                log['party'][data[0]] = data[1]
+            case 'state':
+                log['states'].append(data)
+            case 'result':
+                log['result'] = data
+    return log
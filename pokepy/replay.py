@@ -0,0 +1,292 @@
+from pokepy.pokemon import *
+from pokepy.sharedtables import worker_pool
+from array import array
+import glob
+import io
+import os
+import struct
+import zlib
+
+
+MAGIC = b'PKRP'
+VERSION = 1
+
+FLAG_CHECKSUM = 1   # ターンごとの盤面のチェックサムを含む
+FLAG_ZLIB = 2       # 本体をzlibで圧縮する
+
+NO_COMMAND = -128   # コマンドなし (None)
+
+# 値の型タグ
+T_NONE, T_FALSE, T_TRUE, T_INT, T_FLOAT, T_STR, T_LIST, T_DICT = range(8)
+
+
+def state_checksum(battle: Battle) -> int:
+    """盤面のチェックサムを返す
+        ターン数、選出したポケモンの状態、場のポケモン、場の状態から計算する
+    """
+    state = [battle.turn, battle.condition]
+    for player in range(2):
+        state.append(battle.selected[player].index(battle.pokemon[player]) if battle.pokemon[player] in battle.selected[player] else -1)
+        for p in battle.selected[player]:
+            state.append((p.name, p.hp, p.ailment, p.rank, p.item, p.pp, p.condition, p.terastal))
+    return zlib.crc32(repr(state).encode())
+
+
+class Encoder:
+    """文字列をIDに置き換えて値を符号化する"""
+
+    def __init__(self):
+        self.strings = {}   # {文字列: ID}
+        self.buf = io.BytesIO()
+
+    def varint(self, n: int) -> None:
+        n = 2*n if n >= 0 else -2*n-1 # zigzag
+        while n >= 0x80:
+            self.buf.write(bytes([(n & 0x7f) | 0x80]))
+            n >>= 7
+        self.buf.write(bytes([n]))
+
+    def intern(self, s: str) -> None:
+        if s not in self.strings:
+            self.strings[s] = len(self.strings)
+        self.varint(self.strings[s])
+
+    def value(self, v) -> None:
+        if v is None:
+            self.buf.write(bytes([T_NONE]))
+        elif v is True or v is False:
+            self.buf.write(bytes([T_TRUE if v else T_FALSE]))
+        elif type(v) == int:
+            self.buf.write(bytes([T_INT]))
+            self.varint(v)
+        elif type(v) == float:
+            self.buf.write(bytes([T_FLOAT]))
+            self.buf.write(struct.pack('<d', v))
+        elif type(v) == str:
+            self.buf.write(bytes([T_STR]))
+            self.intern(v)
+        elif type(v) in (list, tuple):
+            self.buf.write(bytes([T_LIST]))
+            self.varint(len(v))
+            for x in v:
+                self.value(x)
+        elif type(v) == dict:
+            self.buf.write(bytes([T_DICT]))
+            self.varint(len(v))
+            for k, x in v.items():
+                self.intern(str(k))
+                self.value(x)
+        else:
+            raise TypeError(f'{type(v)}は記録できません')
+
+
+class Decoder:
+    def __init__(self, data: bytes, strings: list[str]=None):
+        self.data = data
+        self.pos = 0
+        self.strings = strings or []
+
+    def varint(self) -> int:
+        n, shift = 0, 0
+        while True:
+            b = self.data[self.pos]
+            self.pos += 1
+            n |= (b & 0x7f) << shift
+            shift += 7
+            if b < 0x80:
+                break
+        return (n >> 1) ^ -(n & 1)
+
+    def bytes(self, n: int) -> bytes:
+        b = self.data[self.pos:self.pos+n]
+        self.pos += n
+        return b
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        match tag:
+            case 0: # T_NONE
+                return None
+            case 1: # T_FALSE
+                return False
+            case 2: # T_TRUE
+                return True
+            case 3: # T_INT
+                return self.varint()
+            case 4: # T_FLOAT
+                return struct.unpack('<d', self.bytes(8))[0]
+            case 5: # T_STR
+                return self.strings[self.varint()]
+            case 6: # T_LIST
+                return [self.value() for _ in range(self.varint())]
+            case 7: # T_DICT
+                return {self.strings[self.varint()]: self.value() for _ in range(self.varint())}
+        raise ValueError(f'不正な型タグ {tag}')
+
+
+def encode_replay(battle: Battle, checksums: dict=None, compress: bool=True) -> bytes:
+    """対戦シミュレーションの履歴battle._dumpをバイナリ形式に変換する
+
+    checksums: dict
+        {ターン: チェックサム}。ターンはbattle._dumpのキー 'Turn{ターン}' に対応する
+
+    形式 (リトルエンディアン):
+        ヘッダ   'PKRP', バージョン (u8), フラグ (u8)
+        本体     シード, 文字列表, 両プレイヤーの選出 (vars(p)),
+                 ターン数, ターン列, コマンド列 (i8 x 2), 交代コマンド数の列 (u8 x 2), 交代コマンド列 (i8),
+                 チェックサム列 (u32)
+    """
+    log = battle._dump
+    turns = sorted(int(key[4:]) for key in log if key.startswith('Turn'))
+
+    # 選出したポケモンは値を符号化し、文字列表を作る
+    enc = Encoder()
+    for player in range(2):
+        enc.varint(len(log[str(player)]))
+        for p in log[str(player)]:
+            enc.value(p)
+    pokemon = enc.buf.getvalue()
+
+    # コマンドは列ごとにまとめる
+    commands, n_changes, changes = array('b'), array('B'), array('b')
+    for t in turns:
+        turn = log[f'Turn{t}']
+        for player in range(2):
+            cmd = turn['command'][player]
+            commands.append(NO_COMMAND if cmd is None else cmd)
+            history = turn['change_command_history'][player]
+            n_changes.append(len(history))
+            changes.extend(NO_COMMAND if c is None else c for c in history)
+
+    flags = FLAG_ZLIB if compress else 0
+    if checksums is not None:
+        flags |= FLAG_CHECKSUM
+
+    body = Encoder()
+    body.varint(log['seed'])
+    body.varint(len(enc.strings))
+    for s in enc.strings:
+        b = s.encode('utf-8')
+        body.varint(len(b))
+        body.buf.write(b)
+    body.buf.write(pokemon)
+    body.varint(len(turns))
+    for t in turns:
+        body.varint(t)
+    body.buf.write(commands.tobytes())
+    body.buf.write(n_changes.tobytes())
+    body.varint(len(changes))
+    body.buf.write(changes.tobytes())
+    if checksums is not None:
+        body.buf.write(array('I', [checksums.get(t, 0) for t in turns]).tobytes())
+
+    data = body.buf.getvalue()
+    if compress:
+        data = zlib.compress(data, 9)
+    return MAGIC + bytes([VERSION, flags]) + data
+
+def decode_replay(data: bytes) -> dict:
+    """バイナリ形式の履歴をbattle._dumpと同じ形式のdictに変換する
+        チェックサムがあれば {ターン: チェックサム} を 'checksums' に格納する
+    """
+    if data[:4] != MAGIC:
+        raise ValueError('リプレイファイルではありません')
+    if data[4] != VERSION:
+        raise ValueError(f'未対応のバージョン {data[4]}')
+    flags = data[5]
+    body = data[6:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+
+    dec = Decoder(body)
+    log = {'seed': dec.varint()}
+    for _ in range(dec.varint()):
+        dec.strings.append(dec.bytes(dec.varint()).decode('utf-8'))
+    for player in range(2):
+        log[str(player)] = [dec.value() for _ in range(dec.varint())]
+
+    n = dec.varint()
+    turns = [dec.varint() for _ in range(n)]
+    commands = array('b', dec.bytes(2*n)).tolist()
+    n_changes = array('B', dec.bytes(2*n)).tolist()
+    changes = array('b', dec.bytes(dec.varint())).tolist()
+
+    k = 0
+    for i, t in enumerate(turns):
+        command, history = [], []
+        for player in range(2):
+            cmd = commands[2*i+player]
+            command.append(None if cmd == NO_COMMAND else cmd)
+            m = n_changes[2*i+player]
+            history.append([None if c == NO_COMMAND else c for c in changes[k:k+m]])
+            k += m
+        log[f'Turn{t}'] = {'command': command, 'change_command_history': history}
+
+    if flags & FLAG_CHECKSUM:
+        log['checksums'] = dict(zip(turns, array('I', dec.bytes(4*n)).tolist()))
+
+    return log
+
+def save_replay(filename: str, battle: Battle, checksums: dict=None) -> None:
+    with open(filename, 'wb') as fout:
+        fout.write(encode_replay(battle, checksums))
+
+def load_replay(filename: str) -> dict:
+    """バイナリ形式またはjson形式 (Battle.dump()) の履歴を読み込む"""
+    with open(filename, 'rb') as fin:
+        data = fin.read()
+    if data[:4] == MAGIC:
+        return decode_replay(data)
+    return json.loads(data.decode('utf-8'))
+
+def play(battle: Battle, max_turn: int=100) -> dict:
+    """勝敗が決まるまで対戦シミュレーションを進め、ターンごとのチェックサム {ターン: チェックサム} を返す"""
+    checksums = {}
+    while battle.winner() is None and battle.turn < max_turn:
+        key = battle.turn
+        battle.proceed()
+        # 途中で終了したターンはコマンドが記録されないことがあるため、ここで記録する
+        battle.record_command()
+        checksums[key] = state_checksum(battle)
+    return checksums
+
+def simulate(log: dict) -> tuple[Battle, dict]:
+    """履歴{log}のコマンドに従って対戦を再現し、Battleインスタンスとターンごとのチェックサムを返す"""
+    battle = Battle(seed=log['seed'])
+    for player in range(2):
+        for p in log[str(player)]:
+            battle.selected[player].append(Pokemon())
+            battle.selected[player][-1].__dict__ |= deepcopy(p)
+
+    checksums = {}
+    while (key := f'Turn{battle.turn}') in log:
+        t = battle.turn
+        battle.reserved_change_commands = deepcopy(log[key]['change_command_history'])
+        battle.proceed(commands=list(log[key]['command']))
+        checksums[t] = state_checksum(battle)
+
+    return battle, checksums
+
+def verify_replay(filename: str) -> dict:
+    """リプレイを再現し、記録されたチェックサムと比較する
+        {'file': ファイル名, 'turns': ターン数, 'diverged': 最初に不一致となったターン or None, 'error': 例外}
+    """
+    result = {'file': filename, 'turns': 0, 'diverged': None, 'error': None}
+    try:
+        log = load_replay(filename)
+        _, checksums = simulate(log)
+        result['turns'] = len(checksums)
+        for t, checksum in log.get('checksums', {}).items():
+            if checksums.get(t) != checksum:
+                result['diverged'] = t
+                break
+    except Exception as e:
+        result['error'] = repr(e)
+    return result
+
+def verify_replays(directory: str, season: int=None, max_workers: int=None, pattern: str='*.pkr') -> list[dict]:
+    """{directory}内のリプレイをワーカープロセスで並列に再現し、検証結果のリストを返す"""
+    filenames = sorted(glob.glob(os.path.join(directory, pattern)))
+    with worker_pool(max_workers, season) as pool:
+        return list(pool.map(verify_replay, filenames, chunksize=max(1, len(filenames)//64)))
@@ -0,0 +1,85 @@
+import numpy as np
+import random
+
+
+class AliasTable:
+    """Walkerのエイリアス法による重み付きサンプラー
+        テーブルの構築はO(n)、1回の抽選はO(1)で、乱数を1つだけ消費する
+    """
+
+    def __init__(self, items: list, weights: list[float]):
+        n = len(items)
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            raise ValueError('重みの合計が0です')
+
+        scaled = [w*n/total for w in weights]
+        prob, alias = [1.]*n, list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s], alias[s] = scaled[s], l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+
+        self.items = list(items)
+        self.weights = list(weights)
+        self.prob = prob
+        self.alias = alias
+        self.np_prob = np.array(prob)
+        self.np_alias = np.array(alias)
+
+    def __len__(self):
+        return len(self.items)
+
+    def sample_index(self, rng=random) -> int:
+        """重みに従って要素の番号を抽選する"""
+        u = rng.random()*len(self.items)
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+    def sample(self, rng=random):
+        """重みに従って要素を抽選する"""
+        return self.items[self.sample_index(rng)]
+
+    def sample_indexes(self, k: int, rng: np.random.Generator) -> np.ndarray:
+        """{k}個の要素の番号をまとめて抽選する"""
+        u = rng.random(k)*len(self.items)
+        i = u.astype(np.int64)
+        return np.where(u - i < self.np_prob[i], i, self.np_alias[i])
+
+    def sample_distinct(self, k: int, rng=random, exclude=(), max_trials: int=64) -> list:
+        """{exclude}を除いた重複のない要素を最大{k}個抽選する
+            重複を棄却して抽選し、試行回数が{max_trials}を超えたら残りを重みの大きい順に補う
+        """
+        result = []
+        exclude = set(exclude)
+        for _ in range(max_trials):
+            if len(result) == k:
+                return result
+            item = self.sample(rng)
+            if item not in exclude:
+                result.append(item)
+                exclude.add(item)
+
+        for _, item in sorted(zip(self.weights, self.items), key=lambda x: -x[0]):
+            if len(result) == k:
+                break
+            if item not in exclude:
+                result.append(item)
+                exclude.add(item)
+        return result
+
+    def restrict(self, allowed):
+        """{allowed}に含まれる要素に制限した条件付きのテーブルを返す
+            制限後の重みがすべて0なら{allowed}から一様に抽選するテーブルを返す
+        """
+        weights = {item: w for item, w in zip(self.items, self.weights)}
+        items = sorted(set(allowed))
+        if not items:
+            raise ValueError('候補がありません')
+        ws = [weights.get(item, 0) for item in items]
+        if sum(ws) <= 0:
+            ws = [1]*len(items)
+        return AliasTable(items, ws)
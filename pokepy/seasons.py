@@ -0,0 +1,173 @@
+from pokepy.pokemon import *
+from collections import OrderedDict
+import glob
+import numpy as np
+import os
+import re
+import threading
+
+
+class SeasonData:
+    """1シーズン分のランクマッチの統計データを、文字列のIDと配列で保持するクラス
+
+    species             ポケモン名 (統計データの順 = 使用率順)
+    strings             技、アイテムなどの文字列の一覧
+    {項目}.offset       ポケモンごとのデータの開始位置 (len(species)+1)
+    {項目}.id           文字列のID
+    {項目}.rate         採用率 [%] (float32。取り出すときに小数点以下4桁に丸める)
+
+    項目は Pokemon.SET_KEYS ('nature', 'ability', 'item', 'Ttype', 'move')。
+    """
+
+    def __init__(self, season: int, species: list[str], strings: list[str], arrays: dict):
+        self.season = season
+        self.species = species
+        self.species_id = {name: i for i, name in enumerate(species)}
+        self.strings = strings
+        self.string_id = {s: i for i, s in enumerate(strings)}
+        self.arrays = arrays
+
+    def from_home(season: int, home: dict):
+        """Pokemon.homeと同じ形式の辞書{home}から作成する"""
+        species = list(home.keys())
+        strings, string_id = [], {}
+        arrays = {}
+        for key in Pokemon.SET_KEYS:
+            offset, ids, rates = [0], [], []
+            for name in species:
+                values, ws = home[name].get(key, [[], []])
+                for value, w in zip(values, ws):
+                    if (i := string_id.get(value)) is None:
+                        i = string_id[value] = len(strings)
+                        strings.append(value)
+                    ids.append(i)
+                    rates.append(w)
+                offset.append(len(ids))
+            arrays[f'{key}.offset'] = np.array(offset, dtype=np.int32)
+            arrays[f'{key}.id'] = np.array(ids, dtype=np.int32)
+            arrays[f'{key}.rate'] = np.array(rates, dtype=np.float32)
+        return SeasonData(season, species, strings, arrays)
+
+    def save(self, filename: str) -> None:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = f'{filename[:-4]}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, species=np.array(self.species), strings=np.array(self.strings), **self.arrays)
+        os.replace(tmp, filename)
+
+    def load(season: int, filename: str):
+        with np.load(filename) as npz:
+            arrays = {key: npz[key] for key in npz.files if '.' in key}
+            return SeasonData(season, npz['species'].tolist(), npz['strings'].tolist(), arrays)
+
+    def __contains__(self, name: str):
+        return name in self.species_id
+
+    def rank(self, name: str) -> int:
+        """使用率の順位 (1始まり)。統計データになければNone"""
+        return self.species_id[name] + 1 if name in self.species_id else None
+
+    def usage(self, name: str, key: str) -> dict:
+        """{name}の項目{key}の採用率 {値: 採用率[%]}"""
+        if (i := self.species_id.get(name)) is None:
+            return {}
+        start, end = self.arrays[f'{key}.offset'][i:i+2]
+        ids, rates = self.arrays[f'{key}.id'][start:end], self.arrays[f'{key}.rate'][start:end]
+        return {self.strings[j]: round(float(r), 4) for j, r in zip(ids, rates)}
+
+    def rate(self, name: str, key: str, value: str) -> float:
+        """{name}の項目{key}が{value}である採用率 [%]。データになければ0"""
+        if (i := self.species_id.get(name)) is None or (j := self.string_id.get(value)) is None:
+            return 0.
+        start, end = self.arrays[f'{key}.offset'][i:i+2]
+        match = np.nonzero(self.arrays[f'{key}.id'][start:end] == j)[0]
+        return round(float(self.arrays[f'{key}.rate'][start + match[0]]), 4) if len(match) else 0.
+
+    def users(self, key: str, value: str) -> dict:
+        """項目{key}が{value}であるポケモンと採用率 {ポケモン名: 採用率[%]} を採用率の高い順に返す"""
+        if (j := self.string_id.get(value)) is None:
+            return {}
+        offset = self.arrays[f'{key}.offset']
+        index = np.nonzero(self.arrays[f'{key}.id'] == j)[0]
+        owners = np.searchsorted(offset, index, side='right') - 1
+        rates = self.arrays[f'{key}.rate'][index]
+        return {self.species[owners[k]]: round(float(rates[k]), 4) for k in np.argsort(-rates, kind='stable')}
+
+    def to_home(self) -> dict:
+        """Pokemon.homeと同じ形式の辞書を返す"""
+        home = {}
+        for name in self.species:
+            home[name] = {}
+            for key in Pokemon.SET_KEYS:
+                usage = self.usage(name, key)
+                home[name][key] = [list(usage.keys()), list(usage.values())]
+        return home
+
+
+class SeasonStore:
+    """battle_data/season*.json の全シーズンの統計データを管理するクラス
+
+    シーズンのファイルを索引し、各シーズンは初めて参照した時点で読み込む。
+    読み込んだデータはSeasonDataの形式で log/cache に保存し、2回目以降はJSONを解析せずに読み込む。
+    メモリ上には最近参照した{max_resident}シーズン分を保持する。
+    Pokemon.homeなどのクラス変数は変更しないため、シーズン間の比較や過去のシーズンでの検証に使える。
+    JSONの読み込みでは図鑑を参照してデータを補完するため、Pokemon.init()の後に使う。
+
+        store = SeasonStore()
+        store.get(22).usage('カイリュー', 'item')
+        store.trend('カイリュー', 'item', 'こだわりハチマキ')    # [(シーズン, 採用率), ...]
+    """
+
+    CACHE_DIR = 'log/cache'
+
+    def __init__(self, directory: str='battle_data', max_resident: int=8, cache_dir: str=None):
+        self.directory = directory
+        self.max_resident = max_resident
+        self.cache_dir = cache_dir or SeasonStore.CACHE_DIR
+        self.resident = OrderedDict()   # {シーズン: SeasonData}
+        self.lock = threading.Lock()
+        self.files = {}                 # {シーズン: ファイル名}
+        self.index()
+
+    def index(self) -> None:
+        """シーズンのファイルを索引する"""
+        self.files = {}
+        for filename in glob.glob(os.path.join(self.directory, 'season*.json')):
+            if (m := re.fullmatch(r'season(\d+)\.json', os.path.basename(filename))):
+                self.files[int(m.group(1))] = filename
+        self.files = dict(sorted(self.files.items()))
+
+    def seasons(self) -> list[int]:
+        return list(self.files.keys())
+
+    def get(self, season: int) -> SeasonData:
+        """{season}の統計データを返す。初回は読み込む"""
+        with self.lock:
+            if (data := self.resident.get(season)) is not None:
+                self.resident.move_to_end(season)
+                return data
+
+            data = self.load(season)
+            self.resident[season] = data
+            while len(self.resident) > self.max_resident:
+                self.resident.popitem(last=False)
+            return data
+
+    def load(self, season: int) -> SeasonData:
+        """{season}の統計データを読み込む。元のファイルが更新されていなければ保存したデータを使う"""
+        filename = self.files[season]
+        stat = os.stat(filename)
+        cache = os.path.join(self.cache_dir, f'season{season}_{stat.st_size}_{int(stat.st_mtime)}.npz')
+        if os.path.isfile(cache):
+            return SeasonData.load(season, cache)
+
+        data = SeasonData.from_home(season, Pokemon.load_home(filename))
+        data.save(cache)
+        return data
+
+    def trend(self, name: str, key: str, value: str, seasons: list[int]=None) -> list[tuple[int, float]]:
+        """シーズンごとの{name}の項目{key}が{value}である採用率 [(シーズン, 採用率[%])]"""
+        return [(season, self.get(season).rate(name, key, value)) for season in seasons or self.seasons()]
+
+    def rank_trend(self, name: str, seasons: list[int]=None) -> list[tuple[int, int]]:
+        """シーズンごとの{name}の使用率の順位 [(シーズン, 順位 or None)]"""
+        return [(season, self.get(season).rank(name)) for season in seasons or self.seasons()]
@@ -0,0 +1,180 @@
+from pokepy.pokemon import *
+from pokepy.threat import sample_opponent_sets
+from pokepy.sharedtables import worker_pool
+from concurrent.futures import wait, FIRST_COMPLETED
+from itertools import combinations
+import math
+import os
+
+
+def wilson_interval(wins: int, n: int, z: float=1.96) -> tuple[float, float]:
+    """勝率のWilsonスコア信頼区間 (既定は95%)"""
+    if n == 0:
+        return 0., 1.
+    p = wins / n
+    center = (p + z*z/(2*n)) / (1 + z*z/n)
+    half = z*math.sqrt(p*(1-p)/n + z*z/(4*n*n)) / (1 + z*z/n)
+    return max(0., center - half), min(1., center + half)
+
+
+def prepare_opponent(p: Pokemon, rng) -> Pokemon:
+    """相手のポケモンを複製する。技が判明していなければ、使用率に従って抽選した型を設定する"""
+    if any(p.moves):
+        return deepcopy(p)
+    opponent = Pokemon(p.name, use_template=False)
+    pokemon_set = sample_opponent_sets(p.name, 1, rng)[0]
+    opponent.apply_set(pokemon_set)
+    opponent.effort = pokemon_set['effort']
+    return opponent
+
+
+def rollouts(battle_class, selected: list[Pokemon], opponents: list[Pokemon], seeds: list[int], max_turn: int,
+             deadline: float=None) -> list[int]:
+    """ワーカープロセスで実行する対戦シミュレーション
+
+    {selected}の先頭を先発として、相手のパーティ{opponents}から抽選した3匹と対戦し、勝ちなら1、負けなら0のリストを返す。
+    方策は{battle_class}のbattle_command()とchange_command()に従う。
+    {max_turn}ターンで決着しなければ打ち切り、TODスコアで勝敗を判定する。
+    時刻{deadline} (time.time()) を過ぎたら、途中の試行は結果に含めずに終了する。
+    """
+    results = []
+    for seed in seeds:
+        if deadline is not None and time.time() > deadline:
+            break
+        rng = random.Random(seed)
+        random.seed(seed)
+
+        battle = battle_class()
+        battle.seed, battle._random = seed, random.Random(seed)
+        battle.selected[0] = [deepcopy(p) for p in selected]
+        battle.selected[1] = [prepare_opponent(p, rng) for p in rng.sample(opponents, min(3, len(opponents)))]
+
+        try:
+            while battle.winner() is None and battle.turn < max_turn:
+                if deadline is not None and time.time() > deadline:
+                    return results
+                battle.proceed()
+        except Exception as e:
+            warnings.warn(f'対戦シミュレーションに失敗しました {e}')
+            continue
+        results.append(int(battle.winner(is_timeup=True) == 0))
+
+    return results
+
+
+class SelectionEngine:
+    """相手のパーティに対する選出と先発を、ワーカープロセスでの対戦シミュレーションにより評価するクラス
+
+    パーティから3匹を選ぶ全ての組み合わせと先発の候補 (6匹なら60通り) について、
+    相手のパーティから抽選した3匹 (技が判明していなければ型も抽選する) とのシミュレーションを繰り返す。
+    各候補の試行回数が{min_rollouts}に達した後は、勝率の信頼区間の上限が最良の候補の下限を下回る候補を打ち切り、
+    残りの候補に試行を集中させる。{time_budget}秒が経過した時点で結果を返す。
+    ワーカーも同じ時刻で試行を打ち切るため、実行中の試行が次の呼び出しまでプールを占有することはない。
+    候補は勝率の信頼区間の下限が高い順に並べるため、試行回数の少ない候補が偶然の全勝で上位になることはない。
+    ワーカープロセスは試合をまたいで使い回す。
+
+    方策関数はワーカープロセスで{battle_class}のインスタンスから呼ばれるため、
+    独自の方策を用いる場合はモジュールのトップレベルで定義したBattleの派生クラスを指定する。
+
+        engine = SelectionEngine(max_workers=8)
+        results = engine.recommend(party, enemy_party, time_budget=30)
+        results[0]['command']   # 選出するポケモンの番号 (先頭が先発)
+    """
+
+    def __init__(self, battle_class=Battle, max_workers: int=None, max_turn: int=20,
+                 batch_size: int=4, min_rollouts: int=8):
+        self.battle_class = battle_class
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2)//2)
+        self.max_turn = max_turn            # シミュレーションを打ち切るターン数
+        self.batch_size = batch_size        # ワーカーに1度に渡す試行回数
+        self.min_rollouts = min_rollouts    # 候補を打ち切る前に必要な試行回数
+        self.pool = None
+
+    def __getstate__(self):
+        # プロセスプールは複製しない
+        state = self.__dict__.copy()
+        state['pool'] = None
+        return state
+
+    def start(self) -> None:
+        """ワーカープロセスを起動する。spawnで起動する環境ではワーカーの初期化 (Pokemon.init) に数秒かかるため、選出画面より前に呼んでおく"""
+        if self.pool is None:
+            self.pool = worker_pool(self.max_workers, Pokemon.season)
+            for _ in range(self.max_workers):
+                self.pool.submit(time.sleep, 0)
+
+    def candidates(self, n_party: int, n_select: int=3) -> list[list[int]]:
+        """選出の候補 [先発, 2番目, 3番目] のリスト"""
+        result = []
+        for trio in combinations(range(n_party), min(n_select, n_party)):
+            for lead in trio:
+                result.append([lead] + [i for i in trio if i != lead])
+        return result
+
+    def recommend(self, party: list[Pokemon], opponents: list[Pokemon], time_budget: float=30,
+                  seed: int=None) -> list[dict]:
+        """{party}の選出の候補を、相手のパーティ{opponents}に対する勝率の高い順に返す
+
+        Returns
+        ----------
+        list[dict]
+            'command': 選出するポケモンの番号 (先頭が先発)
+            'names': 選出するポケモンの名前
+            'n': 試行回数
+            'win_rate': 勝率
+            'ci': 勝率の95%信頼区間。下限の高い順に並べる
+        """
+        deadline = time.time() + time_budget
+        self.start()
+
+        arms = self.candidates(len(party))
+        wins, n, in_flight = [0]*len(arms), [0]*len(arms), [0]*len(arms)
+        active = set(range(len(arms)))
+        rng = random.Random(seed)
+        futures = {}
+
+        while (remaining := deadline - time.time()) > 0:
+            # ワーカーが空かないように、試行回数の少ない候補から投入する
+            while len(futures) < 2*self.max_workers:
+                arm = min(active, key=lambda a: n[a] + in_flight[a])
+                seeds = [rng.randrange(2**31) for _ in range(self.batch_size)]
+                future = self.pool.submit(rollouts, self.battle_class, [party[i] for i in arms[arm]],
+                                          opponents, seeds, self.max_turn, deadline)
+                futures[future] = arm
+                in_flight[arm] += self.batch_size
+
+            done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                arm = futures.pop(future)
+                in_flight[arm] -= self.batch_size
+                try:
+                    results = future.result()
+                except Exception as e:
+                    warnings.warn(f'選出の評価に失敗しました {e}')
+                    continue
+                wins[arm] += sum(results)
+                n[arm] += len(results)
+
+            # 信頼区間により明らかに劣る候補を打ち切る
+            if len(active) > 1 and min(n[a] for a in active) >= self.min_rollouts:
+                best_lower = max(wilson_interval(wins[a], n[a])[0] for a in active)
+                active = {a for a in active if wilson_interval(wins[a], n[a])[1] >= best_lower}
+
+        for future in futures:
+            future.cancel()
+
+        result = []
+        for arm, command in enumerate(arms):
+            result.append({
+                'command': command,
+                'names': [party[i].name for i in command],
+                'n': n[arm],
+                'win_rate': wins[arm]/n[arm] if n[arm] else 0.,
+                'ci': wilson_interval(wins[arm], n[arm]),
+            })
+        return sorted(result, key=lambda r: (-r['ci'][0], -r['win_rate'], -r['n']))
+
+    def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
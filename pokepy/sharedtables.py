@@ -0,0 +1,171 @@
+from pokepy.pokemon import *
+from pokepy.stattable import StatTable
+from pokepy.gamedata import GameData
+from concurrent.futures import ProcessPoolExecutor
+import gc
+import hashlib
+import json
+import numpy as np
+import os
+import pickle
+import threading
+import time
+
+
+class SharedTables:
+    """ワーカープロセスが起動時に読み込む静的データを、プロセス間で共有するファイルとして書き出すクラス
+
+    図鑑の種族値と性格補正を1つのファイルに書き出し、各プロセスはnp.memmapで読み取り専用に開く。
+    ワーカーのStatTableはこの配列と、マニフェストに記録したStatTableのファイルから作成するため、
+    図鑑から表を作り直さず、ステータスの表は全プロセスでOSのページキャッシュ上の1つのコピーを共有する。
+    spawnで起動したワーカーのために、GameDataの表をpickleしたスナップショットも書き出す。
+    ファイルは内容のハッシュをファイル名にして log/cache に保存し、同じデータなら再利用する。
+
+    対戦シミュレーション (Battle) はGameDataの辞書を参照するため、その分のメモリは共有されない。
+    forkで起動したワーカーは親プロセスのGameDataを引き継ぐが、参照カウントの更新で書き込まれたページはプロセスごとにコピーされる。
+
+    species.base    (ポケモン, 能力) の種族値
+    nature          (性格, 能力) の性格補正
+
+        tables = SharedTables.get()
+        tables.array('species.base')[tables.id('species', 'カイリュー')]
+        StatTable(shared=tables).status('カイリュー', 'いじっぱり', [4, 252, 0, 0, 0, 252])
+    """
+
+    CACHE_DIR = 'log/cache'
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def get():
+        """有効なGameDataの共有テーブルを返す。初回のみ書き出しまたは読み込みを行う"""
+        with SharedTables._lock:
+            if SharedTables._instance is None or SharedTables._instance.season != Pokemon.season or \
+                SharedTables._instance.n_species != len(Pokemon.zukan):
+                SharedTables._instance = SharedTables.attach(SharedTables.export())
+            return SharedTables._instance
+
+    def export(cache_dir: str=None) -> str:
+        """有効なGameDataの表をファイルに書き出し、マニフェストのファイル名を返す。同じ内容のファイルがあれば再利用する"""
+        names = {
+            'species': list(Pokemon.zukan.keys()),
+            'natures': list(Pokemon.nature_corrections.keys()),
+        }
+        arrays = {
+            'species.base': np.array([Pokemon.zukan[name]['base'] for name in names['species']], dtype=np.int16),
+            'nature': np.array([Pokemon.nature_corrections[n][:6] for n in names['natures']], dtype=np.float32),
+        }
+
+        # 配列を8バイト境界に揃えて1つのバッファに並べる
+        layout, offset = {}, 0
+        for key, value in arrays.items():
+            layout[key] = {'dtype': value.dtype.str, 'shape': list(value.shape), 'offset': offset}
+            offset += -(-value.nbytes // 8) * 8
+        buffer = bytearray(offset)
+        for key, value in arrays.items():
+            start = layout[key]['offset']
+            buffer[start:start + value.nbytes] = np.ascontiguousarray(value).tobytes()
+
+        manifest = {'season': Pokemon.season, 'names': names, 'layout': layout,
+                    'stat_table': StatTable.get().filename}
+        # GameDataのスナップショット。JSONを解析し直すより速く読み込める
+        snapshot = pickle.dumps(Pokemon.data.tables()) if Pokemon.data is not None else b''
+        key = hashlib.md5(bytes(buffer) + json.dumps(manifest, ensure_ascii=False).encode('utf-8') + snapshot).hexdigest()[:16]
+        directory = cache_dir or SharedTables.CACHE_DIR
+        filename = os.path.join(directory, f'tables_{key}.json')
+        if os.path.isfile(filename):
+            return filename
+
+        os.makedirs(directory, exist_ok=True)
+        manifest['data'] = f'tables_{key}.bin'
+        manifest['game_data'] = f'tables_{key}.pkl' if snapshot else None
+        files = [(manifest['data'], bytes(buffer))]
+        if snapshot:
+            files.append((manifest['game_data'], snapshot))
+        # マニフェストを最後に書き出し、完成したファイルの目印とする
+        files.append((os.path.basename(filename), json.dumps(manifest, ensure_ascii=False).encode('utf-8')))
+        for name, content in files:
+            path = os.path.join(directory, name)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as fout:
+                fout.write(content)
+            os.replace(tmp, path)
+        return filename
+
+    def attach(filename: str):
+        """マニフェスト{filename}の表を読み取り専用のメモリマップとして開く"""
+        tables = SharedTables.__new__(SharedTables)
+        with open(filename, encoding='utf-8') as fin:
+            manifest = json.load(fin)
+        tables.manifest = filename
+        tables.season = manifest['season']
+        tables.names = manifest['names']
+        tables.n_species = len(tables.names['species'])
+        tables.ids = {key: {s: i for i, s in enumerate(values)} for key, values in tables.names.items()}
+        tables.stat_table_file = manifest['stat_table']
+        tables.game_data_file = manifest.get('game_data') and os.path.join(os.path.dirname(filename), manifest['game_data'])
+
+        buffer = np.memmap(os.path.join(os.path.dirname(filename), manifest['data']), dtype=np.uint8, mode='r')
+        tables.arrays = {}
+        for key, spec in manifest['layout'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            tables.arrays[key] = np.frombuffer(buffer, dtype=dtype, count=count, offset=spec['offset']).reshape(spec['shape'])
+        return tables
+
+    def game_data(self):
+        """書き出したGameDataのスナップショットを読み込む。なければNone"""
+        if not self.game_data_file or not os.path.isfile(self.game_data_file):
+            return None
+        with open(self.game_data_file, 'rb') as fin:
+            return GameData.from_tables(pickle.load(fin))
+
+    def array(self, key: str) -> np.ndarray:
+        return self.arrays[key]
+
+    def id(self, kind: str, name: str) -> int:
+        """{kind} ('species', 'natures') の中での{name}の番号"""
+        return self.ids[kind][name]
+
+
+def init_worker(season: int=None, manifest: str=None) -> None:
+    """ワーカープロセスの初期化
+
+    forkで起動したワーカーは親プロセスのGameDataをそのまま参照できるため、Pokemon.init()を省略する。
+    spawnで起動した場合は、{manifest}のGameDataのスナップショットを読み込む (JSONの解析より一桁速い)。
+    スナップショットがない場合や、異なるシーズンを指定した場合のみPokemon.init()を呼ぶ。
+    """
+    tables = None
+    if manifest is not None and (SharedTables._instance is None or SharedTables._instance.manifest != manifest):
+        tables = SharedTables.attach(manifest)
+
+    if Pokemon.data is None or (season is not None and Pokemon.season != season):
+        if tables is not None and season in [None, tables.season] and (data := tables.game_data()) is not None:
+            Pokemon.use(data)
+        else:
+            Pokemon.init(season)
+
+    if tables is not None and tables.season == Pokemon.season:
+        SharedTables._instance = tables
+        # ステータスの表は親プロセスが書き出したファイルを開く
+        if StatTable._instance is None or StatTable._instance.filename != tables.stat_table_file:
+            StatTable._instance = StatTable(shared=tables)
+
+
+def worker_pool(max_workers: int=None, season: int=None, mp_context=None) -> ProcessPoolExecutor:
+    """静的データを引き継ぐワーカープロセスのプールを作成し、ワーカーを起動する
+        親プロセスでPokemon.init()を済ませておけば、ワーカーはデータファイルを読み込まずに起動する
+    """
+    manifest = SharedTables.get().manifest if Pokemon.data is not None else None
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                               initializer=init_worker, initargs=(season, manifest))
+
+    # fork の間だけ親プロセスのオブジェクトをGCの対象外にし、ワーカーのGCがそれらのページに書き込まないようにする。
+    # 親プロセスでは直後に元に戻し、その後に不要になった循環参照も回収されるようにする
+    gc.collect()
+    gc.freeze()
+    try:
+        pool.submit(time.sleep, 0)  # ワーカーを起動する
+    finally:
+        gc.unfreeze()
+    return pool
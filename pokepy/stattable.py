@@ -0,0 +1,149 @@
+from pokepy.pokemon import *
+import hashlib
+import numpy as np
+import os
+import threading
+
+
+EFFORTS = np.arange(0, 253, 4)  # 努力値 (0, 4, ..., 252)
+MODIFIERS = (0.9, 1.0, 1.1)     # 性格補正
+
+
+def compute_status(base: np.ndarray, efforts: np.ndarray, modifiers: np.ndarray, level: int=50,
+                   indivs: np.ndarray=31) -> np.ndarray:
+    """種族値{base}、努力値{efforts}、性格補正{modifiers}からステータスを計算する
+        引数は末尾の次元を能力 [H,A,B,C,D,S] とする配列で、ブロードキャストできればよい
+    """
+    x = (np.asarray(base)*2 + indivs + np.asarray(efforts)//4)*level//100
+    status = np.floor((x + 5)*np.asarray(modifiers, dtype=float)).astype(np.int32)
+    status[..., 0] = (x + level + 10)[..., 0]
+    return status
+
+
+class StatTable:
+    """全ポケモンのステータスを事前に計算した表
+
+    table[ポケモン, レベル, 能力, 性格補正, 努力値/4] にステータス (個体値31) を格納する。
+    性格は能力ごとの補正 (0.9, 1.0, 1.1) に分解して持つため、25の性格すべてを展開した表と同じ値を引ける。
+    表は図鑑の種族値とレベルから決まるハッシュをファイル名にして log/cache に保存し、
+    2回目以降はメモリマップで読み込む。ワーカープロセスでは共有テーブル (SharedTables) の配列から作成する。
+
+        table = StatTable.get()
+        table.status('カイリュー', 'いじっぱり', [4, 252, 0, 0, 0, 252])
+        table.statuses(names, natures, efforts)     # 配列でまとめて引く
+        table.verify()                              # Pokemon.update_status()と照合する
+    """
+
+    LEVELS = (50, 80, 100)
+    CACHE_DIR = 'log/cache'
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def get():
+        """共有の表を返す。初回のみ作成または読み込みを行う"""
+        with StatTable._lock:
+            if StatTable._instance is None or len(StatTable._instance.species) != len(Pokemon.zukan):
+                StatTable._instance = StatTable()
+            return StatTable._instance
+
+    def __init__(self, cache_dir: str=None, shared=None):
+        """{shared}に共有テーブル (SharedTables) を指定すると、図鑑と性格補正をその配列から読み、
+            マニフェストに記録された表のファイルを開く
+        """
+        if shared is None:
+            self.species = list(Pokemon.zukan.keys())
+            self.natures = list(Pokemon.nature_corrections.keys())
+            self.base = np.array([Pokemon.zukan[name]['base'] for name in self.species], dtype=np.int32)
+            corrections = [Pokemon.nature_corrections[nature][:6] for nature in self.natures]
+        else:
+            self.species = shared.names['species']
+            self.natures = shared.names['natures']
+            self.base = shared.array('species.base').astype(np.int32)
+            corrections = shared.array('nature').tolist()
+        self.species_id = {name: i for i, name in enumerate(self.species)}
+        self.nature_id = {nature: i for i, nature in enumerate(self.natures)}
+        self.level_id = {level: i for i, level in enumerate(StatTable.LEVELS)}
+
+        # 性格ごとの、能力ごとの補正の番号
+        self.nature_modifier = np.array(
+            [[MODIFIERS.index(round(r, 1)) for r in row] for row in corrections], dtype=np.int8)
+        self.nature_modifier[:, 0] = 1
+
+        if shared is None:
+            key = hashlib.md5(self.base.tobytes() + repr(StatTable.LEVELS).encode()).hexdigest()[:16]
+            filename = os.path.join(cache_dir or StatTable.CACHE_DIR, f'stat_table_{key}.npy')
+        else:
+            filename = shared.stat_table_file
+        self.filename = filename
+
+        if os.path.isfile(filename):
+            self.table = np.load(filename, mmap_mode='r')
+        else:
+            self.table = self.build()
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            tmp = f'{filename[:-4]}.{os.getpid()}.tmp.npy'
+            np.save(tmp, self.table)
+            os.replace(tmp, filename)
+            self.table = np.load(filename, mmap_mode='r')
+
+    def build(self) -> np.ndarray:
+        """表を計算する"""
+        table = np.zeros((len(self.species), len(StatTable.LEVELS), 6, len(MODIFIERS), len(EFFORTS)), dtype=np.int16)
+        for i, level in enumerate(StatTable.LEVELS):
+            # (ポケモン, 性格補正, 努力値, 能力) で計算して並べ替える
+            status = compute_status(self.base[:, None, None, :], EFFORTS[None, None, :, None],
+                                    np.array(MODIFIERS)[None, :, None, None], level)
+            table[:, i] = status.transpose(0, 3, 1, 2)
+        return table
+
+    def index(self, name: str) -> int:
+        return self.species_id[name]
+
+    def status(self, name: str, nature: str, efforts: list[int], level: int=50) -> list[int]:
+        """ステータス [H,A,B,C,D,S] を返す"""
+        if level not in self.level_id:
+            return self.statuses([name], [nature], [efforts], level)[0].tolist()
+        table = self.table[self.species_id[name], self.level_id[level]]
+        modifier = self.nature_modifier[self.nature_id[nature]]
+        return [int(table[i, modifier[i], efforts[i]//4]) for i in range(6)]
+
+    def statuses(self, names, natures, efforts, level: int=50) -> np.ndarray:
+        """ポケモン、性格、努力値の配列からステータスの配列 (N, 6) をまとめて引く
+            {names}と{natures}は名前またはIDの配列、{efforts}は (N, 6) の配列
+        """
+        species = np.array([self.species_id[n] for n in names] if len(names) and type(names[0]) == str else names)
+        nature = np.array([self.nature_id[n] for n in natures] if len(natures) and type(natures[0]) == str else natures)
+        efforts = np.asarray(efforts)
+
+        if level not in self.level_id:
+            return compute_status(self.base[species], efforts, np.array(MODIFIERS)[self.nature_modifier[nature]], level)
+
+        stat = np.arange(6)[None, :]
+        return np.asarray(self.table[species[:, None], self.level_id[level], stat,
+                                     self.nature_modifier[nature], efforts//4]).astype(np.int32)
+
+    def stat_by_effort(self, name: str, nature: str, index: int, level: int=50) -> np.ndarray:
+        """能力{index}の、努力値 (0, 4, ..., 252) ごとのステータスの配列"""
+        modifier = self.nature_modifier[self.nature_id[nature], index]
+        if level not in self.level_id:
+            return compute_status(self.base[self.species_id[name]], EFFORTS[:, None], MODIFIERS[modifier], level)[:, index]
+        return np.asarray(self.table[self.species_id[name], self.level_id[level], index, modifier])
+
+    def verify(self, efforts: list[list[int]]=None) -> list[tuple]:
+        """全てのポケモンと性格について、Pokemon.calculate_status()の結果をPokemon.update_status()と比較する
+            一致しなかった (ポケモン名, 性格, 努力値, 表の値, 計算値) のリストを返す
+        """
+        efforts = efforts or [[0]*6, [252]*6, [4, 252, 0, 0, 0, 252], [252, 0, 4, 0, 252, 0]]
+        mismatches = []
+        for name in self.species:
+            p = Pokemon(name, use_template=False)
+            for nature in self.natures:
+                p.nature = nature
+                for effort in efforts:
+                    p.effort = list(effort)
+                    p.update_status()
+                    status = Pokemon.calculate_status(name, nature, list(effort))
+                    if status != p.status:
+                        mismatches.append((name, nature, list(effort), status, list(p.status)))
+        return mismatches
@@ -0,0 +1,213 @@
+from pokepy.pokemon import *
+from pokepy.sharedtables import worker_pool
+import hashlib
+import json
+import numpy as np
+import os
+
+
+N_MOVES = 4     # ポケモンごとに評価する技の数
+
+
+def party_key(party: list[Pokemon]) -> str:
+    """パーティの型 (ポケモン、性格、努力値、特性、アイテム、テラスタイプ、技) から決まるハッシュ"""
+    data = [[p.name, p.level, p.nature, p.indiv, p.effort, p.org_ability, p.item, p.Ttype, p.moves[:N_MOVES]]
+            for p in party]
+    return hashlib.md5(json.dumps(data, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def sample_opponent_sets(name: str, n: int, rng) -> list[dict]:
+    """{name}の型を使用率に従って{n}個抽選する。努力値は性格から決まる典型的な配分とする"""
+    sets = []
+    for _ in range(n):
+        pokemon_set = Pokemon.sample_set(name, rng)
+        pokemon_set['effort'] = Pokemon.sample_effort(name, pokemon_set['nature'])
+        sets.append(pokemon_set)
+    return sets
+
+
+def move_damages(battle: Battle, player: int, move: str, n_hit: int=5) -> tuple:
+    """{player}が{move}を使ったときの (最小ダメージ割合, 最大ダメージ割合, 確1の確率, 確2の確率) を返す
+        ダメージ割合は相手の最大HPに対する値。ダメージがない技なら (nan, nan, 0, 0)
+    """
+    rolls = []
+    for _ in range(battle.num_hits(player, move, n=n_hit)):
+        if not (damages := battle.oneshot_damages(player, move)):
+            return np.nan, np.nan, 0., 0.
+        rolls.append(np.bincount(damages) / len(damages))
+
+    # ヒットごとの乱数の分布を畳み込んで、1回と2回の合計ダメージの分布を求める
+    one = np.ones(1)
+    for hist in rolls:
+        one = np.convolve(one, hist)
+    two = np.convolve(one, one)
+
+    defender = battle.pokemon[not player]
+    support = np.nonzero(one)[0]
+    return support[0]/defender.status[0], support[-1]/defender.status[0], \
+        float(one[defender.hp:].sum()), float(two[defender.hp:].sum())
+
+
+def matchup(me: Pokemon, opponent: Pokemon) -> tuple[np.ndarray, np.ndarray, int]:
+    """{me}と{opponent}の対面を評価する
+
+    Returns
+    ----------
+    damage: np.ndarray
+        (2, N_MOVES, 2) 。[0: 自分の攻撃, 1: 相手の攻撃][技][最小, 最大] のダメージ割合。
+    ko: np.ndarray
+        (2, N_MOVES, 2) 。[0: 自分の攻撃, 1: 相手の攻撃][技][確1, 確2] の確率。
+    speed: int
+        自分が速ければ1、同速なら0、遅ければ-1。
+    """
+    battle = Battle()
+    battle.pokemon = [deepcopy(me), deepcopy(opponent)]
+
+    damage = np.full((2, N_MOVES, 2), np.nan, dtype=np.float32)
+    ko = np.zeros((2, N_MOVES, 2), dtype=np.float32)
+    for player in range(2):
+        for k, move in enumerate(battle.pokemon[player].moves[:N_MOVES]):
+            low, high, p1, p2 = move_damages(battle, player, move)
+            damage[player, k], ko[player, k] = (low, high), (p1, p2)
+
+    speed = int(np.sign(battle.eff_speed(0) - battle.eff_speed(1)))
+    return damage, ko, speed
+
+
+def threat_row(party: list[Pokemon], name: str, sets: list[dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """パーティ全員と、相手のポケモン{name}の型{sets}との対面を評価する。ワーカープロセスで実行する"""
+    damage = np.zeros((len(party), len(sets), 2, N_MOVES, 2), dtype=np.float32)
+    ko = np.zeros_like(damage)
+    speed = np.zeros((len(party), len(sets)), dtype=np.int8)
+
+    for k, pokemon_set in enumerate(sets):
+        opponent = Pokemon(name, use_template=False)
+        opponent.apply_set(pokemon_set)
+        opponent.effort = pokemon_set['effort']
+        for i, me in enumerate(party):
+            damage[i, k], ko[i, k], speed[i, k] = matchup(me, opponent)
+
+    return damage, ko, speed
+
+
+class ThreatMatrix:
+    """パーティと、使用率上位のポケモンとの対面の評価表
+
+    相手のポケモンごとに使用率に従って型を抽選し、自分のポケモンと相手の型の全ての組み合わせについて、
+    互いの技のダメージ範囲、確1・確2の確率、素早さの比較を格納する。
+    計算は相手のポケモンごとにワーカープロセスで並列に行い、結果はシーズン、統計データのファイルのサイズと更新時刻、
+    パーティのハッシュをキーにして log/cache に保存する。同じ条件の2回目以降はファイルを読み込むだけで済む。
+
+    damage[方向, 自分, 相手, 型, 技, (最小, 最大)]   方向は 0: 自分の攻撃, 1: 相手の攻撃。相手の最大HPに対する割合
+    ko[方向, 自分, 相手, 型, 技, (確1, 確2)]         確率
+    speed[自分, 相手, 型]                            自分が速ければ1、同速なら0、遅ければ-1
+
+        matrix = ThreatMatrix.get(party, top_n=30)
+        matrix.threats(0)       # 自分のポケモン0を確1にしやすい相手
+    """
+
+    CACHE_DIR = 'log/cache'
+
+    def __init__(self, party: list[Pokemon], top_n: int=30, n_sets: int=8, seed: int=0):
+        self.party = [p.name for p in party]
+        self.moves = [p.moves[:N_MOVES] for p in party]
+        self.species = list(Pokemon.home.keys())[:top_n]
+        rng = random.Random(seed)
+        self.sets = [sample_opponent_sets(name, n_sets, rng) for name in self.species]
+
+        shape = (2, len(party), len(self.species), n_sets, N_MOVES, 2)
+        self.damage = np.full(shape, np.nan, dtype=np.float32)
+        self.ko = np.zeros(shape, dtype=np.float32)
+        self.speed = np.zeros(shape[1:4], dtype=np.int8)
+
+    def get(party: list[Pokemon], top_n: int=30, n_sets: int=8, seed: int=0,
+            max_workers: int=None, cache_dir: str=None):
+        """評価表を返す。保存されていなければ計算して保存する"""
+        key = f'{party_key(party)}_{top_n}_{n_sets}_{seed}'
+        # 統計データが更新されていれば計算し直す
+        source = f'battle_data/season{Pokemon.season}.json'
+        if os.path.isfile(source):
+            stat = os.stat(source)
+            key += f'_{stat.st_size}_{int(stat.st_mtime)}'
+        filename = os.path.join(cache_dir or ThreatMatrix.CACHE_DIR, f'threat_s{Pokemon.season}_{key}.npz')
+
+        if os.path.isfile(filename):
+            return ThreatMatrix.load(filename)
+
+        matrix = ThreatMatrix(party, top_n, n_sets, seed)
+        matrix.compute(party, max_workers)
+        matrix.save(filename)
+        return matrix
+
+    def compute(self, party: list[Pokemon], max_workers: int=None) -> None:
+        """全ての対面を評価する。{max_workers}=1なら現在のプロセスで計算する"""
+        parties = [party]*len(self.species)
+        if max_workers == 1:
+            rows = map(threat_row, parties, self.species, self.sets)
+        else:
+            pool = worker_pool(max_workers, Pokemon.season)
+            rows = pool.map(threat_row, parties, self.species, self.sets)
+
+        for j, (damage, ko, speed) in enumerate(rows):
+            self.damage[:, :, j] = damage.transpose(2, 0, 1, 3, 4)
+            self.ko[:, :, j] = ko.transpose(2, 0, 1, 3, 4)
+            self.speed[:, j] = speed
+
+        if max_workers != 1:
+            pool.shutdown()
+
+    def save(self, filename: str) -> None:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        meta = json.dumps({'party': self.party, 'moves': self.moves, 'species': self.species, 'sets': self.sets},
+                          ensure_ascii=False)
+        tmp = f'{filename[:-4]}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, damage=self.damage, ko=self.ko, speed=self.speed, meta=np.array(meta))
+        os.replace(tmp, filename)
+
+    def load(filename: str):
+        matrix = ThreatMatrix.__new__(ThreatMatrix)
+        with np.load(filename) as npz:
+            matrix.__dict__ |= json.loads(str(npz['meta']))
+            matrix.damage, matrix.ko, matrix.speed = npz['damage'], npz['ko'], npz['speed']
+        return matrix
+
+    def ohko(self, i: int, j: int, attack: bool=True) -> float:
+        """自分のポケモン{i}が相手のポケモン{j}を (attack=Falseなら相手が自分を) 最も確1の確率が高い技で倒す確率
+            相手の型について平均する
+        """
+        return float(self.ko[0 if attack else 1, i, j, :, :, 0].max(axis=-1).mean())
+
+    def twohko(self, i: int, j: int, attack: bool=True) -> float:
+        """確2の確率。ohko()と同様"""
+        return float(self.ko[0 if attack else 1, i, j, :, :, 1].max(axis=-1).mean())
+
+    def faster(self, i: int, j: int) -> float:
+        """自分のポケモン{i}が相手のポケモン{j}より速い型の割合"""
+        return float((self.speed[i, j] > 0).mean())
+
+    def best_move(self, i: int, j: int) -> str:
+        """自分のポケモン{i}が相手のポケモン{j}に対して、最大ダメージの平均が最も大きい技"""
+        damage = np.nan_to_num(self.damage[0, i, j, :, :, 1]).mean(axis=0)
+        return self.moves[i][int(np.argmax(damage[:len(self.moves[i])]))]
+
+    def threats(self, i: int, n: int=10) -> list[tuple]:
+        """自分のポケモン{i}を確1にしやすい相手のポケモンを、(ポケモン名, 確1の確率, 相手が速い割合) で返す"""
+        result = [(name, self.ohko(i, j, attack=False), float((self.speed[i, j] < 0).mean()))
+                  for j, name in enumerate(self.species)]
+        return sorted(result, key=lambda x: -x[1])[:n]
+
+    def summary(self) -> list[dict]:
+        """相手のポケモンごとに、パーティ全体での対面の有利不利を集計する
+            'answers': 確1をとれて先手をとれる自分のポケモン
+            'checked_by': 確1にされて後手になる自分のポケモン
+        """
+        result = []
+        for j, name in enumerate(self.species):
+            answers, checked_by = [], []
+            for i, me in enumerate(self.party):
+                if self.ohko(i, j) >= 0.5 and self.faster(i, j) >= 0.5:
+                    answers.append(me)
+                if self.ohko(i, j, attack=False) >= 0.5 and self.faster(i, j) < 0.5:
+                    checked_by.append(me)
+            result.append({'name': name, 'answers': answers, 'checked_by': checked_by})
+        return result